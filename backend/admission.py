@@ -0,0 +1,161 @@
+"""
+Admission control for CPU-bound voice analysis.
+
+At most ANALYSIS_CONCURRENCY analyses run at once in this process; the
+rest wait in priority lanes, and a freed slot always goes to the oldest
+waiter of the most urgent lane:
+
+    interactive  single submissions a user is waiting on
+    batch        /api/exercises/batch clips
+
+Bulk re-analysis (reanalyze.py) runs as a separate process and can't
+share these slots; it limits itself with REANALYZE_WORKERS and a lower
+CPU priority instead.
+
+The wait queue is bounded by ANALYSIS_QUEUE_DEPTH. Lower lanes may only
+fill part of it (LANE_QUEUE_SHARE), so a batch burst leaves room for
+interactive submissions. When a lane's share is full the request is
+refused at once with 429 and a Retry-After estimated from recent
+analysis times; a request that waits longer than ANALYSIS_QUEUE_TIMEOUT
+gets 503. Endpoints call check() before accepting an upload so a full
+queue costs the client nothing but the request. A batch is checked once;
+its clips then queue at most `concurrency` at a time, so a large batch
+doesn't use up its lane's share by itself.
+
+Configuration:
+    ANALYSIS_CONCURRENCY=<ANALYSIS_WORKERS>
+    ANALYSIS_QUEUE_DEPTH=<4 x concurrency>
+    ANALYSIS_QUEUE_TIMEOUT=30
+"""
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from analysis_pool import ANALYSIS_WORKERS
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "0")) or ANALYSIS_WORKERS
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("ANALYSIS_QUEUE_DEPTH", "0")) or 4 * ANALYSIS_CONCURRENCY
+ANALYSIS_QUEUE_TIMEOUT = float(os.getenv("ANALYSIS_QUEUE_TIMEOUT", "30"))
+
+# Lane -> priority (lower runs first)
+LANES = {"interactive": 0, "batch": 1}
+# Fraction of the queue each lane may fill
+LANE_QUEUE_SHARE = {"interactive": 1.0, "batch": 0.75}
+
+ANALYSIS_QUEUED = Gauge(
+    "analysis_queue_depth", "Analyses waiting for a slot by lane",
+    ["lane"]
+)
+ANALYSIS_RUNNING = Gauge(
+    "analysis_running", "Analyses currently holding a slot"
+)
+ANALYSIS_QUEUE_WAIT_SECONDS = Histogram(
+    "analysis_queue_wait_seconds", "Time spent waiting for an analysis slot by lane",
+    ["lane"]
+)
+ANALYSIS_REJECTED = Counter(
+    "analysis_admission_rejected_total", "Analyses refused by admission control by lane and reason",
+    ["lane", "reason"]
+)
+
+
+class AnalysisScheduler:
+    """Bounded-concurrency priority scheduler; use from the event loop only"""
+
+    def __init__(self, concurrency=ANALYSIS_CONCURRENCY, queue_depth=ANALYSIS_QUEUE_DEPTH,
+                 queue_timeout=ANALYSIS_QUEUE_TIMEOUT):
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self._waiters = []          # heap of (priority, seq, future)
+        self._queued = {lane: 0 for lane in LANES}
+        self._seq = itertools.count()
+        # Moving average of slot hold time, for Retry-After
+        self._service_seconds = 2.0
+
+    def queued(self):
+        return sum(self._queued.values())
+
+    def retry_after(self):
+        """Seconds until a new request would likely be admitted"""
+        backlog = self.queued() + 1
+        return max(1, math.ceil(self._service_seconds * backlog / self.concurrency))
+
+    def _reject(self, lane, reason, status_code, detail):
+        ANALYSIS_REJECTED.inc(lane=lane, reason=reason)
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(self.retry_after())})
+
+    def check(self, lane):
+        """Raise 429 if the lane couldn't queue right now (call before accepting the upload)"""
+        if self.running < self.concurrency and not self._waiters:
+            return
+        if self.queued() >= int(self.queue_depth * LANE_QUEUE_SHARE[lane]):
+            self._reject(lane, "queue_full", 429, "Server is busy analyzing other recordings; please retry shortly")
+
+    async def _acquire(self, lane):
+        if self.running < self.concurrency and not self._waiters:
+            self.running += 1
+            ANALYSIS_QUEUE_WAIT_SECONDS.observe(0.0, lane=lane)
+            return
+
+        self.check(lane)
+        future = asyncio.get_running_loop().create_future()
+        entry = (LANES[lane], next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        self._queued[lane] += 1
+        ANALYSIS_QUEUED.inc(lane=lane)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over as we gave up; pass it on
+                self._release()
+            else:
+                future.cancel()
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(lane, "timeout", 503, "Timed out waiting for an analysis slot; please retry shortly")
+        finally:
+            self._queued[lane] -= 1
+            ANALYSIS_QUEUED.dec(lane=lane)
+            ANALYSIS_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started, lane=lane)
+
+    def _release(self):
+        # Hand the slot straight to the next waiter so it can't be taken out of order
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self, lane="interactive"):
+        """Hold one analysis slot for the duration of the block"""
+        await self._acquire(lane)
+        ANALYSIS_RUNNING.inc()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * (time.perf_counter() - started)
+            ANALYSIS_RUNNING.dec()
+            self._release()
+
+
+analysis_scheduler = AnalysisScheduler()
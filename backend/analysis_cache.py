@@ -0,0 +1,171 @@
+"""
+Persistent cache of transcript-independent voice analysis results.
+
+VoiceAnalyzer.analyze_acoustics (spectral features, pauses, sibilant
+spectrum, pitch, formants, voice quality) is the expensive part of
+analysis and depends only on the audio. Results are stored in a small
+SQLite file keyed on the SHA-256 of the decoded samples, the analysis
+profile and ANALYZER_VERSION, so retries, duplicate uploads and the same clip sent to
+/api/exercises/analyze and then /api/exercise/submit only pay for
+decoding and the cheap transcript-dependent step.
+
+The cache is bounded by entry count and total payload size and evicts
+least recently used entries. It is safe to share between threads and
+between analysis pool processes.
+
+Configuration:
+    ANALYSIS_CACHE=1                     enable/disable
+    ANALYSIS_CACHE_PATH=analysis_cache.db
+    ANALYSIS_CACHE_MAX_ENTRIES=10000
+    ANALYSIS_CACHE_MAX_MB=256
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE = os.getenv("ANALYSIS_CACHE", "1").lower() in ("1", "true", "yes")
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.db")
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "10000"))
+ANALYSIS_CACHE_MAX_MB = float(os.getenv("ANALYSIS_CACHE_MAX_MB", "256"))
+
+CACHE_REQUESTS = Counter(
+    "analysis_cache_requests_total", "Analysis cache lookups by outcome",
+    ["outcome"]
+)
+
+# Evict a little below the limits so a full cache doesn't evict on every insert
+_EVICT_TO = 0.9
+# Inserts between full recounts; in between, this process's own inserts are added to
+# the last count, and other pool processes' inserts are picked up at the next recount
+_RECOUNT_EVERY = 100
+
+
+class AnalysisCache:
+    def __init__(self, path=ANALYSIS_CACHE_PATH, max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+                 max_bytes=int(ANALYSIS_CACHE_MAX_MB * 1024 * 1024), version=None):
+        if version is None:
+            from voice_analysis import ANALYZER_VERSION
+            version = ANALYZER_VERSION
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = version
+        self._lock = threading.Lock()
+        # Estimated entries/bytes since the last recount (None forces one on the first insert)
+        self._count = self._bytes = None
+        self._inserts_since_count = 0
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_analysis_cache_last_access ON analysis_cache (last_access)")
+        # Entries from other analyzer versions can never be hit again
+        self._conn.execute("DELETE FROM analysis_cache WHERE version != ?", (version,))
+
+    def key_for(self, y, sr, *extra):
+        """Cache key for decoded samples at a sample rate, plus any extra key parts"""
+        digest = hashlib.sha256()
+        digest.update(str(sr).encode())
+        digest.update(y.tobytes())
+        for part in extra:
+            digest.update(str(part).encode())
+        return f"{self.version}:{digest.hexdigest()}"
+
+    def get(self, key):
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT payload FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE analysis_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"Analysis cache read failed: {e}")
+            CACHE_REQUESTS.inc(outcome="error")
+            return None
+        if row is None:
+            CACHE_REQUESTS.inc(outcome="miss")
+            return None
+        CACHE_REQUESTS.inc(outcome="hit")
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        payload = json.dumps(value)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, version, payload, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, self.version, payload, len(payload), time.time())
+                )
+                self._evict(len(payload))
+        except sqlite3.Error as e:
+            logger.warning(f"Analysis cache write failed: {e}")
+
+    def _evict(self, inserted_size):
+        """
+        Drop least recently used entries while over the entry or size limit.
+        The table is only recounted every _RECOUNT_EVERY inserts or when the
+        running estimate passes a limit, so writes don't slow down as the
+        cache grows.
+        """
+        self._inserts_since_count += 1
+        if self._count is not None:
+            # Overestimates on REPLACE, which only brings the next recount forward
+            self._count += 1
+            self._bytes += inserted_size
+            if (self._inserts_since_count < _RECOUNT_EVERY
+                    and self._count <= self.max_entries and self._bytes <= self.max_bytes):
+                return
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()
+        self._count, self._bytes, self._inserts_since_count = count, total, 0
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        target_count = int(self.max_entries * _EVICT_TO)
+        target_bytes = int(self.max_bytes * _EVICT_TO)
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM analysis_cache ORDER BY last_access"):
+            if count <= target_count and total <= target_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM analysis_cache WHERE key = ?", doomed)
+        self._count, self._bytes = count, total
+        logger.info(f"Evicted {len(doomed)} analysis cache entries")
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()
+        return {"entries": count, "bytes": total, "max_entries": self.max_entries, "max_bytes": self.max_bytes}
+
+
+_cache = None
+_cache_failed = False
+
+
+def get_analysis_cache():
+    """The process-wide cache, or None when disabled or unavailable"""
+    global _cache, _cache_failed
+    if _cache is None and ANALYSIS_CACHE and not _cache_failed:
+        try:
+            _cache = AnalysisCache()
+        except Exception as e:
+            _cache_failed = True
+            logger.warning(f"Analysis cache disabled: {e}")
+    return _cache
@@ -0,0 +1,75 @@
+"""
+Process pool for CPU-bound voice analysis.
+
+librosa/numpy analysis holds the GIL for most of its run time, so
+analyzing several clips at once only scales across processes. Each
+worker builds one VoiceAnalyzer when it starts and reuses it for every
+clip it is given.
+
+Pool size comes from ANALYSIS_WORKERS (default: number of CPUs).
+"""
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import observe_analyzer_stage
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+_analyzer = None
+
+
+def _init_worker():
+    global _analyzer
+    from voice_analysis import VoiceAnalyzer
+    from analysis_cache import get_analysis_cache
+    _analyzer = VoiceAnalyzer()
+    _analyzer.cache = get_analysis_cache()
+
+
+def analyze_clip(file_path, transcription, expected_text, profile=None, baseline=None):
+    """
+    Run analysis and diagnosis for one clip inside a pool worker.
+
+    Stage timings are returned rather than recorded, since metrics live in
+    the parent process.
+    """
+    stages = []
+    _analyzer.stage_hook = lambda stage, seconds: stages.append((stage, seconds))
+    try:
+        analysis = _analyzer.analyze_audio(file_path, transcription, profile=profile)
+        diagnosis = _analyzer.diagnose(analysis, transcription, expected_text=expected_text, baseline=baseline)
+    finally:
+        _analyzer.stage_hook = None
+    return analysis, diagnosis, stages
+
+
+def get_analysis_pool():
+    """Create the shared pool on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, initializer=_init_worker)
+        logger.info(f"Started analysis pool with {ANALYSIS_WORKERS} workers")
+    return _pool
+
+
+async def analyze_in_pool(file_path, transcription, expected_text, profile=None, baseline=None):
+    """Await analysis of one clip on the shared process pool"""
+    loop = asyncio.get_running_loop()
+    analysis, diagnosis, stages = await loop.run_in_executor(
+        get_analysis_pool(), analyze_clip, file_path, transcription, expected_text, profile, baseline
+    )
+    for stage, seconds in stages:
+        observe_analyzer_stage(stage, seconds)
+    return analysis, diagnosis
+
+
+def shutdown_analysis_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
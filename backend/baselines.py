@@ -0,0 +1,96 @@
+"""
+Per-user running statistics of the scored metrics.
+
+Each user_baselines row keeps, for every metric in BASELINE_METRICS, the
+sample count, mean and sum of squared deviations (Welford's online
+algorithm), plus the user's most recent scores. The row is updated as
+exercises are inserted, so diagnose can compare a submission with the
+user's own history (z-scores) and the LLM gets previous scores without a
+history query.
+
+Rows are derived data: rebuild_baselines recomputes them from
+exercise_features, which the schema migration does for existing
+databases and reanalyze.py does after rescoring.
+"""
+import os
+import math
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+
+logger = logging.getLogger(__name__)
+
+# exercise_features columns tracked per user
+BASELINE_METRICS = [
+    "score", "accuracy", "pause_ratio", "speech_rate", "pitch_variation",
+    "lisp_likelihood", "clarity_score", "breathiness_score",
+]
+BASELINE_RECENT_SCORES = int(os.getenv("BASELINE_RECENT_SCORES", "10"))
+# A metric needs this many samples before submissions are compared against it
+BASELINE_MIN_SAMPLES = int(os.getenv("BASELINE_MIN_SAMPLES", "5"))
+
+
+def welford_update(stats, metric, value):
+    """Fold one value into stats[metric] = [n, mean, m2]"""
+    n, mean, m2 = stats.get(metric, (0, 0.0, 0.0))
+    n += 1
+    delta = value - mean
+    mean += delta / n
+    m2 += delta * (value - mean)
+    stats[metric] = [n, mean, m2]
+
+
+def apply_exercise(stats, recent_scores, features):
+    """Fold one exercise's feature values into stats and the newest-first recent scores (in place)"""
+    for metric in BASELINE_METRICS:
+        value = features.get(metric)
+        if value is not None:
+            welford_update(stats, metric, float(value))
+    if features.get("score") is not None:
+        recent_scores.insert(0, float(features["score"]))
+        del recent_scores[BASELINE_RECENT_SCORES:]
+
+
+def baseline_snapshot(stats, min_samples=BASELINE_MIN_SAMPLES):
+    """{metric: {"n", "mean", "std"}} for metrics with enough samples to compare against"""
+    snapshot = {}
+    for metric, (n, mean, m2) in (stats or {}).items():
+        if n >= max(min_samples, 2):
+            snapshot[metric] = {"n": n, "mean": mean, "std": math.sqrt(m2 / (n - 1))}
+    return snapshot
+
+
+def rebuild_baselines(conn, metadata, user_ids=None):
+    """Recompute user_baselines rows from exercise_features (every user, or only user_ids)"""
+    features = metadata.tables["exercise_features"]
+    baselines = metadata.tables["user_baselines"]
+
+    query = select(
+        features.c.user_id, *[features.c[metric] for metric in BASELINE_METRICS]
+    ).where(features.c.user_id.is_not(None)).order_by(features.c.user_id, features.c.timestamp, features.c.id)
+    delete = baselines.delete()
+    if user_ids is not None:
+        query = query.where(features.c.user_id.in_(list(user_ids)))
+        delete = delete.where(baselines.c.user_id.in_(list(user_ids)))
+
+    rows = {}
+    for row in conn.execute(query):
+        stats, recent_scores, count = rows.setdefault(row.user_id, ({}, [], [0]))
+        apply_exercise(stats, recent_scores, row._mapping)
+        count[0] += 1
+
+    now = datetime.utcnow()
+    conn.execute(delete)
+    if rows:
+        conn.execute(baselines.insert(), [
+            {
+                "user_id": user_id,
+                "exercise_count": count[0],
+                "stats": stats,
+                "recent_scores": recent_scores,
+                "updated_at": now,
+            }
+            for user_id, (stats, recent_scores, count) in rows.items()
+        ])
+        logger.info(f"Rebuilt baselines for {len(rows)} users")
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+VoiceAnalyzer benchmark
+
+Runs VoiceAnalyzer.analyze_audio + diagnose over the bundled recordings
+(backend/audio_samples and audio_samples) and over synthetic clips of
+configurable length, timing every analysis stage and recording the peak
+Python-tracked memory of each stage.
+
+Usage:
+    python benchmark_analyzer.py                          # corpus + 5/30/120 s synthetic clips
+    python benchmark_analyzer.py --synthetic 10,300 --repeat 3 --output bench.json
+    python benchmark_analyzer.py --compare baseline.json  # exit 1 on regression
+
+Results are written as JSON. --compare checks the median time and peak
+memory of each stage against a stored baseline and flags anything slower
+or larger than --threshold (default 20%).
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from voice_analysis import VoiceAnalyzer  # noqa: E402
+from warmup import make_synthetic_clip  # noqa: E402
+
+DEFAULT_CORPUS = [BACKEND_DIR / "audio_samples", BACKEND_DIR.parent / "audio_samples"]
+DEFAULT_TEXT = "She sells seashells by the seashore"
+
+
+def collect_clips(corpus_dirs, synthetic_lengths, limit, tmp_dir):
+    clips = []
+    for directory in corpus_dirs:
+        directory = Path(directory)
+        if not directory.is_dir():
+            continue
+        for path in sorted(directory.glob("*.wav")):
+            clips.append({"name": f"{directory.name}/{path.name}", "path": str(path), "synthetic": False})
+    if limit:
+        clips = clips[:limit]
+
+    for seconds in synthetic_lengths:
+        path = Path(tmp_dir) / f"synthetic_{seconds:g}s.wav"
+        make_synthetic_clip(seconds, path)
+        clips.append({"name": path.name, "path": str(path), "synthetic": True})
+    return clips
+
+
+def benchmark_clip(analyzer, clip, text, track_memory):
+    """Analyze one clip, returning per-stage seconds and peak bytes"""
+    stages = {}
+
+    def record(stage, seconds):
+        peak = None
+        if track_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        stages[stage] = {"seconds": seconds, "peak_bytes": peak}
+
+    transcription = {"text": text, "words": []}
+    analyzer.stage_hook = record
+    if track_memory:
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    analysis = analyzer.analyze_audio(clip["path"], transcription)
+    with analyzer._stage("diagnose"):
+        analyzer.diagnose(analysis, transcription, expected_text=text)
+    total = time.perf_counter() - start
+    analyzer.stage_hook = None
+
+    return {
+        **clip,
+        "audio_seconds": analysis.get("duration"),
+        "failed": "error" in analysis,
+        "error": analysis.get("error"),
+        "total_seconds": total,
+        "realtime_factor": total / analysis["duration"] if analysis.get("duration") else None,
+        "stages": stages
+    }
+
+
+def summarize(results):
+    """Aggregate per-stage timing and memory across successful clips"""
+    per_stage = {}
+    for result in results:
+        if result["failed"]:
+            continue
+        for stage, values in result["stages"].items():
+            entry = per_stage.setdefault(stage, {"seconds": [], "peak_bytes": []})
+            entry["seconds"].append(values["seconds"])
+            if values["peak_bytes"] is not None:
+                entry["peak_bytes"].append(values["peak_bytes"])
+
+    summary = {}
+    for stage, values in per_stage.items():
+        seconds = sorted(values["seconds"])
+        summary[stage] = {
+            "runs": len(seconds),
+            "mean_seconds": statistics.mean(seconds),
+            "median_seconds": statistics.median(seconds),
+            "p95_seconds": seconds[min(len(seconds) - 1, int(round(0.95 * (len(seconds) - 1))))],
+            "max_peak_bytes": max(values["peak_bytes"]) if values["peak_bytes"] else None
+        }
+
+    totals = [r["total_seconds"] for r in results if not r["failed"]]
+    factors = [r["realtime_factor"] for r in results if not r["failed"] and r["realtime_factor"]]
+    return {
+        "clips": len(results),
+        "failed": sum(1 for r in results if r["failed"]),
+        "total_seconds": sum(totals),
+        "median_realtime_factor": statistics.median(factors) if factors else None,
+        "stages": summary
+    }
+
+
+def compare(current, baseline, threshold):
+    """Return a list of regression messages (empty when within threshold)"""
+    regressions = []
+    for stage, base in baseline["summary"]["stages"].items():
+        now = current["summary"]["stages"].get(stage)
+        if now is None:
+            continue
+        checks = [("median_seconds", "time"), ("max_peak_bytes", "memory")]
+        for key, label in checks:
+            old, new = base.get(key), now.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            status = "REGRESSION" if change > threshold else "ok"
+            print(f"  {stage:<18} {label:<7} {old:>14.4g} -> {new:<14.4g} {change:+7.1%}  {status}")
+            if change > threshold:
+                regressions.append(f"{stage} {label} {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VoiceAnalyzer stages")
+    parser.add_argument("--corpus", action="append", help="Directory of .wav clips (repeatable)")
+    parser.add_argument("--synthetic", default="5,30,120",
+                        help="Comma-separated synthetic clip lengths in seconds ('' for none)")
+    parser.add_argument("--limit", type=int, default=0, help="Max corpus clips to run (0 = all)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per clip")
+    parser.add_argument("--text", default=DEFAULT_TEXT, help="Transcript/expected text for every clip")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc peak-memory tracking")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown/growth ratio")
+    args = parser.parse_args()
+
+    synthetic_lengths = [float(s) for s in args.synthetic.split(",") if s.strip()]
+    track_memory = not args.no_memory
+    analyzer = VoiceAnalyzer()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clips = collect_clips(args.corpus or DEFAULT_CORPUS, synthetic_lengths, args.limit, tmp_dir)
+        if not clips:
+            print("No clips found")
+            return 1
+
+        # One untimed run so imports and numba JIT compilation don't count
+        analyzer.analyze_audio(clips[0]["path"], {"text": args.text, "words": []})
+
+        if track_memory:
+            tracemalloc.start()
+
+        results = []
+        for clip in clips:
+            for run in range(args.repeat):
+                result = benchmark_clip(analyzer, clip, args.text, track_memory)
+                result["run"] = run
+                results.append(result)
+                status = "FAILED" if result["failed"] else f"{result['total_seconds']:.3f}s"
+                print(f"{clip['name']:<70} {status}")
+
+        if track_memory:
+            tracemalloc.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "librosa": __import__("librosa").__version__,
+            "memory_tracked": track_memory,
+            "repeat": args.repeat
+        },
+        "summary": summarize(results),
+        "results": results
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nStage timings ({report['summary']['clips']} runs, {report['summary']['failed']} failed):")
+    for stage, values in report["summary"]["stages"].items():
+        peak = values["max_peak_bytes"]
+        peak_text = f"{peak / 1e6:8.1f} MB" if peak is not None else "       -"
+        print(f"  {stage:<18} median {values['median_seconds'] * 1000:9.1f} ms   p95 {values['p95_seconds'] * 1000:9.1f} ms   peak {peak_text}")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparing against {args.compare} (threshold {args.threshold:.0%}):")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
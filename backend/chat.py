@@ -0,0 +1,277 @@
+"""
+Server-side conversations for the chat assistant (/api/chat).
+
+Each conversation's turns are stored in chat_messages, so a client only
+sends its new message and the conversation_id. The prompt for a reply is
+the system prompt, the conversation's running summary and as many of the
+newest turns as fit in CHAT_CONTEXT_TOKENS (estimated, ~4 characters per
+token); older turns are left out. Once the turns not yet covered by the
+summary grow past CHAT_SUMMARIZE_TOKENS, a background task folds the
+oldest of them into the summary with a small model, so trimmed context
+is condensed rather than lost and the prompt stays bounded.
+
+Only CHAT_MAX_CONCURRENT_PER_CONVERSATION replies per conversation are
+generated at a time in this process; further messages get 429 until the
+current reply finishes.
+
+Configuration:
+    CHAT_CONTEXT_TOKENS=2000          (history budget per prompt, excluding the system prompt)
+    CHAT_SUMMARIZE_TOKENS=3000        (unsummarized history that triggers summarization)
+    CHAT_MAX_REPLY_TOKENS=300
+    CHAT_MAX_CONCURRENT_PER_CONVERSATION=1
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "2000"))
+CHAT_SUMMARIZE_TOKENS = int(os.getenv("CHAT_SUMMARIZE_TOKENS", "3000"))
+CHAT_MAX_REPLY_TOKENS = int(os.getenv("CHAT_MAX_REPLY_TOKENS", "300"))
+CHAT_MAX_CONCURRENT_PER_CONVERSATION = int(os.getenv("CHAT_MAX_CONCURRENT_PER_CONVERSATION", "1"))
+CHAT_MAX_MESSAGE_CHARS = 2000
+# Longest a reply can hold its conversation's slot
+CHAT_SLOT_SECONDS = 120
+
+CHAT_SYSTEM_PROMPT = """You are Whiskers, a friendly and knowledgeable AI cat assistant 🐱 specialized in speech therapy.
+You help users understand their speech concerns and guide them to the right exercises.
+
+Your personality:
+- Warm, encouraging, and supportive
+- Use occasional cat-related expressions (meow, purr-fect, etc.) but don't overdo it
+- Keep responses concise (2-4 sentences usually)
+- Be empathetic about speech difficulties
+- Provide practical, actionable advice
+
+You can help with:
+- Explaining different speech conditions (lisp, stuttering, articulation issues)
+- Recommending which exercises to try
+- Providing tips for speech improvement
+- Answering questions about speech therapy
+- Motivating and encouraging users
+
+Always remind users that while you can provide guidance, consulting with a professional speech therapist is important for personalized treatment."""
+
+CHAT_FALLBACK_MESSAGE = "Meow... 😿 I'm having a bit of trouble right now. Please try again in a moment!"
+CHAT_SUGGESTIONS = ["Try an exercise", "Learn more", "Track progress"]
+
+CHAT_PROMPT_TOKENS = Histogram(
+    "chat_prompt_tokens", "Estimated prompt size of chat completions",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+)
+CHAT_FIRST_TOKEN_SECONDS = Histogram(
+    "chat_time_to_first_token_seconds", "Time from request to the first reply token",
+    ["mode"]
+)
+CHAT_REJECTED = Counter(
+    "chat_rejected_total", "Chat messages rejected by the per-conversation concurrency limit"
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token, plus per-message overhead)"""
+    return len(text or "") // 4 + 4
+
+
+def build_chat_context(summary, turns, message, budget=CHAT_CONTEXT_TOKENS):
+    """
+    Chat completion messages for a new user message.
+
+    turns are the conversation's unsummarized (role, content) pairs,
+    oldest first. The newest turns that fit in budget are kept, along with
+    the summary; the new message is always included.
+    """
+    used = estimate_tokens(message)
+    kept = []
+    if summary:
+        used += estimate_tokens(summary)
+    for role, content in reversed(turns):
+        tokens = estimate_tokens(content)
+        if used + tokens > budget:
+            break
+        kept.append({"role": role, "content": content})
+        used += tokens
+    kept.reverse()
+
+    messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    messages.extend(kept)
+    messages.append({"role": "user", "content": message})
+    CHAT_PROMPT_TOKENS.observe(used + estimate_tokens(CHAT_SYSTEM_PROMPT))
+    return messages
+
+
+class ConversationStore:
+    """
+    chat_conversations/chat_messages access on the sync engine (call from
+    a worker thread), plus per-conversation reply slots and background
+    summarization on the running loop.
+
+    summarize(summary, turns) returns the new summary text and raises on
+    failure.
+    """
+
+    def __init__(self, engine, metadata, summarize):
+        self.engine = engine
+        self.conversations = metadata.tables["chat_conversations"]
+        self.messages = metadata.tables["chat_messages"]
+        self.summarize = summarize
+        self._in_flight = {}
+        self._summarizing = {}
+
+    def open(self, conversation_id=None, user_id=None):
+        """
+        (conversation_id, summary, unsummarized turns) for an existing
+        conversation, or a new one when conversation_id is None. Returns
+        None for an unknown conversation_id.
+        """
+        conversations, messages = self.conversations, self.messages
+        with self.engine.begin() as conn:
+            if conversation_id is None:
+                conversation_id = str(uuid.uuid4())
+                now = datetime.utcnow()
+                conn.execute(conversations.insert().values(
+                    conversation_id=conversation_id, user_id=user_id, summary=None,
+                    summarized_through=0, created_at=now, updated_at=now
+                ))
+                return conversation_id, None, []
+
+            conversation = conn.execute(
+                select(conversations.c.summary, conversations.c.summarized_through)
+                .where(conversations.c.conversation_id == conversation_id)
+            ).first()
+            if conversation is None:
+                return None
+            turns = conn.execute(
+                select(messages.c.role, messages.c.content)
+                .where(messages.c.conversation_id == conversation_id,
+                       messages.c.id > (conversation.summarized_through or 0))
+                .order_by(messages.c.id)
+            ).all()
+        return conversation_id, conversation.summary, [(turn.role, turn.content) for turn in turns]
+
+    def append(self, conversation_id, turns):
+        """Store (role, content) turns; returns the estimated tokens of unsummarized history"""
+        conversations, messages = self.conversations, self.messages
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            conn.execute(messages.insert(), [
+                {
+                    "conversation_id": conversation_id,
+                    "role": role,
+                    "content": content,
+                    "tokens": estimate_tokens(content),
+                    "created_at": now,
+                }
+                for role, content in turns
+            ])
+            conn.execute(
+                update(conversations).where(conversations.c.conversation_id == conversation_id).values(updated_at=now)
+            )
+            summarized_through = conn.execute(
+                select(conversations.c.summarized_through).where(conversations.c.conversation_id == conversation_id)
+            ).scalar_one()
+            return sum(conn.execute(
+                select(messages.c.tokens).where(messages.c.conversation_id == conversation_id,
+                                                messages.c.id > (summarized_through or 0))
+            ).scalars())
+
+    def history(self, conversation_id):
+        """(conversation row, all turns oldest first), or None for an unknown conversation"""
+        conversations, messages = self.conversations, self.messages
+        with self.engine.connect() as conn:
+            conversation = conn.execute(
+                select(conversations).where(conversations.c.conversation_id == conversation_id)
+            ).first()
+            if conversation is None:
+                return None
+            turns = conn.execute(
+                select(messages.c.role, messages.c.content, messages.c.created_at)
+                .where(messages.c.conversation_id == conversation_id)
+                .order_by(messages.c.id)
+            ).all()
+        return conversation, turns
+
+    def fold_into_summary(self, conversation_id):
+        """Summarize the oldest unsummarized turns until the rest fit in half the context budget (blocking)"""
+        conversations, messages = self.conversations, self.messages
+        with self.engine.connect() as conn:
+            conversation = conn.execute(
+                select(conversations.c.summary, conversations.c.summarized_through)
+                .where(conversations.c.conversation_id == conversation_id)
+            ).first()
+            turns = conn.execute(
+                select(messages.c.id, messages.c.role, messages.c.content, messages.c.tokens)
+                .where(messages.c.conversation_id == conversation_id,
+                       messages.c.id > (conversation.summarized_through or 0))
+                .order_by(messages.c.id)
+            ).all()
+
+        remaining = sum(turn.tokens for turn in turns)
+        folded = []
+        for turn in turns:
+            if remaining <= CHAT_CONTEXT_TOKENS // 2:
+                break
+            folded.append(turn)
+            remaining -= turn.tokens
+        if not folded:
+            return
+
+        summary = self.summarize(conversation.summary, [(turn.role, turn.content) for turn in folded])
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(conversations)
+                .where(conversations.c.conversation_id == conversation_id,
+                       conversations.c.summarized_through == conversation.summarized_through)
+                .values(summary=summary, summarized_through=folded[-1].id)
+            )
+        logger.info(f"Summarized {len(folded)} turns of conversation {conversation_id}")
+
+    async def _summarize(self, conversation_id):
+        try:
+            await asyncio.to_thread(self.fold_into_summary, conversation_id)
+        except Exception as e:
+            # Turns past the budget are still trimmed from prompts, just not summarized
+            logger.warning(f"Could not summarize conversation {conversation_id}: {e}")
+        finally:
+            self._summarizing.pop(conversation_id, None)
+
+    def schedule_summary(self, conversation_id, history_tokens):
+        """Summarize in the background once unsummarized history passes CHAT_SUMMARIZE_TOKENS"""
+        if history_tokens < CHAT_SUMMARIZE_TOKENS or conversation_id in self._summarizing:
+            return
+        self._summarizing[conversation_id] = asyncio.create_task(self._summarize(conversation_id))
+
+    def acquire(self, conversation_id):
+        """Take a reply slot for the conversation; False if it is already at its limit"""
+        now = time.monotonic()
+        # Slots older than any reply can take are dropped, so one a stream never released can't block forever
+        slots = [taken for taken in self._in_flight.get(conversation_id, []) if now - taken < CHAT_SLOT_SECONDS]
+        if len(slots) >= CHAT_MAX_CONCURRENT_PER_CONVERSATION:
+            CHAT_REJECTED.inc()
+            return False
+        slots.append(now)
+        self._in_flight[conversation_id] = slots
+        return True
+
+    def release(self, conversation_id):
+        slots = self._in_flight.get(conversation_id)
+        if slots:
+            slots.pop(0)
+        if not slots:
+            self._in_flight.pop(conversation_id, None)
+
+    async def stop(self):
+        for task in list(self._summarizing.values()):
+            task.cancel()
+        await asyncio.gather(*self._summarizing.values(), return_exceptions=True)
+        self._summarizing.clear()
@@ -0,0 +1,252 @@
+"""
+Circuit breakers and hedged requests for external (Groq) calls.
+
+When Groq is degraded, every submission used to wait out a failing or
+very slow STT and LLM call before falling back, so slowdowns multiplied
+worker occupancy. Each external dependency now has a CircuitBreaker:
+
+    stt                  Groq Whisper transcription
+    llm_chat             feedback, chat replies and chat summaries
+    exercise_generation  exercise phrases for the pool
+
+A breaker tracks the outcome of the last BREAKER_WINDOW calls. Once at
+least BREAKER_MIN_CALLS are recorded and the failure rate reaches
+BREAKER_FAILURE_RATE, or the share of calls slower than the dependency's
+slow-call threshold reaches BREAKER_SLOW_CALL_RATE, it opens: calls fail
+at once with CircuitOpenError and callers use their fallbacks (local STT
+or an empty transcript, rule-based feedback, the chat fallback message,
+a postponed pool refill). After BREAKER_OPEN_SECONDS it turns half-open
+and lets BREAKER_HALF_OPEN_PROBES calls through; a fast success closes
+it again, a failure or slow call re-opens it.
+
+hedged() sends a second, identical request when the first hasn't
+answered within the dependency's recent p95 latency and returns whichever
+answers first. Hedging costs quota, so it is off unless GROQ_HEDGE=1.
+
+Groq clients are built with GROQ_TIMEOUT_SECONDS and GROQ_MAX_RETRIES
+(the SDK defaults are 60 s and 2 retries) so one call can't hold a worker
+for minutes.
+
+Configuration:
+    BREAKER_WINDOW=20
+    BREAKER_MIN_CALLS=5
+    BREAKER_FAILURE_RATE=0.5
+    BREAKER_SLOW_CALL_RATE=0.8
+    BREAKER_OPEN_SECONDS=30
+    BREAKER_HALF_OPEN_PROBES=1
+    BREAKER_STT_SLOW_SECONDS=10
+    BREAKER_LLM_CHAT_SLOW_SECONDS=8
+    BREAKER_EXERCISE_GENERATION_SLOW_SECONDS=20
+    GROQ_HEDGE=0
+    GROQ_TIMEOUT_SECONDS=30
+    GROQ_MAX_RETRIES=1
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+GROQ_HEDGE = os.getenv("GROQ_HEDGE", "0").lower() in ("1", "true", "yes")
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "30"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "1"))
+
+# Successful call latencies kept for the p95 hedge delay, and how many are needed first
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state", "Circuit breaker state by dependency (0 closed, 1 half-open, 2 open)",
+    ["dependency"]
+)
+BREAKER_REJECTED = Counter(
+    "circuit_breaker_rejected_total", "Calls failed fast by an open circuit breaker by dependency",
+    ["dependency"]
+)
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes by dependency and new state",
+    ["dependency", "state"]
+)
+HEDGED_REQUESTS = Counter(
+    "hedged_requests_total", "Hedge requests sent after the p95 delay by dependency and which answered first",
+    ["dependency", "winner"]
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Failure-rate and slow-call breaker over a count-based window; thread-safe"""
+
+    def __init__(self, name, slow_call_seconds, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, slow_call_rate=BREAKER_SLOW_CALL_RATE,
+                 open_seconds=BREAKER_OPEN_SECONDS, half_open_probes=BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)       # (failed, slow) per call
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._opened_at = 0.0
+        self._probes = 0
+        BREAKER_STATE.set(STATE_VALUES[CLOSED], dependency=name)
+
+    def _transition(self, state):
+        # Called with the lock held
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            logger.warning(f"Circuit breaker {self.name} opened; failing fast for {self.open_seconds:.0f}s")
+        elif state == CLOSED:
+            self._outcomes.clear()
+            logger.info(f"Circuit breaker {self.name} closed")
+        self._probes = 0
+        BREAKER_STATE.set(STATE_VALUES[state], dependency=self.name)
+        BREAKER_TRANSITIONS.inc(dependency=self.name, state=state)
+
+    def allow(self):
+        """Whether a call may go out now (a half-open breaker admits a limited number of probes)"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    BREAKER_REJECTED.inc(dependency=self.name)
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    BREAKER_REJECTED.inc(dependency=self.name)
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, failed, seconds):
+        """Record the outcome of a call admitted by allow()"""
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if not failed:
+                self._latencies.append(seconds)
+            if self.state == HALF_OPEN:
+                self._transition(OPEN if failed or slow else CLOSED)
+                return
+            if self.state == OPEN:
+                # A call admitted before the breaker opened; it doesn't change the decision
+                return
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed_call, _ in self._outcomes if failed_call)
+            slow_calls = sum(1 for _, slow_call in self._outcomes if slow_call)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._transition(OPEN)
+
+    @contextmanager
+    def guard(self):
+        """Run the block as one call through the breaker; raises CircuitOpenError while open"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(True, time.perf_counter() - start)
+            raise
+        self.record(False, time.perf_counter() - start)
+
+    def p95(self):
+        """Recent successful-call p95 in seconds, or None until enough calls are seen"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def snapshot(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            state = self.state
+        p95 = self.p95()
+        return {
+            "state": state,
+            "recent_calls": calls,
+            "recent_failures": failures,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+def _slow_seconds(name, default):
+    return float(os.getenv(f"BREAKER_{name.upper()}_SLOW_SECONDS", default))
+
+
+breakers = {
+    "stt": CircuitBreaker("stt", _slow_seconds("stt", "10")),
+    "llm_chat": CircuitBreaker("llm_chat", _slow_seconds("llm_chat", "8")),
+    "exercise_generation": CircuitBreaker("exercise_generation", _slow_seconds("exercise_generation", "20")),
+}
+
+
+def breaker_states():
+    """Snapshot of every breaker, for /health"""
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="groq-hedge")
+
+
+def _submit(fn, *args, **kwargs):
+    # Each call gets its own copy of the caller's context, so quota charging follows it
+    return _hedge_pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def hedged(breaker, fn, *args, **kwargs):
+    """
+    fn(*args, **kwargs), plus a second identical call if the first hasn't
+    answered within the breaker's p95; the first success wins and the
+    slower call finishes in the background. Calls fn directly when
+    GROQ_HEDGE is off or the p95 isn't known yet.
+    """
+    delay = breaker.p95() if GROQ_HEDGE else None
+    if delay is None:
+        return fn(*args, **kwargs)
+
+    primary = _submit(fn, *args, **kwargs)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    hedge = _submit(fn, *args, **kwargs)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                HEDGED_REQUESTS.inc(dependency=breaker.name, winner="hedge" if future is hedge else "primary")
+                return future.result()
+            error = error or future.exception()
+    HEDGED_REQUESTS.inc(dependency=breaker.name, winner="none")
+    raise error
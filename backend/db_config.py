@@ -0,0 +1,308 @@
+"""
+Database engine configuration.
+
+SQLite's defaults (rollback journal, no busy timeout) serialize readers
+behind writers and surface "database is locked" errors as soon as two
+submissions commit at the same time. This module builds the engine with
+WAL mode, a busy timeout and a sized connection pool, applies the same
+pool and lock-timeout settings when DATABASE_URL points at Postgres, and
+provides an optional group-commit writer for Exercise inserts.
+
+All settings come from environment variables:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+    DB_BUSY_TIMEOUT_MS          - SQLite busy_timeout / Postgres lock_timeout
+    DB_STATEMENT_TIMEOUT_MS     - Postgres statement_timeout (0 = off)
+    SQLITE_JOURNAL_MODE         - default WAL
+    SQLITE_SYNCHRONOUS          - default NORMAL (safe with WAL)
+    DB_GROUP_COMMIT             - "1" to batch Exercise inserts
+    DB_GROUP_COMMIT_MAX_BATCH, DB_GROUP_COMMIT_MAX_DELAY_MS
+    DB_ASYNC                    - "1" to serve reads through an async engine
+                                  (aiosqlite / asyncpg)
+"""
+import os
+import asyncio
+import logging
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+DB_GROUP_COMMIT = os.getenv("DB_GROUP_COMMIT", "0") == "1"
+DB_GROUP_COMMIT_MAX_BATCH = int(os.getenv("DB_GROUP_COMMIT_MAX_BATCH", "50"))
+DB_GROUP_COMMIT_MAX_DELAY_MS = int(os.getenv("DB_GROUP_COMMIT_MAX_DELAY_MS", "20"))
+
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+
+def is_sqlite(database_url):
+    return database_url.startswith("sqlite")
+
+
+def _is_sqlite_memory(database_url):
+    return database_url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in database_url
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Run on every new pooled SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(database_url):
+    """Create the SQLAlchemy engine for DATABASE_URL with pooling and pragmas"""
+    if is_sqlite(database_url):
+        connect_args = {
+            "check_same_thread": False,
+            "timeout": DB_BUSY_TIMEOUT_MS / 1000
+        }
+        if _is_sqlite_memory(database_url):
+            # In-memory databases live in a single connection; no pool sizing or WAL
+            return create_engine(database_url, connect_args=connect_args)
+
+        engine = create_engine(
+            database_url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+        logger.info(
+            f"SQLite engine: journal_mode={SQLITE_JOURNAL_MODE}, synchronous={SQLITE_SYNCHRONOUS}, "
+            f"busy_timeout={DB_BUSY_TIMEOUT_MS}ms, pool={DB_POOL_SIZE}+{DB_MAX_OVERFLOW}"
+        )
+        return engine
+
+    connect_args = {}
+    if database_url.startswith("postgresql"):
+        # Postgres equivalents of the SQLite busy timeout
+        options = [f"-c lock_timeout={DB_BUSY_TIMEOUT_MS}"]
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            options.append(f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}")
+        connect_args["options"] = " ".join(options)
+
+    engine = create_engine(
+        database_url,
+        connect_args=connect_args,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+    logger.info(f"Database engine: pool={DB_POOL_SIZE}+{DB_MAX_OVERFLOW}, lock_timeout={DB_BUSY_TIMEOUT_MS}ms")
+    return engine
+
+
+def async_database_url(database_url):
+    """Map a sync DATABASE_URL onto its async driver"""
+    scheme, _, rest = database_url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    raise ValueError(f"No async driver configured for {dialect}")
+
+
+def create_async_db_engine(database_url):
+    """Create an async engine mirroring create_db_engine's pool and timeout settings"""
+    url = async_database_url(database_url)
+
+    if is_sqlite(database_url):
+        connect_args = {"timeout": DB_BUSY_TIMEOUT_MS / 1000}
+        if _is_sqlite_memory(database_url):
+            return create_async_engine(url, connect_args=connect_args)
+        engine = create_async_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        return engine
+
+    server_settings = {"lock_timeout": str(DB_BUSY_TIMEOUT_MS)}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    return create_async_engine(
+        url,
+        connect_args={"server_settings": server_settings},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
+
+def create_async_session_factory(engine):
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+class ReadSession:
+    """
+    Awaitable query interface shared by the async and sync database paths.
+
+    Endpoints build 2.0-style select() statements and await one of the
+    fetch methods below. With DB_ASYNC=1 they run on an AsyncSession;
+    otherwise the sync Session executes and fetches on a worker thread,
+    so the event loop is never blocked on database I/O either way.
+    """
+
+    def __init__(self, session, is_async):
+        self.session = session
+        self.is_async = is_async
+
+    async def _execute(self, statement, fetch):
+        if self.is_async:
+            return fetch(await self.session.execute(statement))
+        return await asyncio.to_thread(lambda: fetch(self.session.execute(statement)))
+
+    async def first(self, statement):
+        """First ORM entity (or None)"""
+        return await self._execute(statement, lambda result: result.scalars().first())
+
+    async def scalars(self, statement):
+        """All ORM entities / single-column values"""
+        return await self._execute(statement, lambda result: result.scalars().all())
+
+    async def scalar(self, statement):
+        """A single value, e.g. a count"""
+        return await self._execute(statement, lambda result: result.scalar())
+
+    async def all(self, statement):
+        """All rows of a multi-column select"""
+        return await self._execute(statement, lambda result: result.all())
+
+    async def first_row(self, statement):
+        """First row of a multi-column select (or None)"""
+        return await self._execute(statement, lambda result: result.first())
+
+    async def one(self, statement):
+        """Exactly one row of a multi-column select"""
+        return await self._execute(statement, lambda result: result.one())
+
+
+class GroupCommitWriter:
+    """
+    Single writer task that batches row inserts into one commit.
+
+    Callers `await writer.add(row)` and get the row back once it has been
+    committed. Rows arriving within max_delay of each other share a
+    transaction, so a burst of submissions costs one fsync instead of one
+    per row. If a batch fails, its rows are retried one by one so a single
+    bad row only fails its own caller.
+    """
+
+    def __init__(self, session_factory, max_batch=DB_GROUP_COMMIT_MAX_BATCH,
+                 max_delay_ms=DB_GROUP_COMMIT_MAX_DELAY_MS):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Group commit writer started (batch={self.max_batch}, delay={self.max_delay * 1000:.0f}ms)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # Let queued rows drain before shutting down
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def add(self, row, *related):
+        """
+        Queue a row (plus any rows that must commit with it) for insertion
+        and wait until they are committed. Returns the first row.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((row, *related), future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await asyncio.to_thread(self._commit_batch, [rows for rows, _ in batch])
+                for (rows, future), error in zip(batch, results):
+                    if future.done():
+                        continue
+                    if error is None:
+                        future.set_result(rows[0])
+                    else:
+                        future.set_exception(error)
+            except Exception as e:
+                # Fail this batch's callers but keep the writer running for later rows
+                logger.error(f"Group commit writer failed on a batch of {len(batch)}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit_batch(self, items):
+        """Commit queued items in one transaction; returns a per-item error list"""
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            for rows in items:
+                db.add_all(rows)
+            db.commit()
+            return [None] * len(items)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Group commit of {len(items)} items failed, retrying individually: {e}")
+        finally:
+            db.close()
+
+        errors = []
+        for rows in items:
+            db = self.session_factory(expire_on_commit=False)
+            try:
+                db.add_all(rows)
+                db.commit()
+                errors.append(None)
+            except Exception as e:
+                db.rollback()
+                errors.append(e)
+            finally:
+                db.close()
+        return errors
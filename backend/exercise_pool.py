@@ -0,0 +1,281 @@
+"""
+Pre-generated exercise pool for /api/exercises/generate.
+
+Exercise phrases are generated by the LLM ahead of time and stored per
+(exercise_type, difficulty) in the exercise_pool table, so a request is
+served from the database without waiting on the model. Each user's
+served phrases are recorded in exercise_pool_seen and unseen phrases are
+preferred; once a user has seen every phrase in a pool they are served
+again, least-served first.
+
+When a request leaves the user fewer than EXERCISE_POOL_LOW_WATER
+unseen phrases in a pool, a background task asks the LLM for more
+batches until the pool holds EXERCISE_POOL_TARGET. If the pool already
+holds that many, the user has worked through most of it, so the pool
+grows by one more batch, up to EXERCISE_POOL_MAX; past that cap users
+get repeats, least-served first. New phrases that are near-duplicates
+of pooled ones (same normalized text, or word-set Jaccard similarity of
+at least EXERCISE_POOL_DUPLICATE_SIMILARITY) are dropped. A pool that
+is still empty (first start, LLM down) is served from SEED_EXERCISES.
+
+Configuration:
+    EXERCISE_POOL_LOW_WATER=20
+    EXERCISE_POOL_TARGET=60           (refill stops once a pool holds this many)
+    EXERCISE_POOL_MAX=300             (hard cap when growing a pool for users who have seen it)
+    EXERCISE_POOL_BATCH=10            (phrases requested per LLM call)
+    EXERCISE_POOL_DUPLICATE_SIMILARITY=0.8
+    EXERCISE_POOL_PREFILL=1           (top up every pool at startup)
+"""
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, func, update
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+EXERCISE_TYPES = ["lisp", "stuttering", "general", "custom"]
+EXERCISE_DIFFICULTIES = ["beginner", "intermediate", "advanced"]
+
+EXERCISE_POOL_LOW_WATER = int(os.getenv("EXERCISE_POOL_LOW_WATER", "20"))
+EXERCISE_POOL_TARGET = int(os.getenv("EXERCISE_POOL_TARGET", "60"))
+EXERCISE_POOL_MAX = max(EXERCISE_POOL_TARGET, int(os.getenv("EXERCISE_POOL_MAX", "300")))
+EXERCISE_POOL_BATCH = int(os.getenv("EXERCISE_POOL_BATCH", "10"))
+EXERCISE_POOL_DUPLICATE_SIMILARITY = float(os.getenv("EXERCISE_POOL_DUPLICATE_SIMILARITY", "0.8"))
+EXERCISE_POOL_PREFILL = os.getenv("EXERCISE_POOL_PREFILL", "1").lower() in ("1", "true", "yes")
+# Seconds to wait before retrying a pool whose last refill failed
+REFILL_RETRY_SECONDS = 60
+
+# Served while a pool is still empty
+SEED_EXERCISES = {
+    "lisp": [
+        "She sells seashells by the seashore",
+        "Sam sat on the sunny side of the street",
+        "Zebras zigzag across the sizzling sand",
+        "Six slippery snails slid slowly seaward",
+    ],
+    "stuttering": [
+        "Take a slow breath and say good morning",
+        "Bring the blue book back to the big library",
+        "Today I will speak slowly and smoothly",
+        "Please pass the peas and potatoes",
+    ],
+    "general": [
+        "The quick brown fox jumps over the lazy dog",
+        "Peter Piper picked a peck of pickled peppers",
+        "Red lorry, yellow lorry, red lorry, yellow lorry",
+        "How much wood would a woodchuck chuck",
+    ],
+}
+
+POOL_REQUESTS = Counter(
+    "exercise_pool_requests_total", "Exercise generation requests by how they were served",
+    ["source"]
+)
+POOL_REFILLS = Counter(
+    "exercise_pool_refills_total", "Background exercise pool refills by outcome",
+    ["outcome"]
+)
+
+
+def normalize_exercise(text):
+    """Lower-cased words only, for duplicate detection"""
+    return " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+
+
+def _similarity(a, b):
+    words_a, words_b = set(a.split()), set(b.split())
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+def filter_duplicates(candidates, existing, threshold=EXERCISE_POOL_DUPLICATE_SIMILARITY):
+    """Candidates (deduplicated among themselves) that aren't near-duplicates of existing normalized texts"""
+    known = list(existing)
+    known_set = set(known)
+    accepted = []
+    for text in candidates:
+        text = text.strip()
+        normalized = normalize_exercise(text)
+        if not normalized or normalized in known_set:
+            continue
+        if any(_similarity(normalized, other) >= threshold for other in known):
+            continue
+        accepted.append((text, normalized))
+        known.append(normalized)
+        known_set.add(normalized)
+    return accepted
+
+
+class ExercisePool:
+    """
+    Pool reads/writes on the sync engine (call them from a worker thread)
+    and refills as asyncio tasks on the running loop.
+
+    generate(exercise_type, difficulty, count) returns a list of phrases
+    and raises on failure.
+    """
+
+    def __init__(self, engine, metadata, generate):
+        self.engine = engine
+        self.pool = metadata.tables["exercise_pool"]
+        self.seen = metadata.tables["exercise_pool_seen"]
+        self.generate = generate
+        self._refilling = {}
+        self._failed_at = {}
+
+    def pool_size(self, exercise_type, difficulty):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(self.pool).where(
+                    self.pool.c.exercise_type == exercise_type, self.pool.c.difficulty == difficulty
+                )
+            ).scalar_one()
+
+    def take(self, exercise_type, difficulty, count, user_id=None):
+        """
+        Up to count pooled phrases, the user's unseen ones first. Returns
+        (phrases, unseen_remaining); unseen_remaining is what the user has
+        left after this request (the pool size without a user_id).
+        """
+        pool, seen = self.pool, self.seen
+        key = (pool.c.exercise_type == exercise_type, pool.c.difficulty == difficulty)
+        with self.engine.begin() as conn:
+            query = select(pool.c.id, pool.c.text).where(*key)
+            if user_id:
+                seen_ids = select(seen.c.pool_exercise_id).where(seen.c.user_id == user_id)
+                unseen_first = pool.c.id.in_(seen_ids)
+                query = query.order_by(unseen_first, pool.c.served_count, func.random())
+                unseen_total = conn.execute(
+                    select(func.count()).select_from(pool).where(*key, pool.c.id.not_in(seen_ids))
+                ).scalar_one()
+            else:
+                query = query.order_by(pool.c.served_count, func.random())
+                unseen_total = conn.execute(select(func.count()).select_from(pool).where(*key)).scalar_one()
+            rows = conn.execute(query.limit(count)).all()
+            if not rows:
+                return [], 0
+
+            ids = [row.id for row in rows]
+            conn.execute(update(pool).where(pool.c.id.in_(ids)).values(served_count=pool.c.served_count + 1))
+            if user_id:
+                already_seen = set(conn.execute(
+                    select(seen.c.pool_exercise_id).where(seen.c.user_id == user_id, seen.c.pool_exercise_id.in_(ids))
+                ).scalars())
+                now = datetime.utcnow()
+                new_seen = [
+                    {"user_id": user_id, "pool_exercise_id": pool_id, "seen_at": now}
+                    for pool_id in ids if pool_id not in already_seen
+                ]
+                if new_seen:
+                    conn.execute(seen.insert(), new_seen)
+                unseen_total -= len(new_seen)
+        return [row.text for row in rows], max(unseen_total, 0)
+
+    def add(self, exercise_type, difficulty, phrases):
+        """Insert phrases that aren't near-duplicates of the pool's; returns how many were added"""
+        pool = self.pool
+        with self.engine.begin() as conn:
+            existing = conn.execute(
+                select(pool.c.normalized).where(pool.c.exercise_type == exercise_type, pool.c.difficulty == difficulty)
+            ).scalars().all()
+            accepted = filter_duplicates(phrases, existing)
+            if accepted:
+                now = datetime.utcnow()
+                conn.execute(pool.insert(), [
+                    {
+                        "exercise_type": exercise_type,
+                        "difficulty": difficulty,
+                        "text": text,
+                        "normalized": normalized,
+                        "served_count": 0,
+                        "created_at": now,
+                    }
+                    for text, normalized in accepted
+                ])
+        return len(accepted)
+
+    def refill_once(self, exercise_type, difficulty):
+        """One LLM batch into the pool (blocking); returns how many phrases were added"""
+        phrases = self.generate(exercise_type, difficulty, EXERCISE_POOL_BATCH)
+        added = self.add(exercise_type, difficulty, phrases)
+        logger.info(f"Exercise pool {exercise_type}/{difficulty}: added {added} of {len(phrases)} generated")
+        return added
+
+    async def _refill(self, exercise_type, difficulty, grow=False):
+        key = (exercise_type, difficulty)
+        try:
+            size = await asyncio.to_thread(self.pool_size, *key)
+            goal = EXERCISE_POOL_TARGET
+            if grow:
+                # At least one more batch for a user running out of unseen phrases, within the cap
+                goal = max(goal, min(size + EXERCISE_POOL_BATCH, EXERCISE_POOL_MAX))
+            # A batch that is all duplicates ends the refill rather than looping on the LLM
+            while size < goal:
+                if not await asyncio.to_thread(self.refill_once, *key):
+                    break
+                size = await asyncio.to_thread(self.pool_size, *key)
+            self._failed_at.pop(key, None)
+            POOL_REFILLS.inc(outcome="success")
+        except Exception as e:
+            self._failed_at[key] = time.monotonic()
+            POOL_REFILLS.inc(outcome="failure")
+            logger.warning(f"Exercise pool refill for {exercise_type}/{difficulty} failed: {e}")
+        finally:
+            self._refilling.pop(key, None)
+
+    def schedule_refill(self, exercise_type, difficulty, grow=False):
+        """
+        Start a background refill for the pool unless one is running or
+        recently failed; grow adds a batch past EXERCISE_POOL_TARGET
+        (up to EXERCISE_POOL_MAX)
+        """
+        key = (exercise_type, difficulty)
+        if key in self._refilling:
+            return
+        failed_at = self._failed_at.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < REFILL_RETRY_SECONDS:
+            return
+        self._refilling[key] = asyncio.create_task(self._refill(exercise_type, difficulty, grow))
+
+    async def get_exercises(self, exercise_type, difficulty, count, user_id=None):
+        """
+        (phrases, source) for a request, never waiting on the LLM. source is
+        "pool", or "seed" when the pool had nothing to serve yet.
+        """
+        phrases, unseen_remaining = await asyncio.to_thread(self.take, exercise_type, difficulty, count, user_id)
+        if len(phrases) < count or unseen_remaining < EXERCISE_POOL_LOW_WATER:
+            # Without a user_id, unseen_remaining is the pool size, so only refill to the target
+            self.schedule_refill(exercise_type, difficulty, grow=bool(user_id))
+        if phrases:
+            POOL_REQUESTS.inc(source="pool")
+            return phrases, "pool"
+        POOL_REQUESTS.inc(source="seed")
+        seeds = SEED_EXERCISES.get(exercise_type, SEED_EXERCISES["general"])
+        return random.sample(seeds, min(count, len(seeds))), "seed"
+
+    async def prefill(self):
+        """Top up every pool below the low-water mark, one at a time (startup task)"""
+        for exercise_type in EXERCISE_TYPES:
+            for difficulty in EXERCISE_DIFFICULTIES:
+                key = (exercise_type, difficulty)
+                if key in self._refilling:
+                    continue
+                if await asyncio.to_thread(self.pool_size, *key) < EXERCISE_POOL_LOW_WATER:
+                    self.schedule_refill(*key)
+                    task = self._refilling.get(key)
+                    if task:
+                        await task
+
+    async def stop(self):
+        for task in list(self._refilling.values()):
+            task.cancel()
+        await asyncio.gather(*self._refilling.values(), return_exceptions=True)
+        self._refilling.clear()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Groq API
+
+Serves the two Groq endpoints the backend uses - audio transcriptions and
+chat completions - with deterministic responses, so the full submission
+pipeline can be benchmarked offline and in CI without API quota.
+
+Transcripts are looked up by the SHA-256 of the uploaded audio across the
+sample corpus (backend/audio_samples and audio_samples). A clip's
+transcript is read from a sidecar text file with the same stem
+(recording.wav -> recording.txt); clips without one get --default-transcript.
+Chat completions return canned feedback, exercise phrases or assistant
+replies depending on the prompt, and support stream=True (SSE).
+
+Latency, rate limiting and errors are configurable, and seeded so runs
+are repeatable. Each request draws from its own RNG, seeded from --seed,
+the request content and how many times that content has been seen, so
+the draws don't depend on how concurrent requests interleave:
+
+    python fake_groq.py --port 8001 --stt-latency lognormal:350,0.4 --chat-latency uniform:200,900
+    python fake_groq.py --rpm 30 --error-rate 0.05
+
+Point the backend at it (the Groq SDK reads GROQ_BASE_URL; any key works):
+
+    GROQ_BASE_URL=http://localhost:8001 GROQ_API_KEY=fake python main.py
+
+Latency specs (milliseconds): fixed:MS, uniform:LO,HI, normal:MEAN,STD,
+lognormal:MEDIAN,SIGMA.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DEFAULT_CORPUS = [BACKEND_DIR / "audio_samples", BACKEND_DIR.parent / "audio_samples"]
+DEFAULT_TRANSCRIPT = "She sells seashells by the seashore"
+
+# Rough speaking rate used to invent word timestamps
+SECONDS_PER_WORD = 0.4
+
+CANNED_FEEDBACK = [
+    "Great effort! Your pacing was steady and most words came through clearly. Try slowing down slightly on the 's' sounds to keep them crisp.",
+    "Nice work! Your clarity is improving. Focus on keeping your tongue behind your teeth for the sibilant sounds, and you'll sound even sharper.",
+    "Good job sticking with it! A few pauses broke up the phrase, so try saying it in one smooth breath next time.",
+    "Well done! Your voice was clear and confident. Keep practicing at this pace and try a slightly harder phrase next.",
+]
+
+CANNED_EXERCISES = [
+    "Sam sat by the sunny seaside sipping sweet cider",
+    "Six sleek swans swam swiftly southwards",
+    "Susie sews seven silk scarves on Saturdays",
+    "The busy bees buzz past the roses in the breeze",
+    "Zebras zigzag across the dusty zoo enclosure",
+    "Sister Sarah said she saw a sailing ship",
+    "Slowly and steadily the sun sets over the sea",
+    "Fresh fish sizzle in the pan on summer evenings",
+]
+
+CANNED_CHAT = [
+    "Meow! That's a great question. Practicing a little every day makes a big difference, so try one of the lisp or fluency exercises and I'll track your progress. 🐱",
+    "Purr-fect timing! Short, regular sessions work best. Start with the beginner exercises and move up when they feel easy. Remember that a speech therapist can give you personalized guidance.",
+]
+
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+class LatencyModel:
+    """Sampler for a latency spec like 'lognormal:350,0.4' (milliseconds)"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, params = (spec or "fixed:0").partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(",") if p.strip()]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Invalid latency spec '{spec}'")
+
+    def sample(self, rng):
+        """One latency in seconds"""
+        if self.kind == "fixed":
+            ms = self.params[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            ms = rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            ms = rng.lognormvariate(math.log(max(median, 1e-3)), sigma)
+        return max(ms, 0.0) / 1000
+
+
+class RateLimiter:
+    """Sliding one-minute window of request timestamps"""
+
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self.requests = deque()
+
+    def check(self):
+        """Return seconds to wait if over the limit, else record the request and return 0"""
+        if not self.rpm:
+            return 0.0
+        now = time.monotonic()
+        while self.requests and now - self.requests[0] >= 60:
+            self.requests.popleft()
+        if len(self.requests) >= self.rpm:
+            return 60 - (now - self.requests[0])
+        self.requests.append(now)
+        return 0.0
+
+
+def build_transcript_index(corpus_dirs):
+    """Map sha256 of each corpus clip (and its file stem) to its sidecar transcript"""
+    by_hash, by_stem = {}, {}
+    for directory in corpus_dirs:
+        directory = Path(directory)
+        if not directory.is_dir():
+            continue
+        for path in directory.iterdir():
+            if path.suffix.lower() not in (".wav", ".webm", ".mp3", ".m4a", ".ogg", ".flac"):
+                continue
+            sidecar = path.with_suffix(".txt")
+            if not sidecar.exists():
+                continue
+            text = sidecar.read_text().strip()
+            by_hash[hashlib.sha256(path.read_bytes()).hexdigest()] = text
+            by_stem[path.stem] = text
+    return by_hash, by_stem
+
+
+# ============================================================================
+# App
+# ============================================================================
+
+def create_app(config):
+    stt_latency = LatencyModel(config.stt_latency)
+    chat_latency = LatencyModel(config.chat_latency)
+    seen = {}
+    limiter = RateLimiter(config.rpm)
+    by_hash, by_stem = build_transcript_index(config.corpus or DEFAULT_CORPUS)
+    stats = {"transcriptions": 0, "chat_completions": 0, "rate_limited": 0, "server_errors": 0}
+
+    app = FastAPI(title="Fake Groq API")
+    logger.info(f"Fake Groq loaded {len(by_hash)} transcripts")
+
+    def error_response(status, message, error_type, code, headers=None):
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": message, "type": error_type, "code": code}},
+            headers=headers
+        )
+
+    def request_rng(kind, content):
+        """RNG for one request, keyed on its content and how often that content has been seen"""
+        digest = hashlib.sha256(content).hexdigest()
+        seen[(kind, digest)] = seen.get((kind, digest), 0) + 1
+        return random.Random(f"{config.seed}:{kind}:{digest}:{seen[(kind, digest)]}")
+
+    def injected_error(rng):
+        """429/503 from the rate limit or the configured error rates, else None"""
+        retry_after = limiter.check()
+        if retry_after:
+            stats["rate_limited"] += 1
+            return error_response(
+                429, f"Rate limit reached: {config.rpm} requests per minute",
+                "requests", "rate_limit_exceeded",
+                headers={"retry-after": f"{retry_after:.2f}"}
+            )
+        roll = rng.random()
+        if roll < config.error_rate:
+            stats["rate_limited"] += 1
+            return error_response(
+                429, "Rate limit reached (injected)", "tokens", "rate_limit_exceeded",
+                headers={"retry-after": f"{config.retry_after:g}"}
+            )
+        if roll < config.error_rate + config.server_error_rate:
+            stats["server_errors"] += 1
+            return error_response(503, "Service unavailable (injected)", "internal_server_error", "service_unavailable")
+        return None
+
+    def lookup_transcript(data, filename):
+        text = by_hash.get(hashlib.sha256(data).hexdigest())
+        if text is None and filename:
+            stem = Path(filename).stem
+            # Saved uploads are named <uuid>_<original name>
+            text = by_stem.get(stem) or by_stem.get(stem.split("_", 1)[-1])
+        return text or config.default_transcript
+
+    def pick(options, key):
+        """Deterministic choice keyed on the request content"""
+        digest = hashlib.sha256(key.encode()).digest()
+        return options[int.from_bytes(digest[:4], "big") % len(options)]
+
+    def completion_text(messages, max_tokens):
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+
+        if "Generate" in user and "phrases" in user:
+            match = re.search(r"Generate (\d+)", user)
+            count = int(match.group(1)) if match else 3
+            start = pick(range(len(CANNED_EXERCISES)), user)
+            phrases = [CANNED_EXERCISES[(start + i) % len(CANNED_EXERCISES)] for i in range(count)]
+            text = "\n".join(phrases)
+        elif "Whiskers" in system:
+            text = pick(CANNED_CHAT, user)
+        else:
+            text = pick(CANNED_FEEDBACK, user)
+
+        # Crude token budget: roughly one token per word
+        words = text.split(" ")
+        if max_tokens and len(words) > max_tokens:
+            text = " ".join(words[:max_tokens])
+        return text
+
+    @app.get("/openai/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [
+            {"id": "whisper-large-v3-turbo", "object": "model", "owned_by": "fake-groq"},
+            {"id": "llama-3.3-70b-versatile", "object": "model", "owned_by": "fake-groq"},
+        ]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/openai/v1/audio/transcriptions")
+    async def transcriptions(
+        file: UploadFile = File(...),
+        model: str = Form("whisper-large-v3-turbo"),
+        response_format: str = Form("json"),
+        language: str = Form("en"),
+        timestamp_granularities: Optional[List[str]] = Form(None, alias="timestamp_granularities[]"),
+    ):
+        data = await file.read()
+        rng = request_rng("transcription", data)
+        error = injected_error(rng)
+        if error is not None:
+            return error
+
+        text = lookup_transcript(data, file.filename)
+        await asyncio.sleep(stt_latency.sample(rng))
+        stats["transcriptions"] += 1
+
+        if response_format == "text":
+            return JSONResponse(content=text)
+        if response_format != "verbose_json":
+            return {"text": text}
+
+        words = text.split()
+        duration = round(len(words) * SECONDS_PER_WORD, 2)
+        body = {
+            "task": "transcribe",
+            "language": "english" if language == "en" else language,
+            "duration": duration,
+            "text": text,
+            "segments": [{
+                "id": 0, "seek": 0, "start": 0.0, "end": duration, "text": text,
+                "avg_logprob": -0.1, "compression_ratio": 1.0, "no_speech_prob": 0.0
+            }],
+            "x_groq": {"id": f"req_{uuid.uuid4().hex}"}
+        }
+        if timestamp_granularities and "word" in timestamp_granularities:
+            body["words"] = [
+                {"word": word, "start": round(i * SECONDS_PER_WORD, 2), "end": round((i + 1) * SECONDS_PER_WORD, 2)}
+                for i, word in enumerate(words)
+            ]
+        return body
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        rng = request_rng("chat", json.dumps(payload, sort_keys=True).encode())
+        error = injected_error(rng)
+        if error is not None:
+            return error
+
+        model = payload.get("model", "llama-3.3-70b-versatile")
+        text = completion_text(payload.get("messages", []), payload.get("max_tokens"))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in payload.get("messages", []))
+        completion_tokens = len(text.split())
+        stats["chat_completions"] += 1
+
+        if payload.get("stream"):
+            async def events():
+                # Latency model covers time to first token; chunks follow at a fixed pace
+                await asyncio.sleep(chat_latency.sample(rng))
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": word if i == 0 else " " + word},
+                                     "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(config.stream_chunk_ms / 1000)
+                final = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "x_groq": {"id": f"req_{uuid.uuid4().hex}", "usage": {
+                        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    }}
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(chat_latency.sample(rng))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Groq API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--corpus", action="append", help="Directory of clips with .txt sidecar transcripts (repeatable)")
+    parser.add_argument("--default-transcript", default=DEFAULT_TRANSCRIPT, help="Transcript for clips without a sidecar")
+    parser.add_argument("--stt-latency", default="lognormal:350,0.35", help="Transcription latency spec")
+    parser.add_argument("--chat-latency", default="lognormal:600,0.4", help="Chat completion latency (time to first token when streaming)")
+    parser.add_argument("--stream-chunk-ms", type=float, default=20.0, help="Delay between streamed chunks")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before returning 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Probability of an injected 503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after seconds sent with injected 429s")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and error sampling")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,93 @@
+"""
+Columnar copy of the charted acoustic metrics.
+
+Exercise.analysis is a JSON blob, so trend queries used to load and
+deserialize every blob in Python. The exercise_features table keeps one
+float column per metric, written alongside each Exercise row and
+backfilled from existing rows by a schema migration, so trends and
+cohort statistics run as SQL aggregates over indexed columns.
+"""
+import logging
+
+from sqlalchemy import select
+
+logger = logging.getLogger(__name__)
+
+# Feature column -> path into the analysis JSON
+FEATURE_PATHS = {
+    "pause_ratio": ("pause_ratio",),
+    "speech_rate": ("speech_rate",),
+    "pitch_mean": ("pitch_analysis", "mean"),
+    "pitch_std": ("pitch_analysis", "std"),
+    "pitch_variation": ("pitch_analysis", "variation_score"),
+    "lisp_likelihood": ("lisp_analysis", "likelihood"),
+    "sibilant_energy": ("lisp_analysis", "sibilant_energy"),
+    "clarity_score": ("voice_quality", "clarity_score"),
+    "breathiness_score": ("voice_quality", "breathiness_score"),
+    "f1_mean": ("formant_analysis", "f1_mean"),
+    "f2_mean": ("formant_analysis", "f2_mean"),
+    "vowel_clarity": ("formant_analysis", "vowel_clarity"),
+}
+
+FEATURE_COLUMNS = list(FEATURE_PATHS.keys())
+
+
+def extract_features(analysis):
+    """Pull the charted metrics out of an analysis dict as floats (None if absent)"""
+    features = {}
+    for column, path in FEATURE_PATHS.items():
+        value = analysis or {}
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        try:
+            features[column] = float(value) if value is not None else None
+        except (TypeError, ValueError):
+            features[column] = None
+    return features
+
+
+def feature_row_values(exercise):
+    """Column values for the exercise_features row of an Exercise-like object"""
+    return {
+        "exercise_id": exercise.exercise_id,
+        "user_id": exercise.user_id,
+        "session_id": exercise.session_id,
+        "timestamp": exercise.timestamp,
+        "score": exercise.score,
+        "accuracy": exercise.accuracy,
+        "duration": exercise.duration,
+        **extract_features(exercise.analysis),
+    }
+
+
+def backfill_features(conn, metadata, batch_size=500):
+    """Insert feature rows for every exercise that does not have one yet"""
+    exercises = metadata.tables["exercises"]
+    features = metadata.tables["exercise_features"]
+
+    # Only the columns this migration needs: later migrations may add model
+    # columns that don't exist yet when this one runs
+    source_columns = [
+        exercises.c[name] for name in
+        ("id", "exercise_id", "user_id", "session_id", "timestamp", "score", "accuracy", "duration", "analysis")
+    ]
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = conn.execute(
+            select(*source_columns)
+            .outerjoin(features, features.c.exercise_id == exercises.c.exercise_id)
+            .where(features.c.id.is_(None), exercises.c.id > last_id)
+            .order_by(exercises.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        conn.execute(features.insert(), [feature_row_values(row) for row in rows])
+        last_id = rows[-1].id
+        total += len(rows)
+
+    if total:
+        logger.info(f"Backfilled exercise features for {total} exercises")
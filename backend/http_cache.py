@@ -0,0 +1,98 @@
+"""
+Conditional GET support for the read endpoints.
+
+Dashboards poll exercise, user, session, progress and history endpoints
+that rarely change between polls. Each endpoint runs a cheap validator
+query first (row timestamps, or a count and max(updated_at) over the rows
+its payload is built from) and derives an ETag and Last-Modified from it.
+A matching If-None-Match (or, without one, an If-Modified-Since no older
+than Last-Modified) gets a bodiless 304 before the full payload is
+queried and serialized.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from metrics import Counter
+
+# Cache-Control per endpoint. "no-cache" still lets the browser keep the
+# body, but it revalidates (usually getting a 304) on every poll.
+CACHE_CONTROL = {
+    "exercise": "private, max-age=60",
+    "user": "private, max-age=300",
+    "session": "private, no-cache",
+    "progress": "private, no-cache",
+    "history": "private, no-cache",
+}
+
+CONDITIONAL_REQUESTS = Counter(
+    "conditional_get_requests_total", "Read endpoint responses by endpoint and outcome",
+    ["endpoint", "outcome"]
+)
+
+
+def make_etag(*parts):
+    """Strong ETag over the validator values"""
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def http_date(value):
+    """HTTP-date for a naive UTC datetime"""
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def _etag_matches(header, etag):
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _not_modified_since(header, last_modified):
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def conditional_get(request: Request, response: Response, endpoint, last_modified, *validators):
+    """
+    Set ETag, Last-Modified and Cache-Control on the endpoint's response.
+
+    validators are the values the payload depends on; last_modified is the
+    newest timestamp among them (naive UTC, or None if there is none).
+    Returns a 304 Response when the client's copy is current, else None so
+    the endpoint builds the body as usual.
+    """
+    etag = make_etag(endpoint, *validators)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL[endpoint]}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    elif if_modified_since is not None and last_modified is not None:
+        fresh = _not_modified_since(if_modified_since, last_modified)
+    else:
+        fresh = False
+
+    CONDITIONAL_REQUESTS.inc(endpoint=endpoint, outcome="not_modified" if fresh else "full")
+    if fresh:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def latest(*values):
+    """Newest of some optional datetimes (None if all are None)"""
+    present = [value for value in values if isinstance(value, datetime)]
+    return max(present) if present else None
@@ -0,0 +1,174 @@
+"""
+Idempotent submissions.
+
+Mobile clients retry a submission when a response is slow to arrive, and
+each retry used to run STT, analysis and the LLM again and save a second
+Exercise row. Submission endpoints now run through IdempotencyStore.handle:
+
+- With an Idempotency-Key header, the request is identified by the key.
+  A repeat within IDEMPOTENCY_TTL_SECONDS replays the stored response
+  without reading the upload; reusing a key with different parameters
+  is a 422.
+- Without a key, the request is identified by the SHA-256 of the audio
+  plus its parameters (computed while the upload is streamed to disk), and
+  a repeat within IDEMPOTENCY_CONTENT_TTL_SECONDS is replayed. A new
+  recording never has the same bytes, so only true retries match.
+- A duplicate that arrives while the first request is still being
+  processed in this worker waits for it and gets the same response (or
+  the same error) instead of starting a second computation.
+
+Only successful responses are stored. Replays carry the header
+"Idempotent-Replayed: true".
+
+Configuration:
+    IDEMPOTENCY_TTL_SECONDS=86400
+    IDEMPOTENCY_CONTENT_TTL_SECONDS=600
+"""
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CONTENT_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_CONTENT_TTL_SECONDS", "600"))
+MAX_KEY_LENGTH = 255
+
+REPLAY_HEADERS = {"Idempotent-Replayed": "true"}
+
+IDEMPOTENT_REQUESTS = Counter(
+    "idempotent_requests_total", "Submissions by endpoint and idempotency outcome",
+    ["endpoint", "outcome"]
+)
+
+
+def fingerprint(*parts):
+    """SHA-256 over the request parameters (and audio digest) that define a submission"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Stored responses in idempotency_records (sync engine, called through
+    worker threads) and this worker's in-flight requests.
+    """
+
+    def __init__(self, engine, metadata):
+        self.engine = engine
+        self.records = metadata.tables["idempotency_records"]
+        self._in_flight = {}
+
+    def _load(self, scope):
+        records = self.records
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(records.c.fingerprint, records.c.response)
+                .where(records.c.scope == scope, records.c.expires_at > datetime.utcnow())
+            ).first()
+
+    def _save(self, scope, request_fingerprint, response, ttl):
+        records = self.records
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            # Expired rows are cleared as new ones are written
+            conn.execute(delete(records).where(records.c.expires_at <= now))
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(records.insert().values(
+                    scope=scope, fingerprint=request_fingerprint, response=response,
+                    created_at=now, expires_at=now + timedelta(seconds=ttl)
+                ))
+        except IntegrityError:
+            # Another worker finished the same request first; keep its response
+            pass
+
+    @staticmethod
+    def _mismatch(endpoint):
+        IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome="mismatch")
+        return HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    async def handle(self, endpoint, key, params, ingest, process, cacheable=lambda response: True):
+        """
+        Run one submission idempotently.
+
+        ingest() streams the upload to disk and returns the ingest_upload
+        dict; process(upload) does the work and returns the response.
+        Keyed requests are looked up before ingest; others after it, by
+        audio digest. cacheable(response) decides whether a response is
+        stored for replay.
+        """
+        keyed = bool(key)
+        upload = None
+        if keyed:
+            if len(key) > MAX_KEY_LENGTH:
+                raise HTTPException(status_code=400, detail=f"Idempotency-Key is longer than {MAX_KEY_LENGTH} characters")
+            scope = f"{endpoint}:key:{key}"
+            request_fingerprint = fingerprint(endpoint, params)
+            ttl = IDEMPOTENCY_TTL_SECONDS
+        else:
+            upload = await ingest()
+            request_fingerprint = fingerprint(endpoint, params, upload["sha256"])
+            scope = f"{endpoint}:content:{request_fingerprint}"
+            ttl = IDEMPOTENCY_CONTENT_TTL_SECONDS
+
+        def discard_upload():
+            if upload is not None:
+                # The retry's copy of the audio isn't needed
+                upload["path"].unlink(missing_ok=True)
+
+        pending = self._in_flight.get(scope)
+        if pending is not None:
+            pending_fingerprint, future = pending
+            if keyed and pending_fingerprint != request_fingerprint:
+                raise self._mismatch(endpoint)
+            IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome="coalesced")
+            discard_upload()
+            # shield: a client giving up must not cancel the first request's result
+            response = await asyncio.shield(future)
+            return JSONResponse(content=response, headers=REPLAY_HEADERS)
+
+        # Claim the scope before any await, so concurrent duplicates coalesce onto this request
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[scope] = (request_fingerprint, future)
+        try:
+            stored = await asyncio.to_thread(self._load, scope)
+            if stored is not None:
+                if keyed and stored.fingerprint != request_fingerprint:
+                    raise self._mismatch(endpoint)
+                IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome="replayed")
+                discard_upload()
+                future.set_result(stored.response)
+                return JSONResponse(content=stored.response, headers=REPLAY_HEADERS)
+
+            IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome="new")
+            if upload is None:
+                upload = await ingest()
+            response = await process(upload)
+            encoded = jsonable_encoder(response)
+            if cacheable(encoded):
+                try:
+                    await asyncio.to_thread(self._save, scope, request_fingerprint, encoded, ttl)
+                except Exception as e:
+                    logger.warning(f"Could not store idempotent response for {endpoint}: {e}")
+            future.set_result(encoded)
+            return response
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                e = HTTPException(status_code=503, detail="The original request was interrupted; please retry")
+            future.set_exception(e)
+            # Mark retrieved so an uncoalesced failure doesn't log "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(scope, None)
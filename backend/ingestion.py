@@ -0,0 +1,208 @@
+"""
+Upload ingestion for recorded audio.
+
+Uploads are streamed to AUDIO_DIR in chunks while a SHA-256 of the content
+is computed, so a request never holds the whole file in memory and an
+oversized upload is cut off as soon as it passes the byte limit. The
+container is identified from its first bytes (not the filename or the
+client's content type), and the clip duration is read from the container
+header, so unsupported, corrupt, oversized or overlong clips are rejected
+before any STT or analysis work is spent on them. Browser MediaRecorder
+WebM has no duration in its header; its length is then read from packet
+timestamps (ffprobe) or a decode cut off just past MAX_AUDIO_SECONDS
+(ffmpeg):
+
+    413  more than MAX_UPLOAD_BYTES
+    415  not a recognised audio container
+    422  empty, unreadable, longer than MAX_AUDIO_SECONDS, or of a length
+         that can't be determined
+
+Configuration:
+    MAX_UPLOAD_BYTES=26214400      (25 MB, Groq's transcription limit)
+    MAX_AUDIO_SECONDS=300
+    UPLOAD_CHUNK_BYTES=1048576
+"""
+import os
+import re
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import subprocess
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+MAX_AUDIO_SECONDS = float(os.getenv("MAX_AUDIO_SECONDS", "300"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Enough of the file to identify every supported container
+SNIFF_BYTES = 16
+
+UPLOADS_REJECTED = Counter(
+    "uploads_rejected_total", "Uploads rejected at ingestion by reason",
+    ["reason"]
+)
+
+
+def sniff_format(header):
+    """Audio container from the first bytes of a file, or None if unsupported"""
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[4:8] == b"ftyp":
+        return "mp4"
+    if header[:3] == b"ID3" or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def _packet_duration(ffprobe, path):
+    """End of the last audio packet, read from packet timestamps without decoding"""
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "a:0",
+         "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0", str(path)],
+        capture_output=True, text=True, timeout=10
+    )
+    end = None
+    for line in result.stdout.splitlines():
+        parts = [float(value) for value in line.split(",") if value not in ("", "N/A")]
+        if parts:
+            end = max(end or 0.0, sum(parts))
+    return end
+
+
+def _decoded_duration(ffmpeg, path):
+    """Length found by decoding, stopped just past MAX_AUDIO_SECONDS; raises ValueError if undecodable"""
+    result = subprocess.run(
+        [ffmpeg, "-nostdin", "-v", "error", "-i", str(path), "-map", "0:a:0",
+         "-t", f"{MAX_AUDIO_SECONDS + 1:g}", "-f", "null", "-", "-progress", "pipe:1"],
+        capture_output=True, text=True, timeout=30
+    )
+    if result.returncode != 0:
+        logger.info(f"Rejecting undecodable upload {path}: {result.stderr.strip()[:200]}")
+        raise ValueError("Audio file is corrupt or truncated (could not be decoded)")
+    times = re.findall(r"^out_time_us=(\d+)$", result.stdout, re.MULTILINE)
+    return int(times[-1]) / 1e6 if times else None
+
+
+def probe_duration(path, audio_format):
+    """
+    Clip duration in seconds (blocking; runs subprocesses).
+
+    libsndfile reads wav/flac/ogg/mp3 headers directly; other containers
+    (webm, mp4) need ffprobe. When the header has no duration, it is read
+    from packet timestamps, or found with a bounded ffmpeg decode when
+    ffprobe isn't installed. Returns None when there is no tool to
+    measure it; raises ValueError for a corrupt file.
+    """
+    if audio_format in ("wav", "flac", "ogg", "mp3"):
+        import soundfile
+        try:
+            info = soundfile.info(str(path))
+        except Exception as e:
+            if audio_format in ("wav", "flac"):
+                logger.info(f"Rejecting unreadable {audio_format} upload {path}: {e}")
+                raise ValueError(f"Audio file is corrupt or truncated (unreadable {audio_format} header)")
+        else:
+            return info.duration
+
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe:
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "json", str(path)],
+            capture_output=True, text=True, timeout=10
+        )
+        if result.returncode != 0:
+            logger.info(f"Rejecting unreadable {audio_format} upload {path}: {result.stderr.strip()[:200]}")
+            raise ValueError(f"Audio file is corrupt or truncated (unreadable {audio_format} file)")
+        duration = json.loads(result.stdout or "{}").get("format", {}).get("duration")
+        if duration not in (None, "N/A"):
+            return float(duration)
+        # Browser MediaRecorder WebM has no duration in its header
+        duration = _packet_duration(ffprobe, path)
+        if duration is not None:
+            return duration
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        return _decoded_duration(ffmpeg, path)
+    return None
+
+
+def _reject(status_code, reason, detail):
+    UPLOADS_REJECTED.inc(reason=reason)
+    raise HTTPException(status_code=status_code, detail=detail)
+
+
+async def ingest_upload(upload: UploadFile, dest_dir, file_id):
+    """
+    Stream an uploaded clip to dest_dir/<file_id>_<filename>, validating it on the way.
+
+    Returns {"path", "bytes", "sha256", "format", "duration"}. Raises
+    HTTPException (413, 415 or 422) and removes the partial file if the
+    upload is rejected.
+    """
+    filename = Path(upload.filename or "recording").name
+    final_path = Path(dest_dir) / f"{file_id}_{filename}"
+    partial_path = final_path.with_name(final_path.name + ".part")
+
+    digest = hashlib.sha256()
+    size = 0
+    audio_format = None
+    try:
+        with open(partial_path, "wb") as buffer:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if audio_format is None:
+                    audio_format = sniff_format(chunk[:SNIFF_BYTES])
+                    if audio_format is None:
+                        _reject(415, "unsupported_format",
+                                "Unsupported audio format; upload WAV, WebM, Ogg, FLAC, MP3 or MP4 audio")
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    _reject(413, "too_large",
+                            f"Audio file exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        if size == 0:
+            _reject(422, "empty", "Audio file is empty")
+
+        try:
+            # Off the event loop: probing may run ffprobe/ffmpeg
+            duration = await asyncio.to_thread(probe_duration, partial_path, audio_format)
+        except (ValueError, subprocess.TimeoutExpired) as e:
+            _reject(422, "corrupt", str(e))
+        if duration is None:
+            _reject(422, "unknown_duration", "Could not determine the recording's length")
+        if duration > MAX_AUDIO_SECONDS:
+            _reject(422, "too_long",
+                    f"Recording is {duration:.0f}s long; the limit is {MAX_AUDIO_SECONDS:.0f}s")
+
+        os.replace(partial_path, final_path)
+    except BaseException:
+        if partial_path.exists():
+            partial_path.unlink()
+        raise
+
+    return {
+        "path": final_path,
+        "bytes": size,
+        "sha256": digest.hexdigest(),
+        "format": audio_format,
+        "duration": duration
+    }
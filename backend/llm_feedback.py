@@ -2,6 +2,8 @@ import os
 from groq import Groq
 from dotenv import load_dotenv
 import json
+from metrics import track_groq_call, FALLBACKS
+from circuit_breaker import breakers, hedged, CircuitOpenError, GROQ_TIMEOUT_SECONDS, GROQ_MAX_RETRIES
 
 class LLMFeedbackGenerator:
     def __init__(self):
@@ -11,13 +13,22 @@ class LLMFeedbackGenerator:
         if not api_key:
             raise ValueError("Missing GROQ_API_KEY")
         
-        self.client = Groq(api_key=api_key)
+        self.client = Groq(api_key=api_key, timeout=GROQ_TIMEOUT_SECONDS, max_retries=GROQ_MAX_RETRIES)
         self.model = "llama-3.3-70b-versatile" 
+        # Small, fast model for background chat summaries
+        self.summary_model = os.getenv("CHAT_SUMMARY_MODEL", "llama-3.1-8b-instant")
+        # Optional callback(api, total_tokens) after each completion, for budget tracking
+        self.usage_hook = None
         print(" LLM Feedback Generator initialized!")
     
-    def generate_feedback(self, exercise_data):
+    def _record_usage(self, api, response):
+        usage = getattr(response, "usage", None)
+        if self.usage_hook and usage is not None:
+            self.usage_hook(api, usage.total_tokens)
+    
+    def generate_feedback(self, exercise_data, use_llm=True):
         """
-        Generate personalized feedback using LLM
+        Generate personalized feedback using LLM (rule-based when use_llm is False)
         
         Args:
             exercise_data: dict with keys:
@@ -29,9 +40,23 @@ class LLMFeedbackGenerator:
                 - previous_scores: list of past scores (optional)
         """
         
+        if not use_llm:
+            return self._fallback_feedback(exercise_data)
+        
         prompt = self._build_prompt(exercise_data)
         
         try:
+            # While the LLM circuit is open this fails at once instead of waiting on Groq
+            return hedged(breakers["llm_chat"], self._feedback_completion, prompt)
+        except CircuitOpenError:
+            return self._fallback_feedback(exercise_data)
+        except Exception as e:
+            print(f" LLM Error: {e}")
+            return self._fallback_feedback(exercise_data)
+    
+    def _feedback_completion(self, prompt):
+        """One feedback completion through the llm_chat breaker; raises on failure"""
+        with breakers["llm_chat"].guard(), track_groq_call("chat_feedback"):
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
@@ -58,13 +83,8 @@ Guidelines:
                 temperature=0.7,
                 max_tokens=200
             )
-            
-            feedback = response.choices[0].message.content.strip()
-            return feedback
-            
-        except Exception as e:
-            print(f" LLM Error: {e}")
-            return self._fallback_feedback(exercise_data)
+        self._record_usage("chat_feedback", response)
+        return response.choices[0].message.content.strip()
     
     def _build_prompt(self, data):
         """Build the prompt for the LLM"""
@@ -104,6 +124,7 @@ ANALYSIS:
     
     def _fallback_feedback(self, data):
         """Simple rule-based fallback if LLM fails"""
+        FALLBACKS.inc(kind="llm_feedback")
         accuracy = data.get("accuracy_score", 0)
         issues = data.get("issues", [])
         
@@ -116,9 +137,8 @@ ANALYSIS:
         else:
             return "Keep practicing! Focus on speaking clearly and taking your time with each word."
     
-    def generate_exercise_prompt(self, issue_type, difficulty="beginner", count=3):
-        """Generate custom exercise suggestions using LLM"""
-        
+    def request_exercises(self, issue_type, difficulty="beginner", count=3):
+        """Ask the LLM for exercise phrases; raises on failure"""
         prompts = {
             "lisp": "exercises for practicing 's' and 'z' sounds for someone with a lisp",
             "stuttering": "exercises for reducing stuttering and improving fluency",
@@ -128,7 +148,7 @@ ANALYSIS:
         
         prompt_type = prompts.get(issue_type, prompts["general"])
         
-        try:
+        with breakers["exercise_generation"].guard(), track_groq_call("exercise_generation"):
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
@@ -151,20 +171,76 @@ Guidelines:
                     }
                 ],
                 temperature=0.8,
-                max_tokens=300
+                max_tokens=max(300, 30 * count)
             )
-            
-            exercises = response.choices[0].message.content.strip().split('\n')
-            # Clean up any numbering or bullets that might slip through
-            exercises = [e.strip('0123456789.-) ').strip() for e in exercises if e.strip()]
-            # Filter out empty lines and return requested count
-            exercises = [e for e in exercises if len(e) > 10]  # Ensure meaningful phrases
-            return exercises[:count]
-            
-        except Exception as e:
-            print(f" Exercise generation failed: {e}")
-            return [
-                "The quick brown fox jumps over the lazy dog",
-                "She sells seashells by the seashore",
-                "Peter Piper picked a peck of pickled peppers"
-            ]
\ No newline at end of file
+        self._record_usage("exercise_generation", response)
+        
+        exercises = response.choices[0].message.content.strip().split('\n')
+        # Clean up any numbering or bullets that might slip through
+        exercises = [e.strip('0123456789.-) ').strip() for e in exercises if e.strip()]
+        # Filter out empty lines and return requested count
+        exercises = [e for e in exercises if len(e) > 10]  # Ensure meaningful phrases
+        return exercises[:count]
+    
+    def chat_reply(self, messages, max_tokens=300):
+        """One assistant reply for a prepared chat context"""
+        return hedged(breakers["llm_chat"], self._chat_completion, messages, max_tokens)
+    
+    def _chat_completion(self, messages, max_tokens):
+        with breakers["llm_chat"].guard(), track_groq_call("chat"):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+        self._record_usage("chat", response)
+        return response.choices[0].message.content.strip()
+    
+    def stream_chat_reply(self, messages, max_tokens=300):
+        """Yield the assistant reply for a prepared chat context as text deltas"""
+        with track_groq_call("chat_stream"):
+            # Only opening the stream goes through the breaker, so reply length doesn't count as latency
+            with breakers["llm_chat"].guard():
+                stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    stream=True
+                )
+            try:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+                    # Groq reports usage on the final chunk
+                    x_groq = getattr(chunk, "x_groq", None)
+                    if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                        self._record_usage("chat_stream", x_groq)
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+    
+    def summarize_conversation(self, summary, turns):
+        """Fold (role, content) turns into a conversation's running summary"""
+        transcript = "\n".join(f"{role}: {content}" for role, content in turns)
+        with breakers["llm_chat"].guard(), track_groq_call("chat_summary"):
+            response = self.client.chat.completions.create(
+                model=self.summary_model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Summarize this speech therapy chat for the assistant's memory. Keep the user's speech concerns, goals, exercises tried and advice already given. At most 120 words, plain prose."
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Existing summary: {summary or '(none)'}\n\nNew turns:\n{transcript}"
+                    }
+                ],
+                temperature=0.2,
+                max_tokens=200
+            )
+        self._record_usage("chat_summary", response)
+        return response.choices[0].message.content.strip()
@@ -1,19 +1,23 @@
 # main.py
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks, Form
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks, Form, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, Text
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Text, Index, func, select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import os
+import sys
 import json
 import uuid
-import shutil
 from pathlib import Path
 import asyncio
+import threading
 from contextlib import asynccontextmanager
 import logging
 import smtplib
@@ -35,16 +39,59 @@ else:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Local modules live next to this file
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from migrations import run_migrations
+from db_config import (
+    create_db_engine, create_async_db_engine, create_async_session_factory,
+    GroupCommitWriter, ReadSession, DB_GROUP_COMMIT, DB_ASYNC
+)
+from feature_store import FEATURE_COLUMNS, feature_row_values
+from baselines import apply_exercise, baseline_snapshot
+from analysis_pool import analyze_in_pool, shutdown_analysis_pool
+from admission import analysis_scheduler
+from circuit_breaker import breaker_states
+from quota import BudgetTracker, charge_to
+from idempotency import IdempotencyStore
+from ingestion import ingest_upload
+from http_cache import conditional_get, latest
+from exercise_pool import ExercisePool, EXERCISE_TYPES, EXERCISE_DIFFICULTIES, EXERCISE_POOL_PREFILL
+from chat import (
+    ConversationStore, build_chat_context, CHAT_MAX_REPLY_TOKENS, CHAT_MAX_MESSAGE_CHARS,
+    CHAT_FALLBACK_MESSAGE, CHAT_SUGGESTIONS, CHAT_FIRST_TOKEN_SECONDS
+)
+from metrics import (
+    MetricsMiddleware, StageTimer, FALLBACKS, render_metrics,
+    observe_analyzer_stage
+)
+
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./speech_therapy.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Optional async engine for the read endpoints (DB_ASYNC=1); writes stay on the sync engine
+async_engine = create_async_db_engine(DATABASE_URL) if DB_ASYNC else None
+AsyncSessionLocal = create_async_session_factory(async_engine) if async_engine else None
 Base = declarative_base()
 
 # Directory setup
 AUDIO_DIR = Path("audio_samples")
 AUDIO_DIR.mkdir(exist_ok=True)
 
+# Upper bound on clips accepted by one batch submission
+MAX_BATCH_CLIPS = int(os.getenv("MAX_BATCH_CLIPS", "20"))
+
+# Analysis profile per endpoint, e.g. ENDPOINT_ANALYSIS_PROFILES="analyze=fast,batch=standard";
+# other endpoints use ANALYSIS_PROFILE, and a request can pick its own with analysis_profile
+ENDPOINT_ANALYSIS_PROFILES = dict(
+    (part.strip() for part in item.split("=", 1))
+    for item in os.getenv("ENDPOINT_ANALYSIS_PROFILES", "").split(",") if "=" in item
+)
+
 # Models
 class User(Base):
     __tablename__ = "users"
@@ -61,6 +108,10 @@ class Session(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index("ix_sessions_user_id_created_at", "user_id", "created_at"),
+    )
+
 class Exercise(Base):
     __tablename__ = "exercises"
     id = Column(Integer, primary_key=True, index=True)
@@ -77,6 +128,42 @@ class Exercise(Base):
     audio_file_path = Column(String)
     duration = Column(Float)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    analyzer_version = Column(String)
+    # Bumped on every ORM update (e.g. re-analysis); the validator for conditional GETs
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_exercises_user_id_timestamp", "user_id", "timestamp"),
+        Index("ix_exercises_session_id_timestamp", "session_id", "timestamp"),
+    )
+
+class ExerciseFeatures(Base):
+    """Typed per-metric columns mirrored from Exercise.analysis for SQL aggregates"""
+    __tablename__ = "exercise_features"
+    id = Column(Integer, primary_key=True, index=True)
+    exercise_id = Column(String, unique=True, index=True)
+    user_id = Column(String)
+    session_id = Column(String)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    score = Column(Float)
+    accuracy = Column(Float)
+    duration = Column(Float)
+    pause_ratio = Column(Float)
+    speech_rate = Column(Float)
+    pitch_mean = Column(Float)
+    pitch_std = Column(Float)
+    pitch_variation = Column(Float)
+    lisp_likelihood = Column(Float)
+    sibilant_energy = Column(Float)
+    clarity_score = Column(Float)
+    breathiness_score = Column(Float)
+    f1_mean = Column(Float)
+    f2_mean = Column(Float)
+    vowel_clarity = Column(Float)
+
+    __table_args__ = (
+        Index("ix_exercise_features_user_id_timestamp", "user_id", "timestamp"),
+    )
 
 class Progress(Base):
     __tablename__ = "progress"
@@ -89,8 +176,94 @@ class Progress(Base):
     common_issues = Column(JSON)
     improvement_rate = Column(Float, default=0.0)
 
-# Create tables
+class UserBaseline(Base):
+    """Running per-metric statistics and recent scores for one user (see baselines.py)"""
+    __tablename__ = "user_baselines"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, unique=True, index=True)
+    exercise_count = Column(Integer, default=0)
+    stats = Column(JSON)            # {metric: [n, mean, m2]}
+    recent_scores = Column(JSON)    # newest first
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ExercisePoolItem(Base):
+    """A pre-generated exercise phrase (see exercise_pool.py)"""
+    __tablename__ = "exercise_pool"
+    id = Column(Integer, primary_key=True, index=True)
+    exercise_type = Column(String)
+    difficulty = Column(String)
+    text = Column(Text)
+    normalized = Column(Text)   # lower-cased words, for duplicate detection
+    served_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_exercise_pool_type_difficulty_served", "exercise_type", "difficulty", "served_count"),
+    )
+
+class ExercisePoolSeen(Base):
+    """A pooled exercise already served to a user"""
+    __tablename__ = "exercise_pool_seen"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String)
+    pool_exercise_id = Column(Integer)
+    seen_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_exercise_pool_seen_user_id_pool_exercise_id", "user_id", "pool_exercise_id", unique=True),
+    )
+
+class ChatConversation(Base):
+    """A chat assistant conversation and its running summary (see chat.py)"""
+    __tablename__ = "chat_conversations"
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(String, unique=True, index=True)
+    user_id = Column(String, index=True, nullable=True)
+    summary = Column(Text, nullable=True)
+    summarized_through = Column(Integer, default=0)    # last chat_messages.id folded into summary
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ChatTurn(Base):
+    __tablename__ = "chat_messages"
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(String)
+    role = Column(String)       # user | assistant
+    content = Column(Text)
+    tokens = Column(Integer)    # estimated
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_chat_messages_conversation_id_id", "conversation_id", "id"),
+    )
+
+class ApiUsage(Base):
+    """Groq usage per UTC day, user and resource (see quota.py)"""
+    __tablename__ = "api_usage"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(String)            # YYYY-MM-DD
+    user_id = Column(String)        # "" for usage not attributed to a user
+    resource = Column(String)       # audio_seconds | llm_tokens
+    amount = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_api_usage_day_user_id_resource", "day", "user_id", "resource", unique=True),
+    )
+
+class IdempotencyRecord(Base):
+    """Stored response of a completed submission, replayed to retries (see idempotency.py)"""
+    __tablename__ = "idempotency_records"
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String, unique=True, index=True)    # endpoint + Idempotency-Key or content digest
+    fingerprint = Column(String)
+    response = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
+# Create tables, then bring existing databases up to the current schema
 Base.metadata.create_all(bind=engine)
+run_migrations(engine, Base.metadata)
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -157,6 +330,8 @@ class ProgressResponse(BaseModel):
 class CustomExerciseRequest(BaseModel):
     exercise_type: str = Field(..., description="lisp, stuttering, or general")
     count: int = Field(3, ge=1, le=10)
+    difficulty: str = "beginner"
+    user_id: Optional[str] = None
 
 class ContactMessage(BaseModel):
     name: Optional[str] = ""
@@ -164,13 +339,71 @@ class ContactMessage(BaseModel):
     message: str
     user_id: Optional[str] = None
 
+# Group-commit writer for Exercise inserts (enabled with DB_GROUP_COMMIT=1)
+exercise_writer = GroupCommitWriter(SessionLocal) if DB_GROUP_COMMIT else None
+
 # Lifespan context manager
+# Startup warm-up: /health reports ready once it has finished
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1").lower() in ("1", "true", "yes")
+startup_state = {"ready": not WARMUP_ON_STARTUP, "report": {}}
+
+def run_startup_warmup():
+    """Import heavy libraries, create the modules and push a synthetic clip through analysis"""
+    from warmup import import_heavy_modules, warm_analyzer
+    report = startup_state["report"]
+    started = time.perf_counter()
+    report["imports"] = import_heavy_modules()
+    
+    modules = get_modules()
+    module_seconds, module_errors = {}, {}
+    for name in ("analyzer", "stt", "llm"):
+        start = time.perf_counter()
+        try:
+            modules[name]
+        except Exception as e:
+            module_errors[name] = str(getattr(e, "detail", e))
+        module_seconds[name] = round(time.perf_counter() - start, 3)
+    report["module_init_seconds"] = module_seconds
+    if module_errors:
+        report["module_errors"] = module_errors
+    
+    if "analyzer" not in module_errors:
+        # A private analyzer, so requests served meanwhile keep the shared one's cache and stage metrics
+        report["analysis_stages"] = warm_analyzer()
+    report["warmup_seconds"] = round(time.perf_counter() - started, 3)
+
+async def warm_up():
+    try:
+        await asyncio.to_thread(run_startup_warmup)
+    except Exception as e:
+        logger.warning(f"Warm-up failed, serving cold: {e}")
+        startup_state["report"]["warmup_error"] = str(e)
+    startup_state["ready"] = True
+    startup_state["report"]["ready_seconds"] = round(time.perf_counter() - _import_started, 3)
+    logger.info(f"Startup report: {json.dumps(startup_state['report'])}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Speech Therapy Assistant API")
+    startup_state["report"]["app_import_seconds"] = round(time.perf_counter() - _import_started, 3)
+    if exercise_writer:
+        await exercise_writer.start()
+    warmup_task = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    prefill_task = asyncio.create_task(exercise_pool.prefill()) if EXERCISE_POOL_PREFILL else None
     yield
     # Shutdown
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if prefill_task and not prefill_task.done():
+        prefill_task.cancel()
+    await exercise_pool.stop()
+    await chat_store.stop()
+    if exercise_writer:
+        await exercise_writer.stop()
+    if async_engine:
+        await async_engine.dispose()
+    shutdown_analysis_pool()
     logger.info("Shutting down Speech Therapy Assistant API")
 
 # FastAPI app
@@ -193,6 +426,9 @@ app.add_middleware(
     max_age=86400,  # Cache preflight for 24 hours
 )
 
+# Request latency and in-flight metrics for /metrics
+app.add_middleware(MetricsMiddleware)
+
 
 
 # Dependency
@@ -203,34 +439,229 @@ def get_db():
     finally:
         db.close()
 
+async def get_read_db():
+    """Read-only session for query endpoints: async engine when DB_ASYNC=1, else sync on a worker thread"""
+    if AsyncSessionLocal:
+        async with AsyncSessionLocal() as session:
+            yield ReadSession(session, is_async=True)
+    else:
+        db = SessionLocal()
+        try:
+            yield ReadSession(db, is_async=False)
+        finally:
+            db.close()
+
+def analyzer_version_for(analysis):
+    """
+    ANALYZER_VERSION for a full analysis; None for fallback results and a
+    profile-qualified version (e.g. "1.1+fast") for partial profiles, so
+    re-analysis picks both up and fills in the skipped sections
+    """
+    if not analysis or "error" in analysis or analysis.get("fallback"):
+        return None
+    from voice_analysis import ANALYZER_VERSION
+    profile = analysis.get("profile", "full")
+    if profile != "full":
+        return f"{ANALYZER_VERSION}+{profile}"
+    return ANALYZER_VERSION
+
+def resolve_analysis_profile(endpoint, requested=None):
+    """Analysis profile for a request: its own choice, else the endpoint's, else ANALYSIS_PROFILE"""
+    from voice_analysis import ANALYSIS_PROFILES, DEFAULT_ANALYSIS_PROFILE
+    profile = requested or ENDPOINT_ANALYSIS_PROFILES.get(endpoint) or DEFAULT_ANALYSIS_PROFILE
+    if profile not in ANALYSIS_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown analysis_profile '{profile}'; expected one of: {', '.join(ANALYSIS_PROFILES)}"
+        )
+    return profile
+
+# Striped locks serializing each user's baseline read-modify-write within this process
+_baseline_locks = [asyncio.Lock() for _ in range(64)]
+
+def get_user_baseline(db: Session, user_id: str):
+    """(previous scores newest first, baseline snapshot for diagnose) from the user's baseline row"""
+    baseline = db.query(UserBaseline).filter(UserBaseline.user_id == user_id).first()
+    if baseline is None:
+        return [], {}
+    return list(baseline.recent_scores or []), baseline_snapshot(baseline.stats)
+
+async def record_baseline(db: Session, user_id: str, feature_values: List[Dict[str, Any]]):
+    """
+    Fold newly saved exercises into the user's baseline. The baseline is
+    derived data (rebuilt by migrations and reanalyze.py), so a failure is
+    logged rather than failing the request.
+    """
+    async with _baseline_locks[hash(user_id) % len(_baseline_locks)]:
+        try:
+            baseline = db.query(UserBaseline).filter(UserBaseline.user_id == user_id).first()
+            if baseline is None:
+                baseline = UserBaseline(user_id=user_id, exercise_count=0)
+                db.add(baseline)
+            # Fresh objects so the JSON columns are seen as modified
+            stats = {metric: list(values) for metric, values in (baseline.stats or {}).items()}
+            recent_scores = list(baseline.recent_scores or [])
+            for values in feature_values:
+                apply_exercise(stats, recent_scores, values)
+            baseline.stats = stats
+            baseline.recent_scores = recent_scores
+            baseline.exercise_count = (baseline.exercise_count or 0) + len(feature_values)
+            baseline.updated_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not update baseline for user {user_id}: {e}")
+
+async def save_exercise(db: Session, db_exercise: Exercise) -> Exercise:
+    """
+    Insert an Exercise row and its exercise_features row in one transaction,
+    through the group-commit writer when enabled
+    """
+    if db_exercise.timestamp is None:
+        db_exercise.timestamp = datetime.utcnow()
+    if db_exercise.analyzer_version is None:
+        db_exercise.analyzer_version = analyzer_version_for(db_exercise.analysis)
+    feature_values = feature_row_values(db_exercise)
+    db_features = ExerciseFeatures(**feature_values)
+    
+    if exercise_writer:
+        db_exercise = await exercise_writer.add(db_exercise, db_features)
+        await record_baseline(db, db_exercise.user_id, [feature_values])
+        return db_exercise
+    
+    db.add_all([db_exercise, db_features])
+    db.commit()
+    db.refresh(db_exercise)
+    await record_baseline(db, db_exercise.user_id, [feature_values])
+    return db_exercise
+
+def _create_analyzer():
+    from voice_analysis import VoiceAnalyzer
+    from analysis_cache import get_analysis_cache
+    analyzer = VoiceAnalyzer()
+    analyzer.stage_hook = observe_analyzer_stage
+    analyzer.cache = get_analysis_cache()
+    return analyzer
+
+def _create_audio_capture():
+    from audio_capture import AudioCapture
+    return AudioCapture()
+
+def _create_stt():
+    from stt_module import SpeechToText
+    stt = SpeechToText()
+    # A hedged Groq call that loses to the local engine is still billed
+    stt.usage_hook = budget_tracker.record_audio
+    return stt
+
+def _create_tts():
+    from tts_module import TextToSpeech
+    return TextToSpeech()
+
+def _create_llm():
+    from llm_feedback import LLMFeedbackGenerator
+    llm = LLMFeedbackGenerator()
+    llm.usage_hook = lambda api, tokens: budget_tracker.record_tokens(tokens)
+    return llm
+
+class LazyModules:
+    """
+    Module instances, each imported and created on first access so that
+    endpoints which only need the LLM or STT don't import librosa
+    """
+    factories = {
+        'audio_capture': _create_audio_capture,
+        'stt': _create_stt,
+        'analyzer': _create_analyzer,
+        'tts': _create_tts,
+        'llm': _create_llm
+    }
+    
+    def __init__(self):
+        self._instances = {}
+        self._lock = threading.Lock()
+    
+    def __getitem__(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                try:
+                    start = time.perf_counter()
+                    self._instances[name] = self.factories[name]()
+                    logger.info(f"Initialized module '{name}' in {time.perf_counter() - start:.2f}s")
+                except Exception as e:
+                    logger.error(f"Failed to import modules: {e}")
+                    raise HTTPException(status_code=500, detail=f"Module initialization failed: {str(e)}")
+            return self._instances[name]
+
+# Module instances are created on first use and shared by later requests
+_modules = None
+
 # Import modules with error handling
 def get_modules():
     """Lazy load modules to handle import errors gracefully"""
-    try:
-        import sys
-        import os
-        
-        # Add backend directory to path if not already there
-        backend_dir = os.path.dirname(os.path.abspath(__file__))
-        if backend_dir not in sys.path:
-            sys.path.insert(0, backend_dir)
-        
-        from audio_capture import AudioCapture
-        from stt_module import SpeechToText
-        from voice_analysis import VoiceAnalyzer
-        from tts_module import TextToSpeech
-        from llm_feedback import LLMFeedbackGenerator
-        
-        return {
-            'audio_capture': AudioCapture(),
-            'stt': SpeechToText(),
-            'analyzer': VoiceAnalyzer(),
-            'tts': TextToSpeech(),
-            'llm': LLMFeedbackGenerator()
-        }
-    except Exception as e:
-        logger.error(f"Failed to import modules: {e}")
-        raise HTTPException(status_code=500, detail=f"Module initialization failed: {str(e)}")
+    global _modules
+    if _modules is None:
+        _modules = LazyModules()
+    return _modules
+
+# Daily Groq audio-second and token budget, shared through the api_usage table
+budget_tracker = BudgetTracker(engine, Base.metadata)
+
+def _seconds_until_utc_midnight():
+    now = datetime.utcnow()
+    return int((datetime(now.year, now.month, now.day) + timedelta(days=1) - now).total_seconds()) + 1
+
+def transcribe_within_budget(stt, file_path, user_id: Optional[str] = None, seconds: Optional[float] = None):
+    """
+    Transcribe on Groq while the audio budget lasts, on the local engine
+    (if configured) once it runs low, and refuse with 429 once it is spent
+    """
+    route = budget_tracker.stt_route(user_id, has_local=getattr(stt, "has_local", False), seconds=seconds)
+    if route == "deny":
+        raise HTTPException(
+            status_code=429,
+            detail="Today's transcription budget is used up; please try again tomorrow",
+            headers={"Retry-After": str(_seconds_until_utc_midnight())}
+        )
+    with charge_to(user_id):
+        transcription = stt.transcribe(str(file_path), local_only=(route == "local"))
+    if transcription.get("engine") == "groq":
+        if seconds is None:
+            # MediaRecorder WebM has no duration in its header; bill the length Groq decoded
+            from stt_module import clip_duration
+            seconds = transcription.get("duration") or clip_duration(str(file_path))
+        budget_tracker.record_audio(seconds, user_id)
+    return transcription
+
+def feedback_within_budget(llm, exercise_data: Dict[str, Any], user_id: Optional[str] = None):
+    """LLM feedback charged to user_id, or the rule-based fallback while the token budget is low"""
+    with charge_to(user_id):
+        return llm.generate_feedback(exercise_data, use_llm=budget_tracker.allow_llm("feedback", user_id))
+
+def _generate_pool_exercises(exercise_type, difficulty, count):
+    if not budget_tracker.allow_llm("exercise_generation"):
+        raise RuntimeError("LLM token budget is low; exercise refill postponed")
+    return get_modules()['llm'].request_exercises(exercise_type, difficulty, count)
+
+# Stored and in-flight submission responses, for replaying retries
+idempotency_store = IdempotencyStore(engine, Base.metadata)
+
+# Pre-generated exercises for /api/exercises/generate; the LLM only runs in background refills
+exercise_pool = ExercisePool(engine, Base.metadata, _generate_pool_exercises)
+
+async def serve_exercises(exercise_type: str, difficulty: str, count: int, user_id: Optional[str] = None):
+    """Exercises from the pool for one request; unknown types use the general pool"""
+    if difficulty not in EXERCISE_DIFFICULTIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown difficulty '{difficulty}'; expected one of: {', '.join(EXERCISE_DIFFICULTIES)}"
+        )
+    if exercise_type not in EXERCISE_TYPES:
+        exercise_type = "general"
+    return await exercise_pool.get_exercises(exercise_type, difficulty, max(1, min(count, 10)), user_id)
 
 # Root endpoint
 @app.get("/")
@@ -244,15 +675,30 @@ async def root():
 
 # Health check
 @app.get("/health")
-async def health_check():
-    """Check API health status"""
+async def health_check(response: Response):
+    """Check API health status and external-call circuit breakers; 503 until startup warm-up has finished"""
+    ready = startup_state["ready"]
+    if not ready:
+        response.status_code = 503
     return {
-        "status": "healthy",
+        "status": "ready" if ready else "warming_up",
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0",
-        "cors": "enabled"
+        "cors": "enabled",
+        "startup": startup_state["report"],
+        "circuit_breakers": breaker_states()
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus-format metrics for this worker process"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/quota")
+async def get_quota(user_id: Optional[str] = None):
+    """Today's Groq audio-second and LLM-token budget: limits, usage, remaining, and whether calls are being shed"""
+    return await asyncio.to_thread(budget_tracker.report, user_id)
+
 # Contact Us - Send message via email
 @app.post("/api/contact/send")
 async def send_contact_message(payload: ContactMessage):
@@ -336,11 +782,16 @@ async def start_exercise(request: dict, db: Session = Depends(get_db)):
 async def submit_exercise(
     audio: UploadFile = File(...),
     exercise_text: str = Form(""),
+    analysis_profile: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Submit audio for exercise and get feedback - Frontend compatible endpoint
     
+    Optional analysis_profile (fast / standard / full) limits which analysis stages run.
+    A retry with the same Idempotency-Key header (or the same audio, without one)
+    gets the first response back instead of being processed again.
     Returns: SessionResponse with feedback and score
     """
     try:
@@ -348,130 +799,156 @@ async def submit_exercise(
         
         if not exercise_text:
             raise HTTPException(status_code=400, detail="exercise_text is required")
+        profile = resolve_analysis_profile("submit", analysis_profile)
         
+        timer = StageTimer("submit")
         logger.info("Loading modules...")
         modules = get_modules()
         logger.info("Modules loaded successfully")
+        timer.mark("setup")
         
-        # Save uploaded file
-        logger.info("Saving audio file...")
-        file_id = str(uuid.uuid4())
-        file_path = AUDIO_DIR / f"{file_id}_{audio.filename}"
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
-        logger.info(f"Audio saved to: {file_path}")
-        
-        # Transcribe audio
-        logger.info("Transcribing audio...")
-        transcription = modules['stt'].transcribe(str(file_path))
-        logger.info(f"Transcription result: {transcription}")
-        
-        if not transcription or not transcription.get("text"):
-            logger.warning("Transcription failed or returned empty text")
-            return {
-                "status": "error",
-                "message": "Could not transcribe audio. Please try again.",
-                "data": None
-            }
-        
-        # Analyze audio
-        logger.info("Analyzing audio...")
-        try:
-            analysis = modules['analyzer'].analyze_audio(str(file_path), transcription)
-            logger.info(f"Analysis complete: {list(analysis.keys())}")
+        async def ingest():
+            # Refuse before the upload is read if analysis is already backed up
+            analysis_scheduler.check("interactive")
             
-            if "error" in analysis:
-                logger.warning(f"Audio analysis had issues: {analysis['error']}")
+            # Save uploaded file
+            logger.info("Saving audio file...")
+            file_id = str(uuid.uuid4())
+            upload = await ingest_upload(audio, AUDIO_DIR, file_id)
+            logger.info(f"Audio saved to: {upload['path']} ({upload['bytes']} bytes, {upload['format']}, sha256 {upload['sha256'][:12]})")
+            timer.mark("upload")
+            return upload
+        
+        async def process(upload):
+            file_path = upload["path"]
+            
+            # Transcribe audio
+            logger.info("Transcribing audio...")
+            transcription = await asyncio.to_thread(transcribe_within_budget, modules['stt'], file_path, seconds=upload["duration"])
+            logger.info(f"Transcription result: {transcription}")
+            timer.mark("stt")
+            
+            if not transcription or not transcription.get("text"):
+                logger.warning("Transcription failed or returned empty text")
+                return {
+                    "status": "error",
+                    "message": "Could not transcribe audio. Please try again.",
+                    "data": None
+                }
+            
+            # Analyze audio, then diagnose, holding an analysis slot
+            async with analysis_scheduler.slot("interactive"):
+                timer.mark("queue")
+                logger.info("Analyzing audio...")
+                try:
+                    analysis = await asyncio.to_thread(
+                        modules['analyzer'].analyze_audio, str(file_path), transcription, profile=profile
+                    )
+                    logger.info(f"Analysis complete: {list(analysis.keys())}")
                 
-        except Exception as e:
-            logger.warning(f"Audio analysis failed, using fallback: {e}")
-            # Use basic fallback analysis
-            analysis = {
-                "duration": 1.0,
-                "pitch_mean": 150.0,
-                "pitch_std": 20.0,
-                "speech_rate": 2.5,
-                "pause_count": 1,
-                "clarity_score": 0.7,
-                "volume_mean": 0.5,
-                "volume_std": 0.1,
-                "fallback": True
-            }
-        
-        # Diagnose
-        logger.info("Running diagnosis...")
-        try:
-            diagnosis = modules['analyzer'].diagnose(
-                analysis,
-                transcription,
-                expected_text=exercise_text
+                    if "error" in analysis:
+                        FALLBACKS.inc(kind="analysis")
+                        logger.warning(f"Audio analysis had issues: {analysis['error']}")
+                    
+                except Exception as e:
+                    FALLBACKS.inc(kind="analysis")
+                    logger.warning(f"Audio analysis failed, using fallback: {e}")
+                    # Use basic fallback analysis
+                    analysis = {
+                        "duration": 1.0,
+                        "pitch_mean": 150.0,
+                        "pitch_std": 20.0,
+                        "speech_rate": 2.5,
+                        "pause_count": 1,
+                        "clarity_score": 0.7,
+                        "volume_mean": 0.5,
+                        "volume_std": 0.1,
+                        "fallback": True
+                    }
+                timer.mark("analysis")
+                
+                # Diagnose
+                logger.info("Running diagnosis...")
+                try:
+                    diagnosis = await asyncio.to_thread(
+                        modules['analyzer'].diagnose,
+                        analysis,
+                        transcription,
+                        expected_text=exercise_text
+                    )
+                    logger.info(f"Diagnosis complete: score={diagnosis.get('score', 0)}")
+                except Exception as e:
+                    FALLBACKS.inc(kind="diagnosis")
+                    logger.warning(f"Diagnosis failed, using basic results: {e}")
+                    # Basic diagnosis fallback
+                    diagnosis = {
+                        "score": 70,
+                        "accuracy": 0.7,
+                        "issues": ["Audio analysis unavailable"],
+                        "suggestions": ["Try recording in a quieter environment"]
+                    }
+                timer.mark("diagnose")
+            
+            # Generate feedback
+            llm_feedback = await asyncio.to_thread(feedback_within_budget, modules['llm'], {
+                "expected_text": exercise_text,
+                "actual_text": transcription['text'],
+                "accuracy_score": diagnosis.get('accuracy', 0),
+                "issues": diagnosis['issues'],
+                "analysis": analysis,
+                "previous_scores": []
+            })
+            timer.mark("llm")
+            
+            # Save to database
+            exercise_id = str(uuid.uuid4())
+            db_exercise = Exercise(
+                exercise_id=exercise_id,
+                session_id="anonymous_session",
+                user_id="anonymous",
+                exercise_text=exercise_text,
+                transcription=transcription['text'],
+                score=diagnosis['score'],
+                accuracy=diagnosis.get('accuracy', 0),
+                issues=diagnosis['issues'],
+                analysis=analysis,
+                llm_feedback=llm_feedback,
+                audio_file_path=str(file_path),
+                duration=float(duration) if (duration := analysis.get('duration')) else 0.0
             )
-            logger.info(f"Diagnosis complete: score={diagnosis.get('score', 0)}")
-        except Exception as e:
-            logger.warning(f"Diagnosis failed, using basic results: {e}")
-            # Basic diagnosis fallback
-            diagnosis = {
-                "score": 70,
-                "accuracy": 0.7,
-                "issues": ["Audio analysis unavailable"],
-                "suggestions": ["Try recording in a quieter environment"]
+            
+            await save_exercise(db, db_exercise)
+            timer.mark("db_commit")
+            
+            logger.info(f"Submitted exercise: {exercise_id}")
+            
+            # Prepare enhanced analysis for frontend
+            enhanced_analysis = {
+                **analysis,
+                "component_scores": diagnosis.get("component_scores", {}),
+                "lisp_analysis": diagnosis.get("lisp_analysis", {}),
+                "suggestions": diagnosis.get("suggestions", [])
+            }
+            
+            return {
+                "status": "success",
+                "data": {
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "exercise": exercise_text,
+                    "transcription": transcription['text'],
+                    "score": diagnosis['score'],
+                    "accuracy": diagnosis.get('accuracy', 0),
+                    "issues": diagnosis['issues'],
+                    "analysis": enhanced_analysis,
+                    "llm_feedback": llm_feedback
+                },
+                "feedback": llm_feedback
             }
         
-        # Generate feedback
-        llm_feedback = modules['llm'].generate_feedback({
-            "expected_text": exercise_text,
-            "actual_text": transcription['text'],
-            "accuracy_score": diagnosis.get('accuracy', 0),
-            "issues": diagnosis['issues'],
-            "analysis": analysis,
-            "previous_scores": []
-        })
-        
-        # Save to database
-        exercise_id = str(uuid.uuid4())
-        db_exercise = Exercise(
-            exercise_id=exercise_id,
-            session_id="anonymous_session",
-            user_id="anonymous",
-            exercise_text=exercise_text,
-            transcription=transcription['text'],
-            score=diagnosis['score'],
-            accuracy=diagnosis.get('accuracy', 0),
-            issues=diagnosis['issues'],
-            analysis=analysis,
-            llm_feedback=llm_feedback,
-            audio_file_path=str(file_path),
-            duration=float(duration) if (duration := analysis.get('duration')) else 0.0
+        return await idempotency_store.handle(
+            "submit", idempotency_key, {"exercise_text": exercise_text, "analysis_profile": profile},
+            ingest, process, cacheable=lambda response: response.get("status") == "success"
         )
-        
-        db.add(db_exercise)
-        db.commit()
-        
-        logger.info(f"Submitted exercise: {exercise_id}")
-        
-        # Prepare enhanced analysis for frontend
-        enhanced_analysis = {
-            **analysis,
-            "component_scores": diagnosis.get("component_scores", {}),
-            "lisp_analysis": diagnosis.get("lisp_analysis", {}),
-            "suggestions": diagnosis.get("suggestions", [])
-        }
-        
-        return {
-            "status": "success",
-            "data": {
-                "timestamp": datetime.utcnow().isoformat(),
-                "exercise": exercise_text,
-                "transcription": transcription['text'],
-                "score": diagnosis['score'],
-                "accuracy": diagnosis.get('accuracy', 0),
-                "issues": diagnosis['issues'],
-                "analysis": enhanced_analysis,
-                "llm_feedback": llm_feedback
-            },
-            "feedback": llm_feedback
-        }
     
     except HTTPException:
         raise
@@ -485,17 +962,27 @@ async def submit_exercise(
 
 
 @app.get("/api/sessions/history")
-async def get_sessions_history(db: Session = Depends(get_db)):
+async def get_sessions_history(request: Request, response: Response, db: ReadSession = Depends(get_read_db)):
     """
     Get session history - Frontend compatible endpoint
     
-    Returns: List of ExerciseResult objects
+    Returns: List of ExerciseResult objects (304 if unchanged since the client's ETag)
     """
     try:
+        # Validator: how many anonymous exercises there are and when one last changed
+        count, last_modified = await db.one(
+            select(func.count(Exercise.id), func.max(Exercise.updated_at)).where(Exercise.user_id == "anonymous")
+        )
+        not_modified = conditional_get(request, response, "history", last_modified, count, last_modified)
+        if not_modified:
+            return not_modified
+        
         # Get all exercises for anonymous user (or specific user if authenticated)
-        exercises = db.query(Exercise).filter(
-            Exercise.user_id == "anonymous"
-        ).order_by(Exercise.timestamp.desc()).all()
+        exercises = await db.scalars(
+            select(Exercise).where(
+                Exercise.user_id == "anonymous"
+            ).order_by(Exercise.timestamp.desc())
+        )
         
         results = []
         for ex in exercises:
@@ -572,67 +1059,154 @@ async def save_sessions(db: Session = Depends(get_db)):
 # ============================================================================
 
 class ChatMessage(BaseModel):
-    message: str
+    message: str = Field(..., max_length=CHAT_MAX_MESSAGE_CHARS)
+    conversation_id: Optional[str] = None
+    user_id: Optional[str] = None
+    stream: bool = False
+
+def _summarize_chat(summary, turns):
+    if not budget_tracker.allow_llm("chat_summary"):
+        raise RuntimeError("LLM token budget is low; summary postponed")
+    return get_modules()['llm'].summarize_conversation(summary, turns)
+
+# Conversation history for /api/chat; summaries of old turns use the small model
+chat_store = ConversationStore(engine, Base.metadata, _summarize_chat)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_chat_reply(conversation_id: str, message: str, messages: List[Dict[str, str]], started: float,
+                             user_id: Optional[str] = None):
+    """
+    Server-sent events for one streamed reply: "start" with the
+    conversation_id, a "delta" per text chunk, then "done" with the whole
+    reply (or "error" with the fallback message)
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+    
+    def produce():
+        # Runs on a worker thread; the Groq stream is a blocking iterator
+        try:
+            if not budget_tracker.allow_llm("chat", user_id):
+                raise RuntimeError("LLM token budget is used up")
+            with charge_to(user_id):
+                for delta in get_modules()['llm'].stream_chat_reply(messages, CHAT_MAX_REPLY_TOKENS):
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, ("delta", delta))
+            loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+    
+    parts = []
+    try:
+        yield _sse("start", {"conversation_id": conversation_id})
+        loop.run_in_executor(None, produce)
+        while True:
+            kind, value = await queue.get()
+            if kind == "error":
+                raise value
+            if kind == "end":
+                break
+            if not parts:
+                CHAT_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, mode="stream")
+            parts.append(value)
+            yield _sse("delta", {"text": value})
+        
+        reply = "".join(parts).strip()
+        history_tokens = await asyncio.to_thread(
+            chat_store.append, conversation_id, [("user", message), ("assistant", reply)]
+        )
+        chat_store.schedule_summary(conversation_id, history_tokens)
+        yield _sse("done", {"message": reply, "suggestions": CHAT_SUGGESTIONS, "conversation_id": conversation_id})
+    except Exception as e:
+        logger.error(f"Chat stream error: {e}")
+        FALLBACKS.inc(kind="chat")
+        yield _sse("error", {"message": CHAT_FALLBACK_MESSAGE, "suggestions": [], "conversation_id": conversation_id})
+    finally:
+        # Also reached when the client disconnects mid-reply
+        cancelled.set()
+        chat_store.release(conversation_id)
 
 @app.post("/api/chat")
-async def chat_with_assistant(chat: ChatMessage):
+async def chat_with_assistant(chat: ChatMessage, request: Request):
     """
     Chat with the AI speech therapy assistant
     Uses the same Groq API for conversational help
+    
+    Pass the returned conversation_id with later messages to continue the
+    conversation. With "stream": true (or Accept: text/event-stream) the
+    reply is sent as server-sent events as it is generated.
     """
+    started = time.perf_counter()
+    opened = await asyncio.to_thread(chat_store.open, chat.conversation_id, chat.user_id)
+    if opened is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    conversation_id, summary, turns = opened
+    
+    if not chat_store.acquire(conversation_id):
+        raise HTTPException(
+            status_code=429,
+            detail="A reply is already being generated for this conversation",
+            headers={"Retry-After": "1"}
+        )
+    messages = build_chat_context(summary, turns, chat.message)
+    
+    if chat.stream or "text/event-stream" in request.headers.get("accept", ""):
+        # The stream releases the conversation's slot when it ends
+        return StreamingResponse(
+            _stream_chat_reply(conversation_id, chat.message, messages, started, chat.user_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
     try:
-        from groq import Groq
-        
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="API key not configured")
-        
-        client = Groq(api_key=api_key)
-        
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are Whiskers, a friendly and knowledgeable AI cat assistant 🐱 specialized in speech therapy. 
-You help users understand their speech concerns and guide them to the right exercises.
-
-Your personality:
-- Warm, encouraging, and supportive
-- Use occasional cat-related expressions (meow, purr-fect, etc.) but don't overdo it
-- Keep responses concise (2-4 sentences usually)
-- Be empathetic about speech difficulties
-- Provide practical, actionable advice
-
-You can help with:
-- Explaining different speech conditions (lisp, stuttering, articulation issues)
-- Recommending which exercises to try
-- Providing tips for speech improvement
-- Answering questions about speech therapy
-- Motivating and encouraging users
-
-Always remind users that while you can provide guidance, consulting with a professional speech therapist is important for personalized treatment."""
-                },
-                {
-                    "role": "user",
-                    "content": chat.message
-                }
-            ],
-            temperature=0.7,
-            max_tokens=300
+        if not budget_tracker.allow_llm("chat", chat.user_id):
+            raise RuntimeError("LLM token budget is used up")
+        with charge_to(chat.user_id):
+            reply = await asyncio.to_thread(get_modules()['llm'].chat_reply, messages, CHAT_MAX_REPLY_TOKENS)
+        CHAT_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, mode="blocking")
+        history_tokens = await asyncio.to_thread(
+            chat_store.append, conversation_id, [("user", chat.message), ("assistant", reply)]
         )
+        chat_store.schedule_summary(conversation_id, history_tokens)
         
         return {
-            "message": response.choices[0].message.content.strip(),
-            "suggestions": ["Try an exercise", "Learn more", "Track progress"]
+            "message": reply,
+            "suggestions": CHAT_SUGGESTIONS,
+            "conversation_id": conversation_id
         }
         
     except Exception as e:
         logger.error(f"Chat error: {e}")
+        FALLBACKS.inc(kind="chat")
         return {
-            "message": "Meow... 😿 I'm having a bit of trouble right now. Please try again in a moment!",
-            "suggestions": []
+            "message": CHAT_FALLBACK_MESSAGE,
+            "suggestions": [],
+            "conversation_id": conversation_id
         }
+    finally:
+        chat_store.release(conversation_id)
+
+@app.get("/api/chat/{conversation_id}")
+async def get_conversation(conversation_id: str):
+    """Full message history of a chat conversation"""
+    found = await asyncio.to_thread(chat_store.history, conversation_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    conversation, turns = found
+    return {
+        "conversation_id": conversation.conversation_id,
+        "user_id": conversation.user_id,
+        "summary": conversation.summary,
+        "created_at": conversation.created_at,
+        "messages": [
+            {"role": turn.role, "content": turn.content, "created_at": turn.created_at}
+            for turn in turns
+        ]
+    }
 
 # ============================================================================
 # USER & SESSION ENDPOINTS
@@ -661,12 +1235,16 @@ async def create_user(user: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str, db: Session = Depends(get_db)):
+async def get_user(user_id: str, request: Request, response: Response, db: ReadSession = Depends(get_read_db)):
     """Get user by ID"""
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user = await db.first(select(User).where(User.user_id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    not_modified = conditional_get(request, response, "user", user.created_at, user.user_id, user.name, user.created_at)
+    if not_modified:
+        return not_modified
+    
     return UserResponse(
         user_id=user.user_id,
         name=user.name,
@@ -716,12 +1294,19 @@ async def complete_session(session_id: str, db: Session = Depends(get_db)):
     return {"message": "Session completed", "session_id": session_id}
 
 @app.get("/api/sessions/{session_id}", response_model=SessionResponse)
-async def get_session(session_id: str, db: Session = Depends(get_db)):
+async def get_session(session_id: str, request: Request, response: Response, db: ReadSession = Depends(get_read_db)):
     """Get session details"""
-    session = db.query(Session).filter(Session.session_id == session_id).first()
+    session = await db.first(select(Session).where(Session.session_id == session_id))
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    not_modified = conditional_get(
+        request, response, "session", latest(session.created_at, session.completed_at),
+        session.session_id, session.user_id, session.created_at, session.completed_at
+    )
+    if not_modified:
+        return not_modified
+    
     return SessionResponse(
         session_id=session.session_id,
         user_id=session.user_id,
@@ -741,13 +1326,11 @@ async def transcribe_audio(
         
         # Save uploaded file
         file_id = str(uuid.uuid4())
-        file_path = AUDIO_DIR / f"{file_id}_{audio.filename}"
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
+        upload = await ingest_upload(audio, AUDIO_DIR, file_id)
+        file_path = upload["path"]
         
         # Transcribe
-        transcription = modules['stt'].transcribe(str(file_path))
+        transcription = await asyncio.to_thread(transcribe_within_budget, modules['stt'], file_path, seconds=upload["duration"])
         
         if not transcription or not transcription.get("text"):
             raise HTTPException(status_code=400, detail="Could not transcribe audio")
@@ -767,36 +1350,51 @@ async def transcribe_audio(
 async def analyze_audio(
     audio: UploadFile = File(...),
     exercise_text: str = "",
+    analysis_profile: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """Analyze audio and provide feedback"""
     try:
+        profile = resolve_analysis_profile("analyze", analysis_profile)
+        analysis_scheduler.check("interactive")
+        timer = StageTimer("analyze")
         modules = get_modules()
+        timer.mark("setup")
         
         # Save uploaded file
         file_id = str(uuid.uuid4())
-        file_path = AUDIO_DIR / f"{file_id}_{audio.filename}"
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
+        upload = await ingest_upload(audio, AUDIO_DIR, file_id)
+        file_path = upload["path"]
+        timer.mark("upload")
         
         # Transcribe
-        transcription = modules['stt'].transcribe(str(file_path))
+        transcription = await asyncio.to_thread(transcribe_within_budget, modules['stt'], file_path, seconds=upload["duration"])
         if not transcription or not transcription.get("text"):
             raise HTTPException(status_code=400, detail="Could not transcribe audio")
+        timer.mark("stt")
         
-        # Analyze
-        analysis = modules['analyzer'].analyze_audio(str(file_path), transcription)
-        
-        # Diagnose
-        diagnosis = modules['analyzer'].diagnose(
-            analysis,
-            transcription,
-            expected_text=exercise_text
-        )
+        async with analysis_scheduler.slot("interactive"):
+            timer.mark("queue")
+            
+            # Analyze
+            analysis = await asyncio.to_thread(
+                modules['analyzer'].analyze_audio, str(file_path), transcription, profile=profile
+            )
+            if "error" in analysis:
+                FALLBACKS.inc(kind="analysis")
+            timer.mark("analysis")
+            
+            # Diagnose
+            diagnosis = await asyncio.to_thread(
+                modules['analyzer'].diagnose,
+                analysis,
+                transcription,
+                expected_text=exercise_text
+            )
+            timer.mark("diagnose")
         
         # Generate feedback
-        llm_feedback = modules['llm'].generate_feedback({
+        llm_feedback = await asyncio.to_thread(feedback_within_budget, modules['llm'], {
             "expected_text": exercise_text,
             "actual_text": transcription['text'],
             "accuracy_score": diagnosis.get('accuracy', 0),
@@ -804,6 +1402,7 @@ async def analyze_audio(
             "analysis": analysis,
             "previous_scores": []
         })
+        timer.mark("llm")
         
         return {
             "transcription": TranscriptionResponse(
@@ -832,127 +1431,298 @@ async def create_exercise(
     session_id: str,
     exercise_text: str,
     audio: UploadFile = File(...),
+    analysis_profile: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Process and save exercise result"""
+    """Process and save exercise result; retries (same Idempotency-Key, or same audio) replay the saved result"""
     try:
+        profile = resolve_analysis_profile("create_exercise", analysis_profile)
+        
         # Verify session exists
         session = db.query(Session).filter(Session.session_id == session_id).first()
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
+        timer = StageTimer("create_exercise")
         modules = get_modules()
-        
-        # Save uploaded file
+        timer.mark("setup")
         exercise_id = str(uuid.uuid4())
-        file_path = AUDIO_DIR / f"{exercise_id}_{audio.filename}"
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
         
-        # Transcribe
-        transcription = modules['stt'].transcribe(str(file_path))
-        if not transcription or not transcription.get("text"):
-            raise HTTPException(status_code=400, detail="Could not transcribe audio")
+        async def ingest():
+            analysis_scheduler.check("interactive")
+            
+            # Save uploaded file
+            upload = await ingest_upload(audio, AUDIO_DIR, exercise_id)
+            timer.mark("upload")
+            return upload
         
-        # Analyze
-        analysis = modules['analyzer'].analyze_audio(str(file_path), transcription)
+        async def process(upload):
+            file_path = upload["path"]
+            
+            # Transcribe
+            transcription = await asyncio.to_thread(
+                transcribe_within_budget, modules['stt'], file_path, user_id=session.user_id, seconds=upload["duration"]
+            )
+            if not transcription or not transcription.get("text"):
+                raise HTTPException(status_code=400, detail="Could not transcribe audio")
+            timer.mark("stt")
+            
+            # The user's running baseline: previous scores and per-metric statistics
+            previous_scores, baseline = get_user_baseline(db, session.user_id)
+            timer.mark("baseline")
+            
+            async with analysis_scheduler.slot("interactive"):
+                timer.mark("queue")
+                
+                # Analyze
+                analysis = await asyncio.to_thread(
+                    modules['analyzer'].analyze_audio, str(file_path), transcription, profile=profile
+                )
+                if "error" in analysis:
+                    FALLBACKS.inc(kind="analysis")
+                timer.mark("analysis")
+                
+                # Diagnose
+                diagnosis = await asyncio.to_thread(
+                    modules['analyzer'].diagnose,
+                    analysis,
+                    transcription,
+                    expected_text=exercise_text,
+                    baseline=baseline
+                )
+                timer.mark("diagnose")
+            
+            # Generate feedback
+            llm_feedback = await asyncio.to_thread(feedback_within_budget, modules['llm'], {
+                "expected_text": exercise_text,
+                "actual_text": transcription['text'],
+                "accuracy_score": diagnosis.get('accuracy', 0),
+                "issues": diagnosis['issues'],
+                "analysis": analysis,
+                "previous_scores": previous_scores
+            }, session.user_id)
+            timer.mark("llm")
+            
+            # Save to database
+            db_exercise = Exercise(
+                exercise_id=exercise_id,
+                session_id=session_id,
+                user_id=session.user_id,
+                exercise_text=exercise_text,
+                transcription=transcription['text'],
+                score=diagnosis['score'],
+                accuracy=diagnosis.get('accuracy', 0),
+                issues=diagnosis['issues'],
+                analysis=analysis,
+                llm_feedback=llm_feedback,
+                audio_file_path=str(file_path),
+                duration=analysis.get('duration', 0)
+            )
+            
+            db_exercise = await save_exercise(db, db_exercise)
+            timer.mark("db_commit")
+            
+            logger.info(f"Created exercise: {exercise_id}")
+            
+            return ExerciseResult(
+                exercise_id=db_exercise.exercise_id,
+                exercise_text=db_exercise.exercise_text,
+                transcription=db_exercise.transcription,
+                score=db_exercise.score,
+                accuracy=db_exercise.accuracy,
+                issues=db_exercise.issues,
+                analysis=db_exercise.analysis,
+                llm_feedback=db_exercise.llm_feedback,
+                audio_url=f"/api/audio/{exercise_id}",
+                timestamp=db_exercise.timestamp
+            )
         
-        # Diagnose
-        diagnosis = modules['analyzer'].diagnose(
-            analysis,
-            transcription,
-            expected_text=exercise_text
+        return await idempotency_store.handle(
+            "create_exercise", idempotency_key,
+            {"session_id": session_id, "exercise_text": exercise_text, "analysis_profile": profile},
+            ingest, process
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error creating exercise: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/exercises/batch")
+async def create_exercises_batch(
+    session_id: str = Form(...),
+    exercise_texts: List[str] = Form(...),
+    audio: List[UploadFile] = File(...),
+    analysis_profile: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Process several recordings for one session in a single request
+    
+    Form fields: session_id, then one exercise_texts entry per audio file (same order),
+    and an optional analysis_profile applied to every clip.
+    Clips are transcribed and sent for LLM feedback concurrently and analyzed in
+    parallel on the analysis process pool. Successful clips are saved in one
+    transaction; each clip reports its own status.
+    """
+    if len(audio) != len(exercise_texts):
+        raise HTTPException(status_code=400, detail="Each audio file needs a matching exercise_texts entry")
+    if not audio:
+        raise HTTPException(status_code=400, detail="No audio files provided")
+    if len(audio) > MAX_BATCH_CLIPS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_CLIPS} clips per batch")
+    profile = resolve_analysis_profile("batch", analysis_profile)
+    analysis_scheduler.check("batch")
+    
+    try:
+        # Verify session exists
+        session = db.query(Session).filter(Session.session_id == session_id).first()
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
         
-        # Get previous scores for this user
-        previous_exercises = db.query(Exercise).filter(
-            Exercise.user_id == session.user_id
-        ).order_by(Exercise.timestamp.desc()).limit(10).all()
-        previous_scores = [ex.score for ex in previous_exercises]
+        modules = get_modules()
         
-        # Generate feedback
-        llm_feedback = modules['llm'].generate_feedback({
-            "expected_text": exercise_text,
-            "actual_text": transcription['text'],
-            "accuracy_score": diagnosis.get('accuracy', 0),
-            "issues": diagnosis['issues'],
-            "analysis": analysis,
-            "previous_scores": previous_scores
-        })
+        # One baseline lookup shared by every clip
+        previous_scores, baseline = get_user_baseline(db, session.user_id)
+        
+        clips = [(str(uuid.uuid4()), exercise_text, upload) for upload, exercise_text in zip(audio, exercise_texts)]
+        # The batch was admitted once above; at most `concurrency` of its clips wait for a slot
+        # at a time, so a large batch can't fill the batch lane's queue share and reject itself
+        batch_slots = asyncio.Semaphore(analysis_scheduler.concurrency)
+        
+        async def process_clip(exercise_id, exercise_text, upload):
+            timer = StageTimer("batch")
+            # A rejected upload fails only its own clip
+            ingested = await ingest_upload(upload, AUDIO_DIR, exercise_id)
+            file_path = ingested["path"]
+            timer.mark("upload")
+            transcription = await asyncio.to_thread(
+                transcribe_within_budget, modules['stt'], file_path, session.user_id, ingested["duration"]
+            )
+            if not transcription or not transcription.get("text"):
+                raise ValueError("Could not transcribe audio")
+            timer.mark("stt")
+            
+            # Batch clips queue behind interactive submissions
+            async with batch_slots, analysis_scheduler.slot("batch"):
+                timer.mark("queue")
+                analysis, diagnosis = await analyze_in_pool(
+                    str(file_path), transcription, exercise_text, profile=profile, baseline=baseline
+                )
+            if "error" in analysis:
+                FALLBACKS.inc(kind="analysis")
+            timer.mark("analysis")
+            
+            llm_feedback = await asyncio.to_thread(feedback_within_budget, modules['llm'], {
+                "expected_text": exercise_text,
+                "actual_text": transcription['text'],
+                "accuracy_score": diagnosis.get('accuracy', 0),
+                "issues": diagnosis['issues'],
+                "analysis": analysis,
+                "previous_scores": previous_scores
+            }, session.user_id)
+            timer.mark("llm")
+            
+            return Exercise(
+                exercise_id=exercise_id,
+                session_id=session_id,
+                user_id=session.user_id,
+                exercise_text=exercise_text,
+                transcription=transcription['text'],
+                score=diagnosis['score'],
+                accuracy=diagnosis.get('accuracy', 0),
+                issues=diagnosis['issues'],
+                analysis=analysis,
+                llm_feedback=llm_feedback,
+                audio_file_path=str(file_path),
+                duration=analysis.get('duration', 0),
+                timestamp=datetime.utcnow()
+            )
         
-        # Save to database
-        db_exercise = Exercise(
-            exercise_id=exercise_id,
-            session_id=session_id,
-            user_id=session.user_id,
-            exercise_text=exercise_text,
-            transcription=transcription['text'],
-            score=diagnosis['score'],
-            accuracy=diagnosis.get('accuracy', 0),
-            issues=diagnosis['issues'],
-            analysis=analysis,
-            llm_feedback=llm_feedback,
-            audio_file_path=str(file_path),
-            duration=analysis.get('duration', 0)
+        outcomes = await asyncio.gather(
+            *[process_clip(*clip) for clip in clips],
+            return_exceptions=True
         )
         
-        db.add(db_exercise)
+        # Save every successful clip in one transaction
+        timer = StageTimer("batch")
+        db_exercises = [outcome for outcome in outcomes if isinstance(outcome, Exercise)]
+        feature_values = []
+        for db_exercise in db_exercises:
+            db_exercise.analyzer_version = analyzer_version_for(db_exercise.analysis)
+            feature_values.append(feature_row_values(db_exercise))
+            db.add(db_exercise)
+            db.add(ExerciseFeatures(**feature_values[-1]))
         db.commit()
-        db.refresh(db_exercise)
-        
-        logger.info(f"Created exercise: {exercise_id}")
-        
-        return ExerciseResult(
-            exercise_id=db_exercise.exercise_id,
-            exercise_text=db_exercise.exercise_text,
-            transcription=db_exercise.transcription,
-            score=db_exercise.score,
-            accuracy=db_exercise.accuracy,
-            issues=db_exercise.issues,
-            analysis=db_exercise.analysis,
-            llm_feedback=db_exercise.llm_feedback,
-            audio_url=f"/api/audio/{exercise_id}",
-            timestamp=db_exercise.timestamp
-        )
+        if feature_values:
+            await record_baseline(db, session.user_id, feature_values)
+        timer.mark("db_commit")
+        
+        results = []
+        for index, ((exercise_id, exercise_text, _), outcome) in enumerate(zip(clips, outcomes)):
+            if isinstance(outcome, Exercise):
+                results.append({
+                    "index": index,
+                    "status": "success",
+                    "result": ExerciseResult(
+                        exercise_id=outcome.exercise_id,
+                        exercise_text=outcome.exercise_text,
+                        transcription=outcome.transcription,
+                        score=outcome.score,
+                        accuracy=outcome.accuracy,
+                        issues=outcome.issues,
+                        analysis=outcome.analysis,
+                        llm_feedback=outcome.llm_feedback,
+                        audio_url=f"/api/audio/{outcome.exercise_id}",
+                        timestamp=outcome.timestamp
+                    )
+                })
+            else:
+                logger.warning(f"Batch clip {index} failed: {outcome}")
+                results.append({
+                    "index": index,
+                    "status": "error",
+                    "exercise_text": exercise_text,
+                    "error": outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+                })
+        
+        logger.info(f"Batch for session {session_id}: {len(db_exercises)}/{len(clips)} clips saved")
+        return {
+            "session_id": session_id,
+            "total": len(clips),
+            "succeeded": len(db_exercises),
+            "results": results
+        }
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
-        logger.error(f"Error creating exercise: {e}")
+        logger.error(f"Error processing exercise batch: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # IMPORTANT: Specific routes must come BEFORE generic path parameter routes
 # Generate exercises endpoints (must be before /api/exercises/{exercise_id})
 @app.get("/api/exercises/generate")
-async def generate_exercises(type: str = "general", count: int = 3, difficulty: str = "beginner"):
+async def generate_exercises(type: str = "general", count: int = 3, difficulty: str = "beginner", user_id: Optional[str] = None):
     """
     Generate custom exercises using AI - Frontend compatible GET endpoint
     
     Query parameters:
     - type: lisp|stuttering|general|custom
-    - count: number of exercises to generate (default 3)
+    - count: number of exercises to return (default 3, at most 10)
     - difficulty: beginner|intermediate|advanced (default beginner)
+    - user_id: optional; phrases the user has already been given are served last
+    
+    Exercises come from the pre-generated pool, which the LLM refills in the background.
     """
     try:
-        logger.info(f"Generating {count} {difficulty} exercises for type: {type}")
-        modules = get_modules()
-        
-        # Generate exercises dynamically using Groq LLM
-        exercises = modules['llm'].generate_exercise_prompt(
-            issue_type=type,
-            difficulty=difficulty,
-            count=count
-        )
-        
-        # Validate we got exercises
-        if not exercises or len(exercises) == 0:
-            logger.warning(f"No exercises generated, using fallback")
-            # Fallback to simple exercise
-            exercises = ["Please try again - the AI is having trouble generating exercises."]
-        
-        logger.info(f"Generated {len(exercises)} exercises of type: {type}")
-        return {"exercises": exercises, "type": type, "difficulty": difficulty}
+        exercises, source = await serve_exercises(type, difficulty, count, user_id)
+        logger.info(f"Served {len(exercises)} {difficulty} exercises of type {type} from {source}")
+        return {"exercises": exercises, "type": type, "difficulty": difficulty, "source": source}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating exercises: {e}")
         raise HTTPException(status_code=500, detail=f"Exercise generation failed: {str(e)}")
@@ -962,22 +1732,33 @@ async def generate_exercises(type: str = "general", count: int = 3, difficulty:
 async def generate_exercises_post(request: CustomExerciseRequest):
     """Generate custom exercises using AI - POST endpoint"""
     try:
-        modules = get_modules()
-        exercises = modules['llm'].generate_exercise_prompt(
-            issue_type=request.exercise_type,
-            difficulty="beginner",
-            count=request.count
+        exercises, source = await serve_exercises(
+            request.exercise_type, request.difficulty, request.count, request.user_id
         )
-        return {"exercises": exercises, "type": request.exercise_type}
+        return {"exercises": exercises, "type": request.exercise_type, "difficulty": request.difficulty, "source": source}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating exercises: {e}")
         raise HTTPException(status_code=500, detail=f"Exercise generation failed: {str(e)}")
 
 # Generic exercise retrieval by ID (MUST come after specific routes above)
 @app.get("/api/exercises/{exercise_id}", response_model=ExerciseResult)
-async def get_exercise(exercise_id: str, db: Session = Depends(get_db)):
+async def get_exercise(exercise_id: str, request: Request, response: Response, db: ReadSession = Depends(get_read_db)):
     """Get exercise details"""
-    exercise = db.query(Exercise).filter(Exercise.exercise_id == exercise_id).first()
+    # Validator first, so a 304 never loads the analysis JSON
+    validator = await db.first_row(
+        select(Exercise.id, Exercise.timestamp, Exercise.updated_at).where(Exercise.exercise_id == exercise_id)
+    )
+    if not validator:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    
+    last_modified = latest(validator.timestamp, validator.updated_at)
+    not_modified = conditional_get(request, response, "exercise", last_modified, validator.id, last_modified)
+    if not_modified:
+        return not_modified
+    
+    exercise = await db.first(select(Exercise).where(Exercise.id == validator.id))
     if not exercise:
         raise HTTPException(status_code=404, detail="Exercise not found")
     
@@ -1013,20 +1794,46 @@ async def get_audio(exercise_id: str, db: Session = Depends(get_db)):
 
 # Progress endpoints
 @app.get("/api/progress/{user_id}", response_model=ProgressResponse)
-async def get_progress(user_id: str, days: int = 30, db: Session = Depends(get_db)):
-    """Get user progress statistics"""
+async def get_progress(user_id: str, request: Request, response: Response, days: int = 30, db: ReadSession = Depends(get_read_db)):
+    """Get user progress statistics (304 if unchanged since the client's ETag)"""
     try:
         # Verify user exists
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await db.first(select(User).where(User.user_id == user_id))
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Get exercises from last N days
         start_date = datetime.utcnow() - timedelta(days=days)
-        exercises = db.query(Exercise).filter(
-            Exercise.user_id == user_id,
-            Exercise.timestamp >= start_date
-        ).order_by(Exercise.timestamp.desc()).all()
+        
+        # Validator: the exercises in the window and the user's sessions. An
+        # exercise leaving the window changes the count, an edit changes max(updated_at)
+        exercise_count, exercises_changed = await db.one(
+            select(func.count(Exercise.id), func.max(Exercise.updated_at)).where(
+                Exercise.user_id == user_id,
+                Exercise.timestamp >= start_date
+            )
+        )
+        session_count, sessions_changed = await db.one(
+            select(func.count(Session.id), func.max(Session.created_at)).where(Session.user_id == user_id)
+        )
+        not_modified = conditional_get(
+            request, response, "progress", latest(exercises_changed, sessions_changed),
+            user_id, days, exercise_count, exercises_changed, session_count, sessions_changed
+        )
+        if not_modified:
+            return not_modified
+        
+        # Get exercises from last N days - only the columns the summary needs,
+        # so the analysis JSON blobs are never loaded
+        exercises = await db.all(
+            select(
+                Exercise.score,
+                Exercise.accuracy,
+                Exercise.issues
+            ).where(
+                Exercise.user_id == user_id,
+                Exercise.timestamp >= start_date
+            ).order_by(Exercise.timestamp.desc())
+        )
         
         if not exercises:
             return ProgressResponse(
@@ -1054,19 +1861,37 @@ async def get_progress(user_id: str, days: int = 30, db: Session = Depends(get_d
             improvement_rate = 0.0
         
         # Get recent sessions
-        recent_sessions_data = db.query(Session).filter(
-            Session.user_id == user_id
-        ).order_by(Session.created_at.desc()).limit(10).all()
+        recent_sessions_data = await db.scalars(
+            select(Session).where(
+                Session.user_id == user_id
+            ).order_by(Session.created_at.desc()).limit(10)
+        )
+        
+        # Per-session counts and averages in one grouped query
+        session_stats = {
+            row.session_id: row
+            for row in await db.all(
+                select(
+                    Exercise.session_id,
+                    func.count(Exercise.id).label("exercises_count"),
+                    func.avg(Exercise.score).label("average_score")
+                ).where(
+                    Exercise.user_id == user_id,
+                    Exercise.timestamp >= start_date,
+                    Exercise.session_id.in_([s.session_id for s in recent_sessions_data])
+                ).group_by(Exercise.session_id)
+            )
+        }
         
         recent_sessions = []
         for session in recent_sessions_data:
-            session_exercises = [ex for ex in exercises if ex.session_id == session.session_id]
-            if session_exercises:
+            stats = session_stats.get(session.session_id)
+            if stats:
                 recent_sessions.append({
                     "session_id": session.session_id,
                     "date": session.created_at.isoformat(),
-                    "exercises_count": len(session_exercises),
-                    "average_score": sum(ex.score for ex in session_exercises) / len(session_exercises)
+                    "exercises_count": stats.exercises_count,
+                    "average_score": float(stats.average_score)
                 })
         
         # Issue trends
@@ -1090,6 +1915,59 @@ async def get_progress(user_id: str, days: int = 30, db: Session = Depends(get_d
         logger.error(f"Error getting progress: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+TREND_METRICS = ["score", "accuracy"] + FEATURE_COLUMNS
+
+def _parse_metrics(metrics: Optional[str]) -> List[str]:
+    """Validate a comma-separated metrics query parameter against exercise_features"""
+    if not metrics:
+        return TREND_METRICS
+    requested = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = [m for m in requested if m not in TREND_METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}")
+    return requested
+
+@app.get("/api/progress/{user_id}/trends")
+async def get_progress_trends(user_id: str, days: int = 90, metrics: Optional[str] = None, db: ReadSession = Depends(get_read_db)):
+    """
+    Daily averages of acoustic metrics for a user
+    
+    Query parameters:
+    - days: how far back to look (default 90)
+    - metrics: comma-separated metric names (default: all)
+    """
+    requested = _parse_metrics(metrics)
+    try:
+        start_date = datetime.utcnow() - timedelta(days=days)
+        day = func.date(ExerciseFeatures.timestamp).label("day")
+        rows = await db.all(
+            select(
+                day,
+                func.count(ExerciseFeatures.id).label("exercises_count"),
+                *[func.avg(getattr(ExerciseFeatures, m)).label(m) for m in requested]
+            ).where(
+                ExerciseFeatures.user_id == user_id,
+                ExerciseFeatures.timestamp >= start_date
+            ).group_by(day).order_by(day)
+        )
+        
+        return {
+            "user_id": user_id,
+            "days": days,
+            "metrics": requested,
+            "trends": [
+                {
+                    "date": str(row.day),
+                    "exercises_count": row.exercises_count,
+                    **{m: round(getattr(row, m), 4) if getattr(row, m) is not None else None for m in requested}
+                }
+                for row in rows
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Error getting progress trends: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Text-to-speech endpoint
 @app.post("/api/tts")
 async def text_to_speech(text: str, background_tasks: BackgroundTasks):
@@ -1119,17 +1997,22 @@ async def text_to_speech(text: str, background_tasks: BackgroundTasks):
 
 # Statistics endpoint
 @app.get("/api/stats/global")
-async def get_global_stats(db: Session = Depends(get_db)):
+async def get_global_stats(db: ReadSession = Depends(get_read_db)):
     """Get global platform statistics"""
     try:
-        total_users = db.query(User).count()
-        total_sessions = db.query(Session).count()
-        total_exercises = db.query(Exercise).count()
+        total_users = await db.scalar(select(func.count()).select_from(User))
+        total_sessions = await db.scalar(select(func.count()).select_from(Session))
+        total_exercises = await db.scalar(select(func.count()).select_from(Exercise))
         
         # Calculate average scores
-        exercises = db.query(Exercise).all()
-        avg_score = sum(ex.score for ex in exercises) / len(exercises) if exercises else 0
-        avg_accuracy = sum(ex.accuracy for ex in exercises) / len(exercises) if exercises else 0
+        avg_score, avg_accuracy = await db.one(
+            select(
+                func.avg(Exercise.score),
+                func.avg(Exercise.accuracy)
+            )
+        )
+        avg_score = avg_score or 0
+        avg_accuracy = avg_accuracy or 0
         
         return {
             "total_users": total_users,
@@ -1142,17 +2025,55 @@ async def get_global_stats(db: Session = Depends(get_db)):
         logger.error(f"Error getting stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/stats/features")
+async def get_feature_stats(days: int = 30, metrics: Optional[str] = None, db: ReadSession = Depends(get_read_db)):
+    """Cohort-wide mean/min/max of acoustic metrics over the last N days"""
+    requested = _parse_metrics(metrics)
+    try:
+        start_date = datetime.utcnow() - timedelta(days=days)
+        columns = []
+        for m in requested:
+            column = getattr(ExerciseFeatures, m)
+            columns.extend([func.avg(column), func.min(column), func.max(column)])
+        
+        row = await db.one(
+            select(
+                func.count(ExerciseFeatures.id),
+                func.count(func.distinct(ExerciseFeatures.user_id)),
+                *columns
+            ).where(ExerciseFeatures.timestamp >= start_date)
+        )
+        
+        stats = {}
+        for i, m in enumerate(requested):
+            mean, low, high = row[2 + i * 3: 5 + i * 3]
+            stats[m] = {
+                "mean": round(mean, 4) if mean is not None else None,
+                "min": low,
+                "max": high
+            }
+        
+        return {
+            "days": days,
+            "total_exercises": row[0],
+            "total_users": row[1],
+            "metrics": stats
+        }
+    except Exception as e:
+        logger.error(f"Error getting feature stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Export data
 @app.get("/api/export/{user_id}")
-async def export_user_data(user_id: str, db: Session = Depends(get_db)):
+async def export_user_data(user_id: str, db: ReadSession = Depends(get_read_db)):
     """Export all user data as JSON"""
     try:
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await db.first(select(User).where(User.user_id == user_id))
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        exercises = db.query(Exercise).filter(Exercise.user_id == user_id).all()
-        sessions = db.query(Session).filter(Session.user_id == user_id).all()
+        exercises = await db.scalars(select(Exercise).where(Exercise.user_id == user_id))
+        sessions = await db.scalars(select(Session).where(Session.user_id == user_id))
         
         export_data = {
             "user": {
@@ -0,0 +1,257 @@
+"""
+In-process metrics exposed in Prometheus text format at /metrics.
+
+A deliberately small implementation (counters, gauges, histograms with
+labels) so the hot path only pays for a lock, a dict lookup and a bisect.
+Metrics are per worker process; run one scrape target per uvicorn worker
+or aggregate in Prometheus.
+
+The metric objects the backend records into are defined at the bottom of
+this module so every module imports the same instances.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from fast DB reads up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+_INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labelnames and self.type_name != "histogram":
+            self._values[()] = 0
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            lines.extend(self._render_samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _render_samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self):
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_LABEL)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render_metrics():
+    """All registered metrics in Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# ============================================================================
+# Backend metrics
+# ============================================================================
+
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"]
+)
+PIPELINE_STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds", "Submission pipeline stage latency",
+    ["endpoint", "stage"]
+)
+ANALYZER_STAGE_SECONDS = Histogram(
+    "analyzer_stage_duration_seconds", "VoiceAnalyzer stage latency",
+    ["stage"]
+)
+FALLBACKS = Counter(
+    "fallbacks_total", "Times a degraded fallback result was used",
+    ["kind"]
+)
+GROQ_REQUESTS = Counter(
+    "groq_requests_total", "Groq API calls by API and outcome",
+    ["api", "outcome"]
+)
+STT_REQUESTS = Counter(
+    "stt_requests_total", "Transcriptions by STT engine and outcome",
+    ["backend", "outcome"]
+)
+GROQ_REQUEST_SECONDS = Histogram(
+    "groq_request_duration_seconds", "Groq API call latency",
+    ["api"]
+)
+
+
+def observe_analyzer_stage(stage, seconds):
+    """VoiceAnalyzer.stage_hook that records into ANALYZER_STAGE_SECONDS"""
+    ANALYZER_STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def track_groq_call(api):
+    """Count and time one Groq API call; exceptions are counted as errors and re-raised"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        GROQ_REQUESTS.inc(api=api, outcome="error")
+        raise
+    else:
+        GROQ_REQUESTS.inc(api=api, outcome="success")
+    finally:
+        GROQ_REQUEST_SECONDS.observe(time.perf_counter() - start, api=api)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests and per-route latency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route on the scope; use its template to bound cardinality
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status
+            )
+
+
+class StageTimer:
+    """
+    Records consecutive pipeline stages of one request: each mark() closes
+    the stage that just finished and starts timing the next one.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        PIPELINE_STAGE_SECONDS.observe(now - self._last, endpoint=self.endpoint, stage=stage)
+        self._last = now
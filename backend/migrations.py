@@ -0,0 +1,97 @@
+"""
+Lightweight schema migrations for the speech therapy database.
+
+`Base.metadata.create_all` only creates tables that are missing - it never
+adds indexes or columns to tables that already exist in an older
+speech_therapy.db. Each migration below runs once per database and is
+recorded in the `schema_migrations` table, so new deployments and old
+database files end up with the same schema.
+
+To add a migration, write a function taking (connection, metadata) and
+append it to MIGRATIONS with the next version number. New nullable
+columns on existing models only need `_add_missing_columns` under a new
+version.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import Table, Column, String, DateTime, MetaData, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+from feature_store import backfill_features
+from baselines import rebuild_baselines
+
+logger = logging.getLogger(__name__)
+
+_migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _create_missing_indexes(conn, metadata):
+    """Create every index declared on the models that the database lacks"""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _add_missing_columns(conn, metadata):
+    """ALTER TABLE ... ADD COLUMN for every model column the database lacks"""
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _exercise_updated_at(conn, metadata):
+    """Add exercises.updated_at, starting each existing row at its timestamp"""
+    _add_missing_columns(conn, metadata)
+    conn.execute(text("UPDATE exercises SET updated_at = timestamp WHERE updated_at IS NULL"))
+
+
+MIGRATIONS = [
+    ("0001_composite_indexes", _create_missing_indexes),
+    ("0002_exercise_features_backfill", backfill_features),
+    ("0003_exercise_analyzer_version", _add_missing_columns),
+    ("0004_exercise_updated_at", _exercise_updated_at),
+    ("0005_user_baselines_backfill", rebuild_baselines),
+]
+
+
+def run_migrations(engine, metadata):
+    """
+    Apply pending migrations in order.
+
+    Safe to call on every startup and from several workers at once: a
+    migration that another worker recorded first is skipped.
+    """
+    _migration_metadata.create_all(bind=engine)
+
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    for version, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                migrate(conn, metadata)
+                conn.execute(schema_migrations.insert().values(
+                    version=version,
+                    applied_at=datetime.utcnow()
+                ))
+            logger.info(f"Applied schema migration {version}")
+        except IntegrityError:
+            logger.info(f"Schema migration {version} already applied by another worker")
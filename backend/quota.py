@@ -0,0 +1,232 @@
+"""
+Daily Groq budget tracking and load shedding.
+
+Groq's free tier caps transcription at 14,400 audio-seconds a day and
+limits LLM tokens per day; when a cap is hit, calls start failing and
+users see "Could not transcribe audio". The BudgetTracker records the
+audio seconds sent to Groq Whisper and the tokens used by Groq chat
+completions, per UTC day and per user, in the api_usage table (so the
+counts survive restarts and are shared by every worker process).
+
+Callers ask the tracker before spending budget:
+
+    stt_route(user_id)       "remote", "local" (use the local engine) or
+                             "deny" (no budget and no local engine)
+    allow_llm(kind, user_id) False to skip the call; non-essential kinds
+                             (feedback, exercise generation, chat
+                             summaries) are shed once the day's remaining
+                             tokens drop below QUOTA_SHED_FRACTION
+
+Calls are attributed to the user set with charge_to(); calls outside it
+(and anonymous submissions) only count towards the daily totals.
+
+Configuration:
+    QUOTA_DAILY_AUDIO_SECONDS=14400
+    QUOTA_DAILY_LLM_TOKENS=100000
+    QUOTA_USER_DAILY_AUDIO_SECONDS=1800    (0 = no per-user limit)
+    QUOTA_USER_DAILY_LLM_TOKENS=20000      (0 = no per-user limit)
+    QUOTA_SHED_FRACTION=0.1
+    QUOTA_REFRESH_SECONDS=30
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+QUOTA_DAILY_AUDIO_SECONDS = float(os.getenv("QUOTA_DAILY_AUDIO_SECONDS", "14400"))
+QUOTA_DAILY_LLM_TOKENS = float(os.getenv("QUOTA_DAILY_LLM_TOKENS", "100000"))
+QUOTA_USER_DAILY_AUDIO_SECONDS = float(os.getenv("QUOTA_USER_DAILY_AUDIO_SECONDS", "1800"))
+QUOTA_USER_DAILY_LLM_TOKENS = float(os.getenv("QUOTA_USER_DAILY_LLM_TOKENS", "20000"))
+QUOTA_SHED_FRACTION = float(os.getenv("QUOTA_SHED_FRACTION", "0.1"))
+QUOTA_REFRESH_SECONDS = float(os.getenv("QUOTA_REFRESH_SECONDS", "30"))
+
+# Groq bills every transcription request as at least 10 seconds of audio
+GROQ_MIN_BILLED_SECONDS = 10.0
+
+AUDIO_SECONDS = "audio_seconds"
+LLM_TOKENS = "llm_tokens"
+
+DAILY_LIMITS = {AUDIO_SECONDS: QUOTA_DAILY_AUDIO_SECONDS, LLM_TOKENS: QUOTA_DAILY_LLM_TOKENS}
+USER_DAILY_LIMITS = {AUDIO_SECONDS: QUOTA_USER_DAILY_AUDIO_SECONDS, LLM_TOKENS: QUOTA_USER_DAILY_LLM_TOKENS}
+
+# LLM call kinds that may be skipped while the budget is low
+NON_ESSENTIAL_LLM = {"feedback", "exercise_generation", "chat_summary"}
+
+BUDGET_REMAINING = Gauge(
+    "api_budget_remaining", "Remaining daily Groq budget by resource",
+    ["resource"]
+)
+BUDGET_SHED = Counter(
+    "api_budget_shed_total", "Groq calls skipped or rerouted to stay within budget by kind",
+    ["kind"]
+)
+
+# User the current request's Groq usage is charged to (copied into to_thread workers)
+_charged_user = ContextVar("quota_charged_user", default=None)
+
+
+@contextmanager
+def charge_to(user_id):
+    """Attribute Groq usage inside the block to user_id"""
+    token = _charged_user.set(user_id)
+    try:
+        yield
+    finally:
+        _charged_user.reset(token)
+
+
+def _today():
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+class BudgetTracker:
+    """
+    Today's usage, cached in memory and written through to api_usage.
+    The cache is reloaded every QUOTA_REFRESH_SECONDS to pick up other
+    workers' usage. Thread-safe.
+    """
+
+    def __init__(self, engine, metadata):
+        self.engine = engine
+        self.usage = metadata.tables["api_usage"]
+        self._lock = threading.Lock()
+        self._day = None
+        self._totals = {}       # (user_id, resource) -> amount; "" is unattributed usage
+        self._loaded_at = 0.0
+
+    def _refresh(self):
+        day = _today()
+        if day == self._day and time.monotonic() - self._loaded_at < QUOTA_REFRESH_SECONDS:
+            return
+        usage = self.usage
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(usage.c.user_id, usage.c.resource, usage.c.amount).where(usage.c.day == day)
+            ).all()
+        with self._lock:
+            self._day = day
+            self._totals = {(row.user_id, row.resource): row.amount for row in rows}
+            self._loaded_at = time.monotonic()
+        for resource in DAILY_LIMITS:
+            BUDGET_REMAINING.set(self._remaining(resource), resource=resource)
+
+    def _used(self, resource, user_id=None):
+        with self._lock:
+            if user_id is None:
+                return sum(amount for (_, name), amount in self._totals.items() if name == resource)
+            return self._totals.get((user_id, resource), 0.0)
+
+    def _remaining(self, resource, user_id=None):
+        if user_id is None:
+            return max(0.0, DAILY_LIMITS[resource] - self._used(resource))
+        limit = USER_DAILY_LIMITS[resource]
+        return max(0.0, limit - self._used(resource, user_id)) if limit else float("inf")
+
+    def _low(self, resource):
+        return self._remaining(resource) < DAILY_LIMITS[resource] * QUOTA_SHED_FRACTION
+
+    def record(self, resource, amount, user_id=None):
+        """Add usage for today (to user_id, else the charged user)"""
+        if amount <= 0:
+            return
+        user_id = user_id if user_id is not None else (_charged_user.get() or "")
+        self._refresh()
+        day, usage = self._day, self.usage
+        key = (usage.c.day == day, usage.c.user_id == user_id, usage.c.resource == resource)
+        try:
+            for attempt in range(2):
+                try:
+                    with self.engine.begin() as conn:
+                        result = conn.execute(
+                            update(usage).where(*key).values(amount=usage.c.amount + amount, updated_at=datetime.utcnow())
+                        )
+                        if not result.rowcount:
+                            conn.execute(usage.insert().values(
+                                day=day, user_id=user_id, resource=resource, amount=amount, updated_at=datetime.utcnow()
+                            ))
+                    break
+                except IntegrityError:
+                    # Another worker inserted today's row first; add to it on the next pass
+                    if attempt:
+                        raise
+        except Exception as e:
+            # Tracking must never fail the request; the in-memory count still applies
+            logger.warning(f"Could not persist {resource} usage: {e}")
+        with self._lock:
+            self._totals[(user_id, resource)] = self._totals.get((user_id, resource), 0.0) + amount
+        BUDGET_REMAINING.set(self._remaining(resource), resource=resource)
+
+    def record_audio(self, seconds, user_id=None):
+        """Audio sent to Groq Whisper, billed at GROQ_MIN_BILLED_SECONDS or more"""
+        self.record(AUDIO_SECONDS, max(float(seconds or 0.0), GROQ_MIN_BILLED_SECONDS), user_id)
+
+    def record_tokens(self, tokens, user_id=None):
+        self.record(LLM_TOKENS, float(tokens or 0), user_id)
+
+    def stt_route(self, user_id=None, has_local=False, seconds=None):
+        """How to transcribe a clip: "remote", "local" or "deny" """
+        self._refresh()
+        needed = max(float(seconds or 0.0), GROQ_MIN_BILLED_SECONDS)
+        exhausted = (self._remaining(AUDIO_SECONDS) < needed
+                     or (user_id is not None and self._remaining(AUDIO_SECONDS, user_id) < needed))
+        if not exhausted and not self._low(AUDIO_SECONDS):
+            return "remote"
+        if has_local:
+            BUDGET_SHED.inc(kind="stt_local")
+            return "local"
+        if exhausted:
+            BUDGET_SHED.inc(kind="stt_denied")
+            return "deny"
+        # Low but not exhausted, and nowhere else to send it
+        return "remote"
+
+    def allow_llm(self, kind, user_id=None):
+        """Whether an LLM call of this kind should be made now"""
+        self._refresh()
+        user_id = user_id if user_id is not None else _charged_user.get()
+        if self._remaining(LLM_TOKENS) <= 0 or (user_id and self._remaining(LLM_TOKENS, user_id) <= 0):
+            allowed = False
+        else:
+            allowed = kind not in NON_ESSENTIAL_LLM or not self._low(LLM_TOKENS)
+        if not allowed:
+            BUDGET_SHED.inc(kind=kind)
+        return allowed
+
+    def report(self, user_id=None):
+        """Today's limits, usage and remaining budget (and the user's, if given)"""
+        self._refresh()
+        tomorrow = datetime.strptime(self._day, "%Y-%m-%d") + timedelta(days=1)
+        report = {
+            "day": self._day,
+            "resets_at": tomorrow.isoformat() + "Z",
+            "shedding": {
+                "llm_feedback": self._low(LLM_TOKENS) or self._remaining(LLM_TOKENS) <= 0,
+                "remote_stt": self._low(AUDIO_SECONDS) or self._remaining(AUDIO_SECONDS) <= 0,
+            },
+        }
+        for resource, limit in DAILY_LIMITS.items():
+            report[resource] = {
+                "limit": limit,
+                "used": round(self._used(resource), 1),
+                "remaining": round(self._remaining(resource), 1),
+            }
+        if user_id is not None:
+            report["user"] = {"user_id": user_id}
+            for resource, limit in USER_DAILY_LIMITS.items():
+                remaining = self._remaining(resource, user_id)
+                report["user"][resource] = {
+                    "limit": limit or None,
+                    "used": round(self._used(resource, user_id), 1),
+                    "remaining": round(remaining, 1) if limit else None,
+                }
+        return report
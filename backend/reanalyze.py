@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Bulk re-analysis of stored recordings
+
+Re-runs VoiceAnalyzer.analyze_audio + diagnose on the saved audio of
+existing exercises, across all cores, and writes the new analysis, score,
+accuracy, issues and exercise_features row back stamped with the current
+ANALYZER_VERSION. By default only exercises analyzed by another version,
+with a partial analysis profile (stamped e.g. "1.1+fast") or never
+successfully are selected; re-analysis always runs the full profile. Per-user baselines are rebuilt from
+the rescored exercises at the end of the run.
+
+Usage:
+    python reanalyze.py                               # every stale exercise
+    python reanalyze.py --user USER_ID --since 2024-01-01 --workers 4
+    python reanalyze.py --all --batch-size 100        # force every exercise
+    python reanalyze.py --resume                      # continue after an interrupted run
+    python reanalyze.py --dry-run                     # only count what would be re-analyzed
+
+Re-analysis runs beside the API and doesn't go through its admission
+scheduler, so it limits itself instead: at most REANALYZE_WORKERS
+processes (default half the cores, leaving the rest for live
+submissions), each at nice REANALYZE_NICE (default 10) so the OS prefers
+the API's analysis workers whenever both want the CPU. --workers
+overrides the count.
+
+Progress is checkpointed after each committed batch (--checkpoint), so an
+interrupted run continues where it stopped with --resume. The stored
+transcription is reused; no STT or LLM calls are made, so llm_feedback is
+left as it was.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from analysis_pool import ANALYSIS_WORKERS, _init_worker, analyze_clip  # noqa: E402
+from voice_analysis import ANALYZER_VERSION  # noqa: E402
+
+DEFAULT_CHECKPOINT = "reanalyze_checkpoint.json"
+REANALYZE_WORKERS = int(os.getenv("REANALYZE_WORKERS", "0")) or max(1, ANALYSIS_WORKERS // 2)
+REANALYZE_NICE = int(os.getenv("REANALYZE_NICE", "10"))
+
+
+def init_background_worker():
+    """Pool initializer: drop to a lower CPU priority, then load the analyzer"""
+    if REANALYZE_NICE > 0 and hasattr(os, "nice"):
+        try:
+            os.nice(REANALYZE_NICE)
+        except OSError:
+            pass
+    _init_worker()
+
+
+def load_checkpoint(path):
+    if not Path(path).exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    """Write the checkpoint atomically so a crash never leaves it half written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def selection_key(args):
+    """Arguments that define which exercises a run covers; a resume must match them"""
+    return {
+        "users": sorted(args.user or []),
+        "sessions": sorted(args.session or []),
+        "exercise_ids": sorted(args.exercise_id or []),
+        "since": args.since,
+        "until": args.until,
+        "all": args.all,
+        "analyzer_version": ANALYZER_VERSION,
+    }
+
+
+def build_query(db, Exercise, args, after_id):
+    query = db.query(Exercise).filter(Exercise.id > after_id)
+    if args.user:
+        query = query.filter(Exercise.user_id.in_(args.user))
+    if args.session:
+        query = query.filter(Exercise.session_id.in_(args.session))
+    if args.exercise_id:
+        query = query.filter(Exercise.exercise_id.in_(args.exercise_id))
+    if args.since:
+        query = query.filter(Exercise.timestamp >= datetime.fromisoformat(args.since))
+    if args.until:
+        query = query.filter(Exercise.timestamp < datetime.fromisoformat(args.until))
+    if not args.all:
+        query = query.filter(
+            (Exercise.analyzer_version.is_(None)) | (Exercise.analyzer_version != ANALYZER_VERSION)
+        )
+    return query.order_by(Exercise.id)
+
+
+def analyze_task(task):
+    """Pool entry point: (row id, audio path, transcript, expected text) -> result"""
+    row_id, file_path, text, expected_text = task
+    try:
+        # Always the full profile, so partial analyses are completed whatever ANALYSIS_PROFILE says
+        analysis, diagnosis, _ = analyze_clip(file_path, {"text": text or "", "words": []}, expected_text, profile="full")
+        return row_id, analysis, diagnosis, None
+    except Exception as e:
+        return row_id, None, None, str(e)
+
+
+def write_batch(db, Exercise, ExerciseFeatures, rows, results, feature_row_values):
+    """Apply one batch of results in a single transaction; returns (updated, failed)"""
+    by_id = {row.id: row for row in rows}
+    updated, failed = 0, 0
+    for row_id, analysis, diagnosis, error in results:
+        row = by_id[row_id]
+        if error or analysis is None or "error" in analysis:
+            failed += 1
+            continue
+        row.analysis = analysis
+        row.score = diagnosis["score"]
+        row.accuracy = diagnosis.get("accuracy", 0)
+        row.issues = diagnosis["issues"]
+        row.duration = analysis.get("duration", row.duration)
+        row.analyzer_version = ANALYZER_VERSION
+
+        values = feature_row_values(row)
+        features = db.query(ExerciseFeatures).filter(ExerciseFeatures.exercise_id == row.exercise_id).first()
+        if features is None:
+            db.add(ExerciseFeatures(**values))
+        else:
+            for column, value in values.items():
+                setattr(features, column, value)
+        updated += 1
+    db.commit()
+    return updated, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run voice analysis on stored recordings")
+    parser.add_argument("--database-url", help="Database to update (default: DATABASE_URL or ./speech_therapy.db)")
+    parser.add_argument("--user", action="append", help="Only this user's exercises (repeatable)")
+    parser.add_argument("--session", action="append", help="Only this session's exercises (repeatable)")
+    parser.add_argument("--exercise-id", action="append", help="Only this exercise (repeatable)")
+    parser.add_argument("--since", help="Only exercises at or after this ISO date")
+    parser.add_argument("--until", help="Only exercises before this ISO date")
+    parser.add_argument("--all", action="store_true", help="Re-analyze exercises already at the current analyzer version")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many exercises (0 = no limit)")
+    parser.add_argument("--workers", type=int, default=REANALYZE_WORKERS, help="Analysis processes (default REANALYZE_WORKERS)")
+    parser.add_argument("--batch-size", type=int, default=50, help="Exercises per write transaction")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Count matching exercises and exit")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    # Importing main binds the models to DATABASE_URL and applies pending migrations
+    from main import SessionLocal, Exercise, ExerciseFeatures, engine, Base
+    from feature_store import feature_row_values
+    from baselines import rebuild_baselines
+
+    selection = selection_key(args)
+    state = {"selection": selection, "last_id": 0, "processed": 0, "updated": 0, "failed": 0, "missing_audio": 0}
+    if args.resume:
+        saved = load_checkpoint(args.checkpoint)
+        if saved is None:
+            print(f"No checkpoint at {args.checkpoint}; starting from the beginning")
+        elif saved.get("selection") != selection:
+            print("Checkpoint was written for different selection arguments or analyzer version; refusing to resume")
+            return 1
+        else:
+            state = saved
+            print(f"Resuming after exercise row {state['last_id']} ({state['processed']} already processed)")
+
+    db = SessionLocal()
+    try:
+        remaining = build_query(db, Exercise, args, state["last_id"]).count()
+        print(f"Analyzer version {ANALYZER_VERSION}: {remaining} exercises to re-analyze")
+        if args.dry_run or not remaining:
+            return 0
+
+        audio_seconds = 0.0
+        run_processed = 0
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_background_worker) as pool:
+            while True:
+                batch_size = args.batch_size
+                if args.limit:
+                    batch_size = min(batch_size, args.limit - run_processed)
+                    if batch_size <= 0:
+                        break
+                rows = build_query(db, Exercise, args, state["last_id"]).limit(batch_size).all()
+                if not rows:
+                    break
+
+                tasks = []
+                for row in rows:
+                    if row.audio_file_path and Path(row.audio_file_path).exists():
+                        tasks.append((row.id, row.audio_file_path, row.transcription, row.exercise_text))
+                    else:
+                        state["missing_audio"] += 1
+
+                results = list(pool.map(analyze_task, tasks))
+                updated, failed = write_batch(db, Exercise, ExerciseFeatures, rows, results, feature_row_values)
+                audio_seconds += sum(r[1].get("duration", 0) for r in results if r[1] and "error" not in r[1])
+
+                state["last_id"] = rows[-1].id
+                state["processed"] += len(rows)
+                state["updated"] += updated
+                state["failed"] += failed
+                run_processed += len(rows)
+                save_checkpoint(args.checkpoint, state)
+
+                elapsed = time.perf_counter() - start
+                print(f"  {state['processed']:>7} processed  {state['updated']:>7} updated  "
+                      f"{state['failed']:>5} failed  {state['missing_audio']:>5} missing audio  "
+                      f"{run_processed / elapsed:6.2f} clips/s")
+    finally:
+        db.close()
+
+    # Scores changed, so the running baselines no longer match; recompute them
+    if state["updated"]:
+        with engine.begin() as conn:
+            rebuild_baselines(conn, Base.metadata, args.user)
+
+    elapsed = time.perf_counter() - start
+    print(f"\nRe-analyzed {run_processed} exercises in {elapsed:.1f}s with {args.workers} workers")
+    print(f"  Throughput: {run_processed / elapsed:.2f} clips/s, {audio_seconds / elapsed:.2f} audio seconds/s")
+    print(f"  Updated {state['updated']}, failed {state['failed']}, missing audio {state['missing_audio']}")
+    print(f"  Checkpoint: {args.checkpoint}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,63 +1,305 @@
 import os
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from groq import Groq
 from dotenv import load_dotenv
+from metrics import track_groq_call, FALLBACKS, STT_REQUESTS
+from circuit_breaker import breakers, CircuitOpenError, GROQ_TIMEOUT_SECONDS, GROQ_MAX_RETRIES
 
-class SpeechToText:
-    def __init__(self):
-        load_dotenv()
-        
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            print("\n" + "="*60)
-            print(" GROQ_API_KEY not found!")
-            print("="*60)
-            print("\n📋 Setup Instructions:")
-            print("1. Go to https://console.groq.com")
-            print("2. Sign up for free account")
-            print("3. Create an API key")
-            print("4. Create a .env file in this directory")
-            print("5. Add this line: GROQ_API_KEY=your_key_here")
-            print("\n" + "="*60)
-            raise ValueError("Missing GROQ_API_KEY in .env file")
-        
-        self.client = Groq(api_key=api_key)
+logger = logging.getLogger(__name__)
+
+# faster-whisper is optional - only needed for the local CPU engine
+try:
+    from faster_whisper import WhisperModel
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:
+        BatchedInferencePipeline = None
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    WhisperModel = None
+    BatchedInferencePipeline = None
+    FASTER_WHISPER_AVAILABLE = False
+
+# remote, local, local_first, remote_first or hedged
+STT_ROUTING = os.getenv("STT_ROUTING", "remote").lower()
+# Local engine: a faster-whisper model size or a path to a converted CTranslate2 model
+STT_LOCAL_MODEL = os.getenv("STT_LOCAL_MODEL", "base.en")
+STT_LOCAL_COMPUTE_TYPE = os.getenv("STT_LOCAL_COMPUTE_TYPE", "int8")
+STT_LOCAL_THREADS = int(os.getenv("STT_LOCAL_THREADS", "0"))
+# Segments of one clip decoded together, and clips transcribed in parallel
+STT_LOCAL_BATCH_SIZE = int(os.getenv("STT_LOCAL_BATCH_SIZE", "4"))
+STT_LOCAL_WORKERS = int(os.getenv("STT_LOCAL_WORKERS", "1"))
+# Clips up to this many seconds are transcribed locally whatever the routing (0 = off)
+STT_LOCAL_MAX_SECONDS = float(os.getenv("STT_LOCAL_MAX_SECONDS", "0"))
+# Hedged routing: start the second engine if the first hasn't answered by then
+# (by Groq's recent p95 instead, once the stt breaker has seen enough calls)
+STT_HEDGE_DELAY_MS = float(os.getenv("STT_HEDGE_DELAY_MS", "1500"))
+
+
+class STTBackend:
+    """A speech-to-text engine returning {"text", "words", "confidence"}; raises on failure"""
+
+    name = None
+
+    def transcribe(self, audio_file):
+        raise NotImplementedError
+
+
+class GroqSTTBackend(STTBackend):
+    """Groq Whisper API (whisper-large-v3-turbo)"""
+
+    name = "groq"
+
+    def __init__(self, api_key):
+        self.client = Groq(api_key=api_key, timeout=GROQ_TIMEOUT_SECONDS, max_retries=GROQ_MAX_RETRIES)
         print(" Groq Whisper initialized!")
-    
+
+    def transcribe(self, audio_file):
+        with open(audio_file, "rb") as file:
+            audio = file.read()
+        # While the stt circuit is open this raises CircuitOpenError at once
+        with breakers["stt"].guard(), track_groq_call("transcription"):
+            transcription = self.client.audio.transcriptions.create(
+                file=(audio_file, audio),
+                model="whisper-large-v3-turbo",
+                response_format="verbose_json",
+                language="en",
+                temperature=0.0
+            )
+
+        words = []
+        if hasattr(transcription, 'words') and transcription.words:
+            for word in transcription.words:
+                words.append({
+                    "word": word.word,
+                    "start": word.start,
+                    "end": word.end
+                })
+
+        return {
+            "text": transcription.text,
+            "words": words,
+            "confidence": 0.95,
+            # Length of the audio as Groq decoded (and billed) it
+            "duration": getattr(transcription, "duration", None)
+        }
+
+
+class LocalWhisperBackend(STTBackend):
+    """
+    faster-whisper (CTranslate2) on the CPU.
+
+    Callers transcribe from their own threads; CTranslate2 runs up to
+    STT_LOCAL_WORKERS clips at once and queues the rest. When
+    BatchedInferencePipeline is available, a clip's segments are decoded
+    STT_LOCAL_BATCH_SIZE at a time (batching is within a clip, not across
+    requests).
+    """
+
+    name = "local"
+
+    def __init__(self, model=STT_LOCAL_MODEL, compute_type=STT_LOCAL_COMPUTE_TYPE,
+                 batch_size=STT_LOCAL_BATCH_SIZE, workers=STT_LOCAL_WORKERS):
+        if not FASTER_WHISPER_AVAILABLE:
+            raise RuntimeError("faster-whisper is not installed")
+        self.model = WhisperModel(model, device="cpu", compute_type=compute_type,
+                                  cpu_threads=STT_LOCAL_THREADS, num_workers=max(1, workers))
+        self.pipeline = BatchedInferencePipeline(model=self.model) if BatchedInferencePipeline else None
+        self.batch_size = max(1, batch_size)
+        logger.info(f"Local Whisper initialized: model={model}, compute_type={compute_type}")
+
     def transcribe(self, audio_file):
-        """Transcribe audio file using Groq Whisper API"""
+        return self._transcribe_one(audio_file)
+
+    def _transcribe_one(self, audio_file):
+        options = dict(language="en", word_timestamps=True, beam_size=1, temperature=0.0)
+        if self.pipeline is not None:
+            segments, info = self.pipeline.transcribe(audio_file, batch_size=self.batch_size, **options)
+        else:
+            segments, info = self.model.transcribe(audio_file, vad_filter=True, **options)
+
+        texts, words, probabilities = [], [], []
+        for segment in segments:
+            texts.append(segment.text.strip())
+            for word in segment.words or []:
+                words.append({"word": word.word.strip(), "start": word.start, "end": word.end})
+                probabilities.append(word.probability)
+
+        return {
+            "text": " ".join(t for t in texts if t),
+            "words": words,
+            "confidence": sum(probabilities) / len(probabilities) if probabilities else 0.0
+        }
+
+
+def clip_duration(audio_file):
+    """Clip length in seconds, or None if the container can't be read cheaply"""
+    try:
+        import soundfile
+        return soundfile.info(audio_file).duration
+    except Exception:
+        return None
+
+
+class SpeechToText:
+    """
+    Transcribes clips through the configured STT engines.
+
+    STT_ROUTING chooses the engine order: remote (Groq only), local,
+    local_first / remote_first (fall back to the other engine on error or an
+    empty transcript) or hedged (start the preferred engine, and the other
+    one too if no answer arrives within STT_HEDGE_DELAY_MS, or Groq's recent
+    p95; first good result wins). Clips shorter than STT_LOCAL_MAX_SECONDS
+    skip the network. While the stt circuit breaker is open Groq is skipped
+    at once, so the local engine (or an empty transcript) is used.
+    """
+
+    def __init__(self, routing=STT_ROUTING):
+        load_dotenv()
+
+        self.routing = routing
+        self.remote = None
+        self.local = None
+
+        if routing != "local":
+            api_key = os.getenv("GROQ_API_KEY")
+            if api_key:
+                self.remote = GroqSTTBackend(api_key)
+            elif routing == "remote":
+                print("\n" + "="*60)
+                print(" GROQ_API_KEY not found!")
+                print("="*60)
+                print("\n📋 Setup Instructions:")
+                print("1. Go to https://console.groq.com")
+                print("2. Sign up for free account")
+                print("3. Create an API key")
+                print("4. Create a .env file in this directory")
+                print("5. Add this line: GROQ_API_KEY=your_key_here")
+                print("\n" + "="*60)
+                raise ValueError("Missing GROQ_API_KEY in .env file")
+
+        if routing != "remote" or STT_LOCAL_MAX_SECONDS > 0:
+            try:
+                self.local = LocalWhisperBackend()
+            except Exception as e:
+                logger.warning(f"Local STT engine not available: {e}")
+
+        if self.remote is None and self.local is None:
+            raise ValueError(f"No STT engine available for routing '{routing}'")
+
+        # Optional callback(seconds) for Groq audio whose transcript was discarded (a losing hedge)
+        self.usage_hook = None
+        self._hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stt-hedge") if routing == "hedged" else None
+
+    def _order(self, audio_file):
+        """Engines to try, preferred first"""
+        if self.local is not None and STT_LOCAL_MAX_SECONDS > 0:
+            duration = clip_duration(audio_file)
+            if duration is not None and duration <= STT_LOCAL_MAX_SECONDS:
+                # Local routing never falls back to the network
+                if self.routing == "local":
+                    return [self.local]
+                return [engine for engine in (self.local, self.remote) if engine is not None]
+        if self.routing in ("local", "local_first"):
+            order = [self.local, self.remote]
+        else:
+            order = [self.remote, self.local]
+        if self.routing in ("remote", "local"):
+            order = order[:1]
+        return [engine for engine in order if engine is not None]
+
+    @staticmethod
+    def _attempt(engine, audio_file):
+        """Run one engine, returning its result or None"""
         try:
-            with open(audio_file, "rb") as file:
-                transcription = self.client.audio.transcriptions.create(
-                    file=(audio_file, file.read()),
-                    model="whisper-large-v3-turbo",
-                    response_format="verbose_json",
-                    language="en",
-                    temperature=0.0
-                )
-            
-            words = []
-            if hasattr(transcription, 'words') and transcription.words:
-                for word in transcription.words:
-                    words.append({
-                        "word": word.word,
-                        "start": word.start,
-                        "end": word.end
-                    })
-            
-            return {
-                "text": transcription.text,
-                "words": words,
-                "confidence": 0.95
-            }
-            
+            result = engine.transcribe(audio_file)
+        except CircuitOpenError:
+            STT_REQUESTS.inc(backend=engine.name, outcome="circuit_open")
+            return None
         except Exception as e:
-            print(f"\n Groq API Error: {e}")
-            print("💡 Possible issues:")
-            print("  - Check your internet connection")
-            print("  - Verify API key is correct")
-            print("  - Check if you've exceeded free tier limit (14,400 sec/day)")
-            return {
-                "text": "",
-                "words": [],
-                "confidence": 0
-            }
\ No newline at end of file
+            STT_REQUESTS.inc(backend=engine.name, outcome="error")
+            print(f"\n STT Error ({engine.name}): {e}")
+            if engine.name == "groq":
+                print("💡 Possible issues:")
+                print("  - Check your internet connection")
+                print("  - Verify API key is correct")
+                print("  - Check if you've exceeded free tier limit (14,400 sec/day)")
+            return None
+        outcome = "success" if result.get("text") else "empty"
+        STT_REQUESTS.inc(backend=engine.name, outcome=outcome)
+        if not result.get("text"):
+            return None
+        result["engine"] = engine.name
+        return result
+
+    def _transcribe_hedged(self, engines, audio_file):
+        delay = STT_HEDGE_DELAY_MS / 1000
+        if engines[0] is self.remote:
+            delay = breakers["stt"].p95() or delay
+        pending = {self._hedge_pool.submit(self._attempt, engines[0], audio_file)}
+        done, pending = wait(pending, timeout=delay)
+        for future in done:
+            if future.result():
+                return future.result()
+        if len(engines) > 1:
+            pending.add(self._hedge_pool.submit(self._attempt, engines[1], audio_file))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result():
+                    # The slower engine keeps running in the background; its result is dropped
+                    for loser in pending:
+                        self._charge_when_done(loser)
+                    return future.result()
+        return None
+
+    def _charge_when_done(self, future):
+        """Report the audio of a discarded Groq transcription once it finishes, so it still counts"""
+        if self.usage_hook is None:
+            return
+        # The hook runs in the caller's context, so usage is charged to the same user
+        context = contextvars.copy_context()
+
+        def charge(finished):
+            result = finished.result()
+            if result and result.get("engine") == "groq":
+                try:
+                    context.run(self.usage_hook, result.get("duration"))
+                except Exception as e:
+                    logger.warning(f"Could not record discarded Groq transcription: {e}")
+
+        future.add_done_callback(charge)
+
+    @property
+    def has_local(self):
+        return self.local is not None
+
+    def transcribe(self, audio_file, local_only=False):
+        """
+        Transcribe an audio file with the configured engines; local_only
+        keeps it off the network (e.g. when the Groq budget is low). The
+        result's "engine" names the engine that produced it.
+        """
+        engines = self._order(audio_file)
+        if local_only:
+            engines = [engine for engine in engines if engine is self.local]
+
+        if self.routing == "hedged" and self._hedge_pool is not None and not local_only:
+            result = self._transcribe_hedged(engines, audio_file)
+        else:
+            result = None
+            for engine in engines:
+                result = self._attempt(engine, audio_file)
+                if result:
+                    break
+
+        if result:
+            return result
+        FALLBACKS.inc(kind="stt_error")
+        return {
+            "text": "",
+            "words": [],
+            "confidence": 0
+        }
@@ -2,13 +2,144 @@ import librosa
 import numpy as np
 from collections import Counter
 import difflib
-from pydub import AudioSegment
 import tempfile
 import os
 import re
-from scipy import signal
+import time
+from contextlib import contextmanager
 from scipy.ndimage import gaussian_filter1d
 
+# Bump whenever a change to analysis or diagnosis changes stored results
+ANALYZER_VERSION = "1.1"
+
+# Analysis runs at three rates: sibilant bands at up to SIBILANT_SAMPLE_RATE
+# (the upload's own rate if lower), general spectral/pause/voice features at
+# ANALYSIS_SAMPLE_RATE, and pitch and formants on a decimated copy at
+# PROSODY_SAMPLE_RATE, which still covers F0 and the first two formants.
+SIBILANT_SAMPLE_RATE = int(os.getenv("SIBILANT_SAMPLE_RATE", "32000"))
+ANALYSIS_SAMPLE_RATE = 16000
+PROSODY_SAMPLE_RATE = int(os.getenv("PROSODY_SAMPLE_RATE", "8000"))
+
+# Frequency bands (Hz) each stage looks at; clipped to the Nyquist limit of the signal it runs on
+PITCH_BAND = (50, 500)
+FORMANT_BAND = (90, 5000)
+SIBILANT_BANDS = {
+    's': (4000, 8000),
+    'sh': (2500, 6000),
+    'th': (6000, 10000),
+    'whistle': (8000, 12000),
+    'lateral': (2000, 4000),
+    'dental': (3000, 5000),
+}
+# Stages each analysis profile runs. Sections produced by skipped stages are
+# None in the result and listed in its skipped_stages; pauses always run,
+# since fluency scoring depends on them.
+ANALYSIS_STAGES = ["spectral_features", "pauses", "lisp", "pitch", "formants", "voice_quality"]
+ANALYSIS_PROFILES = {
+    "fast": ["pauses"],
+    "standard": ["pauses", "lisp", "pitch", "voice_quality"],
+    "full": ANALYSIS_STAGES,
+}
+DEFAULT_ANALYSIS_PROFILE = os.getenv("ANALYSIS_PROFILE", "full")
+
+# |z| against the user's own baseline at which diagnose calls a metric out
+BASELINE_NOTABLE_Z = float(os.getenv("BASELINE_NOTABLE_Z", "2.0"))
+
+# Baseline metric -> (higher is better, or None if neither; message when worse / lower, when better / higher)
+BASELINE_FEEDBACK = {
+    'score': (True, "This attempt scored below your usual level - take a breath and try again at your own pace.",
+              "This is one of your best scores so far - great progress!"),
+    'accuracy': (True, "You matched the exercise text less closely than you usually do.",
+                 "You matched the exercise text more closely than usual."),
+    'pause_ratio': (False, "You paused more than you usually do.",
+                    "You paused less than usual - your flow is improving."),
+    'speech_rate': (None, "You spoke more slowly than you usually do.", "You spoke faster than you usually do."),
+    'pitch_variation': (True, "Your intonation was flatter than usual.", "Your intonation was more expressive than usual."),
+    'lisp_likelihood': (False, "Your S sounds were less clear than usual.", "Your S sounds were clearer than usual."),
+    'clarity_score': (True, "Your voice was less clear than usual.", "Your voice was clearer than usual."),
+    'breathiness_score': (False, "Your voice was breathier than usual.", "Your voice was less breathy than usual."),
+}
+
+# Sibilant energies are normalised by the mean over this band, as they were when analysis ran only at 16 kHz
+SIBILANT_REFERENCE_BAND = (0, 8000)
+
+
+
+def band_within(band, sr):
+    """Clip a (low, high) band to the Nyquist limit at sr, or None if it lies entirely above it"""
+    low, high = band
+    nyquist = sr / 2
+    if low >= nyquist:
+        return None
+    return low, min(high, nyquist)
+
+
+# STFT frames per block when accumulating band energies (~1 MB of magnitudes at n_fft=2048)
+STFT_BLOCK_FRAMES = int(os.getenv("STFT_BLOCK_FRAMES", "256"))
+
+
+class BandEnergyAccumulator:
+    """
+    Running per-frequency-bin sums of STFT magnitudes.
+
+    Equivalent to reducing np.abs(librosa.stft(y)) to band means, but the
+    signal is transformed in blocks of STFT_BLOCK_FRAMES frames and only the
+    per-bin sums are kept, so memory doesn't grow with clip length.
+    """
+    
+    def __init__(self, sr, n_fft=2048, hop_length=512):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+        self.bin_sums = np.zeros(len(self.freqs))
+        self.n_frames = 0
+    
+    @classmethod
+    def from_signal(cls, y, sr, n_fft=2048, hop_length=512, block_frames=STFT_BLOCK_FRAMES):
+        """Accumulate the magnitudes of librosa.stft(y, center=True) block by block"""
+        acc = cls(sr, n_fft=n_fft, hop_length=hop_length)
+        pad = n_fft // 2
+        
+        if len(y) + 2 * pad < n_fft:
+            acc.add(np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)))
+            return acc
+        
+        # Frames of the zero-padded signal that librosa's centered STFT would produce
+        total_frames = 1 + (len(y) + 2 * pad - n_fft) // hop_length
+        for first in range(0, total_frames, block_frames):
+            last = min(first + block_frames, total_frames)
+            start = first * hop_length - pad
+            end = (last - 1) * hop_length + n_fft - pad
+            block = y[max(start, 0):min(end, len(y))]
+            if start < 0 or end > len(y):
+                block = np.pad(block, (max(-start, 0), max(end - len(y), 0)))
+            acc.add(np.abs(librosa.stft(block, n_fft=n_fft, hop_length=hop_length, center=False)))
+        return acc
+    
+    def add(self, magnitudes):
+        """Add a (bins x frames) block of STFT magnitudes"""
+        self.bin_sums += magnitudes.sum(axis=1, dtype=np.float64)
+        self.n_frames += magnitudes.shape[1]
+    
+    def band_mean(self, low_hz, high_hz):
+        """Mean magnitude over bins in [low_hz, high_hz] and all frames (0 if no bins)"""
+        mask = (self.freqs >= low_hz) & (self.freqs <= high_hz)
+        if not np.any(mask) or not self.n_frames:
+            return 0
+        return self.bin_sums[mask].sum() / (mask.sum() * self.n_frames)
+    
+    def covers(self, low_hz, high_hz):
+        """Whether the whole band lies below the Nyquist limit"""
+        return high_hz <= self.sr / 2
+    
+    def mean(self):
+        """Mean magnitude over all bins and frames"""
+        if not self.n_frames:
+            return 0.0
+        return self.bin_sums.sum() / (len(self.bin_sums) * self.n_frames)
+
+
 class VoiceAnalyzer:
     def __init__(self):
         # Extended phoneme categories for comprehensive analysis
@@ -47,13 +178,32 @@ class VoiceAnalyzer:
             'pause_ratio': {'ideal': 0.15, 'max': 0.35},
             'pitch_variation': {'min': 20, 'ideal': 50, 'max': 100}  # Hz
         }
+        
+        # Optional callback(stage_name, seconds) invoked after each analysis stage
+        self.stage_hook = None
+        
+        # Optional AnalysisCache for transcript-independent results
+        self.cache = None
+    
+    @contextmanager
+    def _stage(self, name):
+        """Time one analysis stage and report it to stage_hook"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.stage_hook is not None:
+                self.stage_hook(name, time.perf_counter() - start)
     
     def convert_audio_format(self, audio_file):
         """Convert audio file to a format compatible with librosa"""
         try:
+            from pydub import AudioSegment
             audio = AudioSegment.from_file(audio_file)
             temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            audio.export(temp_file.name, format="wav", parameters=["-ar", "16000", "-ac", "1"])
+            # Keep the upload's bandwidth (up to SIBILANT_SAMPLE_RATE) for the sibilant bands
+            sample_rate = min(audio.frame_rate, SIBILANT_SAMPLE_RATE)
+            audio.export(temp_file.name, format="wav", parameters=["-ar", str(sample_rate), "-ac", "1"])
             return temp_file.name
         except Exception as e:
             print(f"Warning: Could not convert audio format: {e}")
@@ -151,21 +301,67 @@ class VoiceAnalyzer:
         
         return detected
         
-    def analyze_audio(self, audio_file, transcription):
-        """Comprehensive audio analysis for speech issues"""
+    def analyze_audio(self, audio_file, transcription, profile=None):
+        """Comprehensive audio analysis for speech issues, limited to the stages of an analysis profile"""
+        profile = profile or DEFAULT_ANALYSIS_PROFILE
+        if profile not in ANALYSIS_PROFILES:
+            raise ValueError(f"Unknown analysis profile '{profile}'; expected one of {', '.join(ANALYSIS_PROFILES)}")
         try:
-            converted_file = self.convert_audio_format(audio_file)
-            y, sr = librosa.load(converted_file, sr=16000)
+            with self._stage("decode"):
+                converted_file = self.convert_audio_format(audio_file)
+                y, sr = librosa.load(converted_file, sr=None)
+                if sr > SIBILANT_SAMPLE_RATE:
+                    y = librosa.resample(y, orig_sr=sr, target_sr=SIBILANT_SAMPLE_RATE)
+                    sr = SIBILANT_SAMPLE_RATE
+                
+                if converted_file != audio_file and os.path.exists(converted_file):
+                    os.unlink(converted_file)
             
-            if converted_file != audio_file and os.path.exists(converted_file):
-                os.unlink(converted_file)
+            # Acoustic features don't depend on the transcript, so identical audio can reuse them
+            acoustics = None
+            if self.cache is not None:
+                with self._stage("cache_lookup"):
+                    cache_key = self.cache.key_for(y, sr, profile)
+                    acoustics = self.cache.get(cache_key)
             
-            # Basic features
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-            spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
-            spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
+            if acoustics is None:
+                acoustics = self.analyze_acoustics(y, sr, profile=profile)
+                if self.cache is not None:
+                    self.cache.put(cache_key, acoustics)
             
-            # Advanced pause analysis
+            return self.apply_transcription(acoustics, transcription)
+            
+        except Exception as e:
+            print(f"Warning: Could not analyze audio file {audio_file}: {e}")
+            return self._get_fallback_analysis(str(e))
+    
+    def analyze_acoustics(self, y_full, sr_full, profile=None):
+        """
+        Transcript-independent analysis of decoded audio (JSON-serializable).
+        
+        y_full is the decoded signal at its own rate (at most SIBILANT_SAMPLE_RATE);
+        the other stages run on resampled copies.
+        """
+        profile = profile or DEFAULT_ANALYSIS_PROFILE
+        stages = ANALYSIS_PROFILES[profile]
+        
+        with self._stage("resample"):
+            y, sr = y_full, ANALYSIS_SAMPLE_RATE
+            if sr_full != sr:
+                y = librosa.resample(y_full, orig_sr=sr_full, target_sr=sr)
+            if "pitch" in stages or "formants" in stages:
+                y_prosody = librosa.resample(y, orig_sr=sr, target_sr=PROSODY_SAMPLE_RATE)
+        
+        # Basic features
+        mfcc_mean = spectral_centroid_mean = spectral_bandwidth_mean = None
+        if "spectral_features" in stages:
+            with self._stage("spectral_features"):
+                mfcc_mean = float(np.mean(librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)))
+                spectral_centroid_mean = float(np.mean(librosa.feature.spectral_centroid(y=y, sr=sr)))
+                spectral_bandwidth_mean = float(np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr)))
+        
+        # Advanced pause analysis
+        with self._stage("pauses"):
             rms = librosa.feature.rms(y=y)[0]
             rms_smooth = gaussian_filter1d(rms, sigma=3)
             pause_threshold = np.mean(rms_smooth) * 0.15
@@ -174,59 +370,92 @@ class VoiceAnalyzer:
             
             # Detect pause durations
             pause_durations = self._analyze_pause_patterns(rms_smooth, pause_threshold, sr)
+        
+        lisp_acoustics = pitch_analysis = formant_analysis = voice_quality = None
+        if "lisp" in stages:
+            # Spectral band energies shared by the sibilant and lisp analysis
+            with self._stage("band_energy"):
+                bands = BandEnergyAccumulator.from_signal(y_full, sr_full)
             
-            # Speech rate calculation
-            words = transcription.get("words", [])
-            text = transcription.get("text", "")
-            
-            if len(words) > 1:
-                duration = words[-1].get("end", 0) - words[0].get("start", 0)
-                speech_rate = len(words) / duration if duration > 0 else 0
-            else:
-                # Estimate from text if word timestamps unavailable
-                word_count = len(self._normalize_text(text))
-                audio_duration = len(y) / sr
-                speech_rate = word_count / audio_duration if audio_duration > 0 else 0
-            
-            # Repetition analysis
-            text_words = self._normalize_text(text)
-            repetitions = self._count_repetitions(text_words)
-            stuttering_patterns = self._detect_stuttering_patterns(text)
-            
-            # Lisp detection - comprehensive analysis
-            lisp_analysis = self._comprehensive_lisp_analysis(y, sr, text)
-            
-            # Pitch analysis for speech naturalness
-            pitch_analysis = self._analyze_pitch(y, sr)
-            
-            # Formant analysis (vowel quality)
-            formant_analysis = self._analyze_formants(y, sr)
-            
-            # Voice quality metrics
-            voice_quality = self._analyze_voice_quality(y, sr)
-            
-            return {
-                "pause_ratio": float(pause_ratio),
-                "pause_durations": pause_durations,
-                "speech_rate": float(speech_rate),
-                "repetitions": repetitions,
-                "stuttering_patterns": stuttering_patterns,
-                "lisp_analysis": lisp_analysis,
-                "pitch_analysis": pitch_analysis,
-                "formant_analysis": formant_analysis,
-                "voice_quality": voice_quality,
-                "mfcc_mean": float(np.mean(mfccs)),
-                "spectral_centroid_mean": float(np.mean(spectral_centroid)),
-                "spectral_bandwidth_mean": float(np.mean(spectral_bandwidth)),
-                "duration": float(len(y) / sr),
-                # Legacy compatibility
-                "lisp_words": lisp_analysis.get('detected_words', []),
-                "high_freq_energy": lisp_analysis.get('sibilant_energy', 0.5)
-            }
-            
-        except Exception as e:
-            print(f"Warning: Could not analyze audio file {audio_file}: {e}")
-            return self._get_fallback_analysis(str(e))
+            # Lisp detection - spectral part
+            with self._stage("lisp"):
+                lisp_acoustics = self._lisp_acoustics(y_full, sr_full, bands=bands)
+        
+        # Pitch analysis for speech naturalness
+        if "pitch" in stages:
+            with self._stage("pitch"):
+                pitch_analysis = self._analyze_pitch(y_prosody, PROSODY_SAMPLE_RATE)
+        
+        # Formant analysis (vowel quality)
+        if "formants" in stages:
+            with self._stage("formants"):
+                formant_analysis = self._analyze_formants(y_prosody, PROSODY_SAMPLE_RATE)
+        
+        # Voice quality metrics
+        if "voice_quality" in stages:
+            with self._stage("voice_quality"):
+                voice_quality = self._analyze_voice_quality(y, sr)
+        
+        return {
+            "pause_ratio": float(pause_ratio),
+            "pause_durations": pause_durations,
+            "lisp_acoustics": lisp_acoustics,
+            "pitch_analysis": pitch_analysis,
+            "formant_analysis": formant_analysis,
+            "voice_quality": voice_quality,
+            "mfcc_mean": mfcc_mean,
+            "spectral_centroid_mean": spectral_centroid_mean,
+            "spectral_bandwidth_mean": spectral_bandwidth_mean,
+            "duration": float(len(y) / sr),
+            "profile": profile,
+            "skipped_stages": [stage for stage in ANALYSIS_STAGES if stage not in stages]
+        }
+    
+    def apply_transcription(self, acoustics, transcription):
+        """Combine acoustic results with the transcript-dependent metrics"""
+        words = transcription.get("words", [])
+        text = transcription.get("text", "")
+        
+        # Speech rate calculation
+        if len(words) > 1:
+            duration = words[-1].get("end", 0) - words[0].get("start", 0)
+            speech_rate = len(words) / duration if duration > 0 else 0
+        else:
+            # Estimate from text if word timestamps unavailable
+            word_count = len(self._normalize_text(text))
+            audio_duration = acoustics["duration"]
+            speech_rate = word_count / audio_duration if audio_duration > 0 else 0
+        
+        # Repetition analysis
+        text_words = self._normalize_text(text)
+        repetitions = self._count_repetitions(text_words)
+        stuttering_patterns = self._detect_stuttering_patterns(text)
+        
+        # Lisp detection - combine spectral indicators with the words spoken
+        lisp_analysis = None
+        if acoustics["lisp_acoustics"] is not None:
+            lisp_analysis = self._lisp_from_acoustics(acoustics["lisp_acoustics"], text)
+        
+        return {
+            "pause_ratio": acoustics["pause_ratio"],
+            "pause_durations": acoustics["pause_durations"],
+            "speech_rate": float(speech_rate),
+            "repetitions": repetitions,
+            "stuttering_patterns": stuttering_patterns,
+            "lisp_analysis": lisp_analysis,
+            "pitch_analysis": acoustics["pitch_analysis"],
+            "formant_analysis": acoustics["formant_analysis"],
+            "voice_quality": acoustics["voice_quality"],
+            "mfcc_mean": acoustics["mfcc_mean"],
+            "spectral_centroid_mean": acoustics["spectral_centroid_mean"],
+            "spectral_bandwidth_mean": acoustics["spectral_bandwidth_mean"],
+            "duration": acoustics["duration"],
+            "profile": acoustics.get("profile", "full"),
+            "skipped_stages": acoustics.get("skipped_stages", []),
+            # Legacy compatibility
+            "lisp_words": lisp_analysis.get('detected_words', []) if lisp_analysis else [],
+            "high_freq_energy": lisp_analysis.get('sibilant_energy', 0.5) if lisp_analysis else None
+        }
     
     def _analyze_pause_patterns(self, rms, threshold, sr):
         """Analyze pause durations and patterns"""
@@ -258,27 +487,17 @@ class VoiceAnalyzer:
             'long_pauses': len([p for p in pauses if p['duration'] > 0.5])
         }
     
-    def _comprehensive_lisp_analysis(self, y, sr, text):
+    def _comprehensive_lisp_analysis(self, y, sr, text, bands=None):
         """Advanced lisp detection using multiple techniques"""
-        result = {
-            'likelihood': 0.0,
-            'type': None,
-            'affected_sounds': [],
-            'sibilant_energy': 0.0,
-            'detected_words': [],
-            'recommendations': []
-        }
+        return self._lisp_from_acoustics(self._lisp_acoustics(y, sr, bands=bands), text)
+    
+    def _lisp_acoustics(self, y, sr, bands=None):
+        """Spectral lisp indicators, independent of what was said"""
+        if bands is None:
+            bands = BandEnergyAccumulator.from_signal(y, sr)
         
         # 1. Spectral analysis for sibilants
-        sibilant_analysis = self._analyze_sibilant_frequencies(y, sr)
-        result['sibilant_energy'] = sibilant_analysis['overall_energy']
-        
-        # 2. Detect words with target sounds
-        detected = self._detect_lisp_words_in_text(text)
-        all_lisp_words = []
-        for category, words in detected.items():
-            all_lisp_words.extend(words)
-        result['detected_words'] = list(set(all_lisp_words))[:10]  # Limit to 10
+        sibilant_analysis = self._analyze_sibilant_frequencies(y, sr, bands=bands)
         
         # 3. Analyze frequency characteristics for lisp types
         lisp_indicators = {
@@ -287,41 +506,62 @@ class VoiceAnalyzer:
             'palatal_lisp': 0,  # Tongue too far back
             'dentalized': 0     # Tongue on teeth
         }
+        affected_sounds = []
         
         # Analyze high-frequency characteristics
-        stft = np.abs(librosa.stft(y))
-        freqs = librosa.fft_frequencies(sr=sr)
         
         # S sound analysis (4-8 kHz)
-        s_freq_mask = (freqs >= 4000) & (freqs <= 8000)
-        s_energy = np.mean(stft[s_freq_mask]) if np.any(s_freq_mask) else 0
+        s_energy = bands.band_mean(*SIBILANT_BANDS['s'])
         
         # TH sound analysis (6-10 kHz) - frontal lisp indicator
-        th_freq_mask = (freqs >= 6000) & (freqs <= 10000)
-        th_energy = np.mean(stft[th_freq_mask]) if np.any(th_freq_mask) else 0
+        th_energy = bands.band_mean(*SIBILANT_BANDS['th'])
         
         # Lower frequency energy (lateral lisp indicator)
-        low_freq_mask = (freqs >= 2000) & (freqs <= 4000)
-        low_energy = np.mean(stft[low_freq_mask]) if np.any(low_freq_mask) else 0
+        low_energy = bands.band_mean(*SIBILANT_BANDS['lateral'])
         
-        total_energy = np.mean(stft) + 1e-10
+        total_energy = bands.band_mean(*SIBILANT_REFERENCE_BAND) + 1e-10
         
         # Check for frontal lisp (TH substitution for S)
         if s_energy < total_energy * 0.15 and th_energy > total_energy * 0.1:
             lisp_indicators['frontal_lisp'] += 1
-            result['affected_sounds'].append('s→th (frontal lisp)')
+            affected_sounds.append('s→th (frontal lisp)')
         
         # Check for lateral lisp (slushy S sound)
         if low_energy > s_energy * 0.8 and s_energy < total_energy * 0.2:
             lisp_indicators['lateral_lisp'] += 1
-            result['affected_sounds'].append('lateral S')
+            affected_sounds.append('lateral S')
         
         # Check for dentalized S (tongue against teeth)
-        mid_freq_mask = (freqs >= 3000) & (freqs <= 5000)
-        mid_energy = np.mean(stft[mid_freq_mask]) if np.any(mid_freq_mask) else 0
+        mid_energy = bands.band_mean(*SIBILANT_BANDS['dental'])
         if mid_energy > s_energy * 1.2:
             lisp_indicators['dentalized'] += 1
-            result['affected_sounds'].append('dentalized S')
+            affected_sounds.append('dentalized S')
+        
+        return {
+            'sibilant_analysis': sibilant_analysis,
+            'indicators': lisp_indicators,
+            'affected_sounds': affected_sounds
+        }
+    
+    def _lisp_from_acoustics(self, lisp_acoustics, text):
+        """Lisp likelihood, type and recommendations from spectral indicators and the transcript"""
+        sibilant_analysis = lisp_acoustics['sibilant_analysis']
+        lisp_indicators = lisp_acoustics['indicators']
+        result = {
+            'likelihood': 0.0,
+            'type': None,
+            'affected_sounds': list(lisp_acoustics['affected_sounds']),
+            'sibilant_energy': sibilant_analysis['overall_energy'],
+            'detected_words': [],
+            'recommendations': []
+        }
+        
+        # 2. Detect words with target sounds
+        detected = self._detect_lisp_words_in_text(text)
+        all_lisp_words = []
+        for category, words in detected.items():
+            all_lisp_words.extend(words)
+        result['detected_words'] = list(set(all_lisp_words))[:10]  # Limit to 10
         
         # 4. Calculate overall lisp likelihood
         has_target_words = len(all_lisp_words) > 0
@@ -352,30 +592,30 @@ class VoiceAnalyzer:
         
         return result
     
-    def _analyze_sibilant_frequencies(self, y, sr):
+    def _analyze_sibilant_frequencies(self, y, sr, bands=None):
         """Detailed analysis of sibilant sounds"""
-        stft = np.abs(librosa.stft(y))
-        freqs = librosa.fft_frequencies(sr=sr)
-        total_power = np.mean(stft) + 1e-10
+        if bands is None:
+            bands = BandEnergyAccumulator.from_signal(y, sr)
+        total_power = bands.band_mean(*SIBILANT_REFERENCE_BAND) + 1e-10
         
         # S sound (4-8 kHz)
-        s_mask = (freqs >= 4000) & (freqs <= 8000)
-        s_power = np.mean(stft[s_mask]) if np.any(s_mask) else 0
+        s_power = bands.band_mean(*SIBILANT_BANDS['s'])
         
         # SH sound (2.5-6 kHz)
-        sh_mask = (freqs >= 2500) & (freqs <= 6000)
-        sh_power = np.mean(stft[sh_mask]) if np.any(sh_mask) else 0
+        sh_power = bands.band_mean(*SIBILANT_BANDS['sh'])
         
-        # High frequency whistle (could indicate air escape)
-        whistle_mask = (freqs >= 8000) & (freqs <= 12000)
-        whistle_power = np.mean(stft[whistle_mask]) if np.any(whistle_mask) else 0
+        # High frequency whistle (could indicate air escape); needs a >= 24 kHz upload
+        whistle_power = bands.band_mean(*SIBILANT_BANDS['whistle'])
         
         return {
             'overall_energy': float(s_power / total_power),
             's_quality': float(s_power / (s_power + sh_power + 1e-10)),
             'sh_quality': float(sh_power / total_power),
             'energy_ratio': float((s_power + sh_power) / total_power),
-            'whistle_indicator': float(whistle_power / total_power)
+            'whistle_indicator': float(whistle_power / total_power) if bands.covers(*SIBILANT_BANDS['whistle']) else None,
+            'sample_rate': int(bands.sr),
+            # Bands only partly (or not at all) below the Nyquist limit of this upload
+            'band_limited': [name for name, band in SIBILANT_BANDS.items() if not bands.covers(*band)]
         }
     
     def _get_lisp_recommendations(self, lisp_type, affected_sounds):
@@ -416,15 +656,18 @@ class VoiceAnalyzer:
     def _analyze_pitch(self, y, sr):
         """Analyze pitch characteristics for speech naturalness"""
         try:
-            pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+            # Same frequency resolution and frame duration (2048 samples at 16 kHz) at any rate
+            n_fft = 2048 * sr // ANALYSIS_SAMPLE_RATE
+            pitches, magnitudes = librosa.piptrack(y=y, sr=sr, n_fft=n_fft, hop_length=n_fft // 4)
             pitch_values = []
+            low, high = band_within(PITCH_BAND, sr)
             
             for t in range(pitches.shape[1]):
                 pitch = pitches[:, t]
                 mag = magnitudes[:, t]
                 if mag.max() > 0:
                     idx = mag.argmax()
-                    if pitch[idx] > 50 and pitch[idx] < 500:  # Valid pitch range
+                    if pitch[idx] > low and pitch[idx] < high:  # Valid pitch range
                         pitch_values.append(pitch[idx])
             
             if pitch_values:
@@ -454,30 +697,31 @@ class VoiceAnalyzer:
             
             frames = librosa.util.frame(y_preemph, frame_length=frame_length, hop_length=hop_length)
             
-            f1_values = []
-            f2_values = []
+            # Usual LPC rule of thumb: two poles per kHz of bandwidth plus two
+            order = int(sr / 1000) + 2
+            low, high = band_within(FORMANT_BAND, sr)
             
-            for frame in frames.T:
-                # Apply window
-                windowed = frame * np.hamming(len(frame))
-                
-                # LPC analysis (order 12 for formants)
-                try:
-                    lpc_coeffs = librosa.lpc(windowed, order=12)
-                    roots = np.roots(lpc_coeffs)
-                    roots = roots[np.imag(roots) >= 0]
-                    
-                    angles = np.arctan2(np.imag(roots), np.real(roots))
-                    freqs = angles * (sr / (2 * np.pi))
-                    freqs = sorted([f for f in freqs if f > 90 and f < 5000])
-                    
-                    if len(freqs) >= 2:
-                        f1_values.append(freqs[0])
-                        f2_values.append(freqs[1])
-                except:
-                    continue
+            # LPC for every windowed frame at once
+            windowed = frames.T * np.hamming(frame_length)
+            lpc_coeffs = librosa.lpc(windowed, order=order, axis=-1)
+            lpc_coeffs = lpc_coeffs[np.all(np.isfinite(lpc_coeffs), axis=1)]
+            
+            # Roots of each LPC polynomial, as np.roots finds them: eigenvalues of its companion matrix
+            companion = np.zeros((len(lpc_coeffs), order, order))
+            companion[:, 0, :] = -lpc_coeffs[:, 1:] / lpc_coeffs[:, :1]
+            companion[:, np.arange(1, order), np.arange(order - 1)] = 1
+            roots = np.linalg.eigvals(companion)
+            
+            freqs = np.arctan2(np.imag(roots), np.real(roots)) * (sr / (2 * np.pi))
+            valid = (np.imag(roots) >= 0) & (freqs > low) & (freqs < high)
+            freqs = np.sort(np.where(valid, freqs, np.inf), axis=1)
+            
+            # The two lowest in-band resonances of each frame that has at least two
+            voiced = np.isfinite(freqs[:, 1])
+            f1_values = freqs[voiced, 0]
+            f2_values = freqs[voiced, 1]
             
-            if f1_values and f2_values:
+            if len(f1_values):
                 return {
                     'f1_mean': float(np.mean(f1_values)),
                     'f2_mean': float(np.mean(f2_values)),
@@ -575,8 +819,18 @@ class VoiceAnalyzer:
             "error": f"Audio analysis failed: {error_msg}"
         }
     
-    def diagnose(self, analysis, transcription, expected_text=None):
-        """Generate comprehensive diagnosis based on analysis"""
+    def diagnose(self, analysis, transcription, expected_text=None, baseline=None):
+        """
+        Generate comprehensive diagnosis based on analysis.
+
+        Sections skipped by the analysis profile produce no findings, and
+        their score components are left out: the score is renormalized
+        over the components that ran, so partial-profile scores stay
+        comparable with full ones.
+        
+        baseline is the user's {metric: {"n", "mean", "std"}} (baselines.baseline_snapshot);
+        when given, metrics are also compared with the user's own history.
+        """
         issues = []
         feedback = []
         detailed_feedback = []
@@ -605,7 +859,7 @@ class VoiceAnalyzer:
             accuracy_score = 0.5
         
         # 2. LISP ANALYSIS
-        lisp_analysis = analysis.get("lisp_analysis", {})
+        lisp_analysis = analysis.get("lisp_analysis") or {}
         lisp_likelihood = lisp_analysis.get("likelihood", 0)
         
         if lisp_likelihood > 0.5:
@@ -640,8 +894,8 @@ class VoiceAnalyzer:
         
         # 3. STUTTERING/FLUENCY ANALYSIS
         pause_ratio = analysis.get("pause_ratio", 0)
-        pause_info = analysis.get("pause_durations", {})
-        stuttering = analysis.get("stuttering_patterns", {})
+        pause_info = analysis.get("pause_durations") or {}
+        stuttering = analysis.get("stuttering_patterns") or {}
         repetitions = analysis.get("repetitions", 0)
         
         fluency_issues = []
@@ -682,7 +936,7 @@ class VoiceAnalyzer:
             feedback.append("You're speaking quite fast. Try slowing down for clarity.")
         
         # 5. VOICE QUALITY ANALYSIS
-        voice_quality = analysis.get("voice_quality", {})
+        voice_quality = analysis.get("voice_quality") or {}
         if voice_quality.get("breathiness_score", 0) > 0.4:
             issues.append("breathy_voice")
             feedback.append("Your voice sounds breathy. Try supporting with more breath.")
@@ -692,7 +946,7 @@ class VoiceAnalyzer:
             feedback.append("Voice clarity could be improved. Speak from your diaphragm.")
         
         # 6. PITCH ANALYSIS
-        pitch_analysis = analysis.get("pitch_analysis", {})
+        pitch_analysis = analysis.get("pitch_analysis") or {}
         if pitch_analysis.get("variation_score", 0.5) < 0.2:
             issues.append("monotone")
             feedback.append("Try varying your pitch more for expressive speech.")
@@ -726,7 +980,14 @@ class VoiceAnalyzer:
             articulation_component -= 2
         articulation_component = max(0, articulation_component)
         
-        score = accuracy_component + fluency_component + clarity_component + articulation_component
+        # Only components whose stages ran count; the score is scaled back to 100
+        skipped = set(analysis.get("skipped_stages") or [])
+        components = {"accuracy": (accuracy_component, 60), "fluency": (fluency_component, 20)}
+        if "voice_quality" not in skipped:
+            components["clarity"] = (clarity_component, 10)
+        if "lisp" not in skipped:
+            components["articulation"] = (articulation_component, 10)
+        score = sum(value for value, _ in components.values()) * 100 / sum(weight for _, weight in components.values())
         score = max(0, min(100, score))
         
         # 8. GENERATE FINAL FEEDBACK
@@ -740,24 +1001,61 @@ class VoiceAnalyzer:
             else:
                 feedback.append("Keep practicing. Try speaking slowly and clearly.")
         
+        # 9. COMPARE WITH THE USER'S OWN BASELINE
+        baseline_comparison = None
+        if baseline:
+            baseline_comparison = self._compare_with_baseline(baseline, {
+                'score': score,
+                'accuracy': accuracy_score if expected_text else None,
+                'pause_ratio': pause_ratio,
+                'speech_rate': speech_rate,
+                'pitch_variation': pitch_analysis.get("variation_score"),
+                'lisp_likelihood': lisp_analysis.get("likelihood"),
+                'clarity_score': voice_quality.get("clarity_score"),
+                'breathiness_score': voice_quality.get("breathiness_score"),
+            })
+            feedback.extend(baseline_comparison.pop("feedback"))
+        
         return {
             "issues": issues,
             "feedback": feedback,
             "detailed_feedback": detailed_feedback,
             "score": round(score, 1),
             "accuracy": round(accuracy_score, 4),
-            "component_scores": {
-                "accuracy": round(accuracy_component, 1),
-                "fluency": round(fluency_component, 1),
-                "clarity": round(clarity_component, 1),
-                "articulation": round(articulation_component, 1)
-            },
+            "component_scores": {name: round(value, 1) for name, (value, _) in components.items()},
             "lisp_analysis": {
                 "likelihood": round(lisp_likelihood, 2),
                 "type": lisp_analysis.get("type"),
                 "recommendations": lisp_analysis.get("recommendations", [])
             },
-            "suggestions": self._generate_suggestions(issues, accuracy_score, lisp_analysis)
+            "suggestions": self._generate_suggestions(issues, accuracy_score, lisp_analysis),
+            "baseline_comparison": baseline_comparison
+        }
+    
+    def _compare_with_baseline(self, baseline, values):
+        """z-scores of this submission's metrics against the user's baseline, plus feedback on notable ones"""
+        z_scores = {}
+        notable = []
+        feedback = []
+        for metric, value in values.items():
+            stats = baseline.get(metric)
+            if value is None or not stats or stats["std"] <= 0:
+                continue
+            z = (value - stats["mean"]) / stats["std"]
+            z_scores[metric] = round(z, 2)
+            if abs(z) < BASELINE_NOTABLE_Z:
+                continue
+            notable.append(metric)
+            higher_is_better, worse_or_lower, better_or_higher = BASELINE_FEEDBACK[metric]
+            if higher_is_better is None:
+                feedback.append(better_or_higher if z > 0 else worse_or_lower)
+            else:
+                feedback.append(better_or_higher if (z > 0) == higher_is_better else worse_or_lower)
+        return {
+            "samples": max(stats["n"] for stats in baseline.values()),
+            "z_scores": z_scores,
+            "notable": notable,
+            "feedback": feedback
         }
     
     def _generate_suggestions(self, issues, accuracy, lisp_analysis=None):
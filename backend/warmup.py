@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Cold-start warm-up for the analysis pipeline.
+
+The first analysis in a fresh process pays for importing librosa, scipy,
+pydub and groq and for numba compiling librosa's kernels. The API runs
+this warm-up in the background at startup (WARMUP_ON_STARTUP, on by
+default) and reports ready on /health once it has finished. Numba keeps
+compiled kernels in NUMBA_CACHE_DIR, so later processes only load them.
+
+Run directly to populate the numba cache, e.g. while building the image:
+
+    python warmup.py
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import importlib
+
+import numpy as np
+from scipy.io import wavfile
+
+HEAVY_IMPORTS = ["scipy.signal", "scipy.ndimage", "librosa", "pydub", "groq"]
+WARMUP_CLIP_SECONDS = float(os.getenv("WARMUP_CLIP_SECONDS", "1.5"))
+SYNTHETIC_SR = 16000
+
+
+def make_synthetic_clip(seconds, path, seed=0):
+    """Write a speech-like test clip: voiced tones with vibrato, noise bursts and pauses"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SYNTHETIC_SR)) / SYNTHETIC_SR
+
+    # Voiced carrier with a slowly varying pitch and a few harmonics
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / SYNTHETIC_SR
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+
+    # Sibilant-like high-passed noise bursts
+    noise = rng.standard_normal(len(t))
+    noise = np.diff(noise, prepend=0.0)
+    burst_gate = (np.sin(2 * np.pi * 1.3 * t) > 0.85).astype(float)
+
+    # Syllable envelope with silent gaps
+    envelope = np.clip(np.sin(2 * np.pi * 2.0 * t), 0, None)
+    envelope *= (np.sin(2 * np.pi * 0.2 * t) > -0.6)
+
+    y = 0.3 * voiced * envelope + 0.1 * noise * burst_gate
+    y /= np.max(np.abs(y)) + 1e-9
+    wavfile.write(path, SYNTHETIC_SR, (y * 32767 * 0.8).astype(np.int16))
+
+
+def import_heavy_modules():
+    """Import the heavy dependencies, returning seconds per module (None if unavailable)"""
+    timings = {}
+    for name in HEAVY_IMPORTS:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            timings[name] = round(time.perf_counter() - start, 3)
+        except ImportError:
+            timings[name] = None
+    return timings
+
+
+def warm_analyzer(analyzer=None, seconds=WARMUP_CLIP_SECONDS):
+    """
+    Run a synthetic clip through every analysis stage and diagnose,
+    bypassing the analysis cache. Returns seconds per stage.
+
+    Uses its own VoiceAnalyzer unless one is given; the given analyzer's
+    stage_hook and cache are replaced, so never pass the one serving
+    requests (the compiled kernels it warms are shared process-wide).
+    """
+    if analyzer is None:
+        from voice_analysis import VoiceAnalyzer
+        analyzer = VoiceAnalyzer()
+    stages = {}
+    analyzer.stage_hook = lambda stage, elapsed: stages.__setitem__(stage, round(elapsed, 3))
+    analyzer.cache = None
+
+    transcription = {"text": "She sells seashells by the seashore", "words": []}
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        make_synthetic_clip(seconds, path)
+        analysis = analyzer.analyze_audio(path, transcription)
+        if "error" in analysis:
+            raise RuntimeError(f"Warm-up analysis failed: {analysis['error']}")
+        with analyzer._stage("diagnose"):
+            analyzer.diagnose(analysis, transcription, expected_text=transcription["text"])
+    finally:
+        os.unlink(path)
+    return stages
+
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    imports = import_heavy_modules()
+
+    from voice_analysis import VoiceAnalyzer
+    analyzer = VoiceAnalyzer()
+    first = warm_analyzer(analyzer)
+    second = warm_analyzer(analyzer)
+
+    print(json.dumps({
+        "numba_cache_dir": os.getenv("NUMBA_CACHE_DIR"),
+        "imports": imports,
+        "first_run_stages": first,
+        "warm_run_stages": second,
+        "total_seconds": round(time.perf_counter() - start, 3)
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
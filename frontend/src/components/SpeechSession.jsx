@@ -27,6 +27,7 @@ function SpeechSession({ exerciseText = "Sally sells seashells by the seashore",
   ]);
   const [chatInput, setChatInput] = useState("");
   const [chatLoading, setChatLoading] = useState(false);
+  const [chatConversationId, setChatConversationId] = useState(null);
 
   const startRecording = async () => {
     try {
@@ -113,7 +114,8 @@ function SpeechSession({ exerciseText = "Sally sells seashells by the seashore",
     setChatLoading(true);
 
     try {
-      const response = await apiClient.chatWithWhiskers(userMessage);
+      const response = await apiClient.chatWithWhiskers(userMessage, chatConversationId);
+      setChatConversationId(response.conversation_id);
       setChatMessages((prev) => [
         ...prev,
         { role: "assistant", content: response.message }
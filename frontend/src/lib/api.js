@@ -110,15 +110,21 @@ export const apiClient = {
   },
 
   /* ---------------- Chat with Mr. Whiskers ---------------- */
-  async chatWithWhiskers(message) {
+  // Pass the conversation_id from the previous reply to continue the conversation
+  async chatWithWhiskers(message, conversationId = null) {
     const res = await fetch(`${API_BASE_URL}/api/chat`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ message }),
+      body: JSON.stringify({ message, conversation_id: conversationId }),
     })
 
+    // The server no longer knows this conversation; start a new one
+    if (res.status === 404 && conversationId) {
+      return this.chatWithWhiskers(message)
+    }
+
     if (!res.ok) {
       throw new Error("Failed to chat with Mr. Whiskers")
     }
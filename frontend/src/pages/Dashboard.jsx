@@ -25,6 +25,7 @@ export default function Dashboard({ onStartExercise }) {
   ])
   const [chatInput, setChatInput] = useState("")
   const [chatLoading, setChatLoading] = useState(false)
+  const [chatConversationId, setChatConversationId] = useState(null)
 
   // Load user stats on mount
   useEffect(() => {
@@ -75,7 +76,8 @@ export default function Dashboard({ onStartExercise }) {
     setChatLoading(true)
 
     try {
-      const response = await apiClient.chatWithWhiskers(userMessage)
+      const response = await apiClient.chatWithWhiskers(userMessage, chatConversationId)
+      setChatConversationId(response.conversation_id)
       setChatMessages(prev => [
         ...prev,
         { role: "assistant", content: response.message }
@@ -342,6 +342,7 @@ export default function ExerciseRunner() {
   ])
   const [chatInput, setChatInput] = useState("")
   const [chatLoading, setChatLoading] = useState(false)
+  const [chatConversationId, setChatConversationId] = useState(null)
 
   const recorderRef = useRef(null)
   const chunksRef = useRef([])
@@ -557,7 +558,8 @@ export default function ExerciseRunner() {
     setChatLoading(true)
 
     try {
-      const response = await apiClient.chatWithWhiskers(userMessage)
+      const response = await apiClient.chatWithWhiskers(userMessage, chatConversationId)
+      setChatConversationId(response.conversation_id)
       setChatMessages(prev => [
         ...prev,
         { role: "assistant", content: response.message }
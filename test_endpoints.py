@@ -2,14 +2,45 @@
 """
 API Endpoint Verification Script
 Tests all critical endpoints that the frontend uses
+
+Load test mode replays a traffic mix of audio submissions (from the
+sample corpus), history reads and progress reads against a running
+instance at a fixed request rate:
+
+    python test_endpoints.py --load --rate 5 --duration 60 --concurrency 16
+    python test_endpoints.py --load --mix submit=1,history=4,progress=4 --output load.json
+
+Every load submission carries a fresh Idempotency-Key. The corpus is a few
+fixed clips, and without a key the server would replay repeats of the same
+audio and exercise text from its idempotency store instead of running STT,
+analysis and the LLM.
 """
 
+import argparse
+import itertools
+import random
+import statistics
+import threading
+import time
+import uuid
 import requests
 import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
 BASE_URL = "http://localhost:8000"
 
+ROOT_DIR = Path(__file__).resolve().parent
+DEFAULT_CORPUS = [ROOT_DIR / "audio_samples", ROOT_DIR / "backend" / "audio_samples"]
+LOAD_EXERCISE_TEXTS = [
+    "Sally sells seashells by the seashore",
+    "Peter Piper picked a peck of pickled peppers",
+    "The sun shines on the sea",
+]
+DEFAULT_MIX = "submit=1,history=3,progress=3"
+
 # Color codes for terminal output
 GREEN = '\033[92m'
 RED = '\033[91m'
@@ -149,6 +180,217 @@ def test_save_progress():
         print(f"  Error: {e}\n")
         return False
 
+# ============================================================================
+# Load test
+# ============================================================================
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def parse_mix(mix):
+    """Parse 'submit=1,history=3' into {endpoint: weight}"""
+    weights = {}
+    for part in mix.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in LOAD_REQUESTS:
+            raise ValueError(f"Unknown endpoint '{name}' in --mix (choose from {', '.join(LOAD_REQUESTS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def load_corpus(corpus_dirs):
+    """Read every sample recording into memory so disk reads don't skew timings"""
+    clips = []
+    for directory in corpus_dirs:
+        for path in sorted(Path(directory).glob("*.wav")):
+            clips.append((path.name, path.read_bytes()))
+    return clips
+
+
+def setup_load_user(session):
+    """Create the user the progress reads are issued for"""
+    response = session.post(f"{BASE_URL}/api/users", json={"name": "Load Test"}, timeout=10)
+    response.raise_for_status()
+    return response.json()["user_id"]
+
+
+def request_submit(http, context):
+    name, data = context["next_clip"]()
+    return http.post(
+        f"{BASE_URL}/api/exercise/submit",
+        files={"audio": (name, data, "audio/wav")},
+        data={"exercise_text": random.choice(LOAD_EXERCISE_TEXTS)},
+        # A unique key per request, so repeated corpus clips are processed rather than replayed
+        headers={"Idempotency-Key": str(uuid.uuid4())},
+        timeout=context["timeout"]
+    )
+
+
+def request_history(http, context):
+    return http.get(f"{BASE_URL}/api/sessions/history", timeout=context["timeout"])
+
+
+def request_progress(http, context):
+    return http.get(f"{BASE_URL}/api/progress/{context['user_id']}", timeout=context["timeout"])
+
+
+LOAD_REQUESTS = {
+    "submit": request_submit,
+    "history": request_history,
+    "progress": request_progress,
+}
+
+
+def summarize_load(samples, wall_seconds):
+    """Per-endpoint throughput, latency percentiles and error rate"""
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample["endpoint"]].append(sample)
+    by_endpoint["all"] = samples
+
+    summary = {}
+    for endpoint, endpoint_samples in by_endpoint.items():
+        latencies = sorted(s["latency"] for s in endpoint_samples)
+        errors = [s for s in endpoint_samples if not s["ok"]]
+        statuses = defaultdict(int)
+        for s in endpoint_samples:
+            statuses[str(s["status"])] += 1
+        summary[endpoint] = {
+            "requests": len(endpoint_samples),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(endpoint_samples) if endpoint_samples else 0.0,
+            "throughput_rps": len(endpoint_samples) / wall_seconds if wall_seconds else 0.0,
+            "mean_ms": statistics.mean(latencies) * 1000 if latencies else None,
+            "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+            "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+            "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+            "max_ms": latencies[-1] * 1000 if latencies else None,
+            "statuses": dict(statuses),
+        }
+    return summary
+
+
+def run_load_test(args):
+    """
+    Open-loop load generator: requests are started at a fixed rate whatever
+    the server's response time, so a saturated server shows up as growing
+    latency and queueing rather than as a lower request rate.
+    """
+    weights = parse_mix(args.mix)
+    clips = load_corpus(args.corpus or DEFAULT_CORPUS)
+    if "submit" in weights and not clips:
+        print(f"{RED}No .wav clips found for submissions{RESET}")
+        return 1
+
+    http = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=args.concurrency, pool_maxsize=args.concurrency)
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+
+    try:
+        user_id = setup_load_user(http)
+    except Exception as e:
+        print(f"{RED}Could not create load test user: {e}{RESET}")
+        return 1
+
+    clip_cycle = itertools.cycle(clips)
+    clip_lock = threading.Lock()
+
+    def next_clip():
+        with clip_lock:
+            return next(clip_cycle)
+
+    context = {
+        "user_id": user_id,
+        "next_clip": next_clip,
+        "timeout": args.timeout,
+    }
+    samples = []
+    samples_lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(args.concurrency)
+    dropped = 0
+
+    def fire(endpoint, scheduled):
+        start = time.perf_counter()
+        status, ok, error = None, False, None
+        try:
+            response = LOAD_REQUESTS[endpoint](http, context)
+            status = response.status_code
+            ok = response.status_code < 400
+        except requests.RequestException as e:
+            error = type(e).__name__
+        finally:
+            end = time.perf_counter()
+            in_flight.release()
+        with samples_lock:
+            samples.append({
+                "endpoint": endpoint,
+                "status": status if status is not None else error,
+                "ok": ok,
+                "latency": end - start,
+                "queue_delay": start - scheduled,
+            })
+
+    names = list(weights)
+    endpoint_weights = [weights[name] for name in names]
+    interval = 1.0 / args.rate
+    total = int(args.rate * args.duration)
+
+    print(f"{YELLOW}Load test: {args.rate:g} req/s for {args.duration:g}s, "
+          f"concurrency {args.concurrency}, mix {args.mix}{RESET}\n")
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for i in range(total):
+            scheduled = began + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Never queue more than `concurrency` requests client-side; count the rest as dropped
+            if not in_flight.acquire(blocking=False):
+                dropped += 1
+                continue
+            executor.submit(fire, random.choices(names, endpoint_weights)[0], scheduled)
+    wall_seconds = time.perf_counter() - began
+
+    summary = summarize_load(samples, wall_seconds)
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "base_url": BASE_URL,
+            "target_rate": args.rate,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": weights,
+            "corpus_clips": len(clips),
+            "wall_seconds": wall_seconds,
+            "dropped": dropped,
+        },
+        "summary": summary,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'endpoint':<10} {'reqs':>6} {'rps':>7} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, values in summary.items():
+        color = RED if values["error_rate"] > 0 else GREEN
+        print(f"{endpoint:<10} {values['requests']:>6} {values['throughput_rps']:>7.2f} "
+              f"{color}{values['error_rate'] * 100:>5.1f}%{RESET} "
+              f"{values['p50_ms'] or 0:>9.1f} {values['p95_ms'] or 0:>9.1f} {values['p99_ms'] or 0:>9.1f}")
+    if dropped:
+        print(f"\n{YELLOW}{dropped} requests dropped: all {args.concurrency} client slots were busy{RESET}")
+    print(f"\nReport written to {args.output}\n")
+    return 0
+
+
 def main():
     """Run all tests"""
     print(f"\n{BLUE}{'='*60}{RESET}")
@@ -184,8 +426,25 @@ def main():
         print(f"  2. Port 8000 is accessible")
         print(f"  3. GROQ_API_KEY is set in backend/.env\n")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Verify API endpoints or run a load test")
+    parser.add_argument("--base-url", default=BASE_URL, help="Backend URL")
+    parser.add_argument("--load", action="store_true", help="Run the concurrent load test instead of the checks")
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests started per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max requests in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted traffic mix, e.g. submit=1,history=3,progress=3")
+    parser.add_argument("--corpus", action="append", help="Directory of .wav clips for submissions (repeatable)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", default="load_test_report.json", help="Where to write the JSON report")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    BASE_URL = args.base_url.rstrip("/")
     try:
+        if args.load:
+            raise SystemExit(run_load_test(args))
         main()
     except KeyboardInterrupt:
         print(f"\n{YELLOW}Test interrupted{RESET}\n")